@@ -0,0 +1,74 @@
+"""Measure time to import hapiplot in a new Python process.
+
+Usage:
+    python benchmark/import_time.py [-n 10]
+
+Each statement is run in n new processes and the median wall time of the
+statement is reported along with the heavy modules that it imported. The
+last statement imports everything that "import hapiplot" imported before
+autoplot, gallery, and hapiplot() were imported on first use.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+statements = [
+                ('import hapiplot',
+                    'import hapiplot'),
+                ('from hapiplot import hapiplot',
+                    'from hapiplot import hapiplot'),
+                ('all (= import hapiplot before lazy imports)',
+                    'import hapiplot; hapiplot.hapiplot; hapiplot.hapiplot_batch; '
+                    'hapiplot.autoplot; hapiplot.gallery; '
+                    'import pandas.plotting')
+            ]
+
+modules = ['matplotlib', 'matplotlib.pyplot', 'pandas', 'hapiclient', 'datetick',
+           'hapiplot.hapiplot', 'hapiplot.autoplot', 'hapiplot.gallery']
+
+code = """
+import sys, time, json
+t = time.perf_counter()
+%s
+t = time.perf_counter() - t
+print(json.dumps({'time': t, 'modules': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def run(statement, n):
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    env['MPLBACKEND'] = 'Agg'
+
+    times = []
+    for i in range(n):
+        out = subprocess.check_output([sys.executable, '-c', code % (statement, modules)], env=env)
+        result = json.loads(out.decode().strip().split('\n')[-1])
+        times.append(result['time'])
+
+    times.sort()
+    return {'median': times[len(times)//2], 'min': times[0], 'modules': result['modules']}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=10, help='Number of processes per statement')
+    parser.add_argument('--json', default=None, help='Write results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for label, statement in statements:
+        results[label] = run(statement, args.n)
+        print('%-45s %7.1f ms (min %7.1f ms)  imports: %s' % (label,
+              1000*results[label]['median'], 1000*results[label]['min'],
+              ', '.join(results[label]['modules']) or 'none of the above'))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,134 @@
+"""Measure throughput and latency of hapiplot.server.PlotServer.
+
+Usage:
+    python benchmark/plot_server.py [--workers 4] [--queue 16] [--clients 8]
+                                    [--requests 200] [--intervals 50]
+                                    [--kind scalar] [--delay 0.1]
+                                    [--revalidate] [--json results.json]
+
+A local HAPI server (see hapiplot.testing.HAPIServer) is the stand-in for a
+remote server and a PlotServer is started with an empty image cache. Each
+of `clients` threads makes requests for plots of one of `intervals` one-hour
+intervals of dataset synthetic/<kind>, chosen at random, until `requests`
+requests have been made. With --revalidate, clients send If-None-Match with
+the ETag they last received for an interval, as a browser would.
+
+The number of responses with each status, the throughput, and the median
+and 95th percentile of the latency are reported along with the server's
+counts of rendered, cached, merged, and rejected requests.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+
+from hapiplot.server import PlotServer
+from hapiplot.testing import HAPIServer, START
+
+
+def get(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as res:
+            return res.status, res.headers.get('ETag'), res.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), e.read()
+
+
+def run(args):
+
+    hours = [str(START + np.timedelta64(k, 'h')) + 'Z' for k in range(args.intervals + 1)]
+    cachedir = tempfile.mkdtemp()
+
+    with HAPIServer(n=3600*args.intervals, kinds=[args.kind], delay=args.delay) as hapi:
+        with PlotServer(workers=args.workers, queue=args.queue, cachedir=cachedir,
+                        cache=False, usecache=False) as server:
+
+            base = server.url + '/plot?server=' + hapi.url + '&id=synthetic/' + args.kind \
+                   + '&parameters=' + args.kind
+            lock = threading.Lock()
+            remaining = [args.requests]
+            results = []
+
+            def client(seed):
+                rng = random.Random(seed)
+                etags = {}
+                while True:
+                    with lock:
+                        if remaining[0] == 0:
+                            return
+                        remaining[0] -= 1
+                    k = rng.randrange(args.intervals)
+                    headers = {}
+                    if args.revalidate and k in etags:
+                        headers['If-None-Match'] = etags[k]
+                    t = time.perf_counter()
+                    status, etag, body = get(base + '&time.min=' + hours[k]
+                                             + '&time.max=' + hours[k+1], headers)
+                    dt = time.perf_counter() - t
+                    if status == 200:
+                        etags[k] = etag
+                    with lock:
+                        results.append((status, dt, len(body)))
+
+            t = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(seed,)) for seed in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - t
+
+            stats = dict(server.stats)
+
+    latency = np.array([r[1] for r in results])
+    statuses = {}
+    for r in results:
+        statuses[r[0]] = statuses.get(r[0], 0) + 1
+
+    return {
+            'elapsed': elapsed,
+            'throughput': len(results)/elapsed,
+            'latency_median': float(np.median(latency)),
+            'latency_p95': float(np.percentile(latency, 95)),
+            'statuses': statuses,
+            'server': stats
+           }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4, help='PlotServer render processes')
+    parser.add_argument('--queue', type=int, default=16, help='PlotServer queue size')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Total requests')
+    parser.add_argument('--intervals', type=int, default=50, help='Number of distinct plots')
+    parser.add_argument('--kind', default='scalar', help='Kind of parameter (see hapiplot.testing.KINDS)')
+    parser.add_argument('--delay', type=float, default=0, help='Delay of HAPI server responses in seconds')
+    parser.add_argument('--revalidate', action='store_true', help='Send If-None-Match')
+    parser.add_argument('--json', default=None, help='Write results to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print('%d requests in %.2f s: %.1f requests/s' % (args.requests, result['elapsed'], result['throughput']))
+    print('latency: median %.3f s, 95th percentile %.3f s' % (result['latency_median'], result['latency_p95']))
+    print('status counts: %s' % result['statuses'])
+    print('server counts: %s' % result['server'])
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'result': result}, f, indent=2)
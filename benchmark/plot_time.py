@@ -0,0 +1,216 @@
+"""Measure time and peak memory of plotting synthetic HAPI data.
+
+Usage:
+    python benchmark/plot_time.py [-n 1000 100000] [--kinds scalar spectra]
+                                  [--benchmarks hapiplot png] [-r 3]
+                                  [--workers 4]
+                                  [--delay 0.1] [--bandwidth 1e7]
+                                  [--format csv]
+                                  [--json results.json] [--compare old.json]
+
+Data are generated by hapiplot.testing.generate(), so no HAPI server is
+needed. The benchmarks are
+
+    hapiplot: hapiplot(data, meta, returnimage=True, useimagecache=False)
+              for each kind of parameter in hapiplot.testing.KINDS
+    timeseries: timeseries() of the scalar parameter
+    heatmap: heatmap() of the spectra parameter
+    png: savefig() of the figure returned by timeseries() or heatmap()
+    workers: hapiplot(data, meta, returnimage=True, useimagecache=False)
+             of one dataset with all of the kinds of parameters using
+             workers=1 and --workers process and thread workers
+    server: hapiplot(server, dataset, parameters, start, stop) for each
+            kind of parameter using a local HAPI server (see
+            hapiplot.testing.HAPIServer), which includes the time to
+            request and parse the data. Use --delay and --bandwidth to
+            simulate a remote server and --format to select the format.
+
+For each benchmark and number of records n, the median wall time of r runs
+is reported. Peak memory is measured in an additional run using
+tracemalloc, which counts memory allocated by Python and NumPy but not
+memory allocated by Matplotlib's C++ code (e.g., the Agg buffer).
+
+Use --json to save the results, which include the git commit, and
+--compare to show the ratio of times and memory to those in a file saved
+for another commit.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+from hapiplot import hapiplot
+from hapiplot.testing import generate, KINDS, HAPIServer
+from hapiplot.times import hapitime2datetime64
+from hapiplot.plot.timeseries import timeseries
+from hapiplot.plot.heatmap import heatmap
+
+benchmarks = ['hapiplot', 'timeseries', 'heatmap', 'png', 'workers', 'server']
+
+
+def cases(benchmark, n, kinds, server=None, format='binary', workers=4):
+    """Return list of (label, setup) where setup() returns the function to time."""
+
+    def plot(kind):
+        def setup():
+            data, meta = generate(kind, n)
+            return lambda: hapiplot(data, meta, returnimage=True, useimagecache=False)
+        return setup
+
+    def ts():
+        data, meta = generate('scalar', n)
+        t = hapitime2datetime64(data['Time'])
+        return lambda: timeseries(t, data['scalar'], returnimage=True)
+
+    def hm():
+        data, meta = generate('spectra', n)
+        t = hapitime2datetime64(data['Time'])
+        bins = np.array(meta['parameters'][1]['bins'][0]['centers'])
+        return lambda: heatmap(t, bins, data['spectra'].T, returnimage=True)[0]
+
+    def png(setup):
+        def setuppng():
+            fig = setup()()
+            def savefig():
+                buf = io.BytesIO()
+                fig.savefig(buf, format='png')
+            return savefig
+        return setuppng
+
+    def pool(workers, workertype):
+        def setup():
+            data, meta = generate(','.join(kinds), n)
+            return lambda: hapiplot(data, meta, returnimage=True, useimagecache=False,
+                                    workers=workers, workertype=workertype)
+        return setup
+
+    def fetch(kind):
+        def setup():
+            data, meta = server.dataset(kind)
+            start, stop = meta['startDate'], meta['stopDate']
+            return lambda: hapiplot(server.url, 'synthetic/' + kind, kind, start, stop,
+                                    returnimage=True, useimagecache=False,
+                                    cache=False, usecache=False, format=format)
+        return setup
+
+    if benchmark == 'hapiplot':
+        return [('hapiplot/' + kind, plot(kind)) for kind in kinds]
+    if benchmark == 'timeseries':
+        return [('timeseries', ts)]
+    if benchmark == 'heatmap':
+        return [('heatmap', hm)]
+    if benchmark == 'png':
+        return [('png/timeseries', png(ts)), ('png/heatmap', png(hm))]
+    if benchmark == 'workers':
+        return [('workers/1', pool(1, 'process')),
+                ('workers/%d/process' % workers, pool(workers, 'process')),
+                ('workers/%d/thread' % workers, pool(workers, 'thread'))]
+    if benchmark == 'server':
+        return [('server/' + kind, fetch(kind)) for kind in kinds]
+    raise ValueError('benchmark must be one of ' + str(benchmarks))
+
+
+def measure(setup, repeat):
+    """Return (median time, times, peak memory in bytes) of function from setup()."""
+
+    func = setup()
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return sorted(times)[len(times)//2], times, peak
+
+
+def environment():
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+
+    return {
+                'commit': commit,
+                'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'matplotlib': matplotlib.__version__,
+                'machine': platform.machine(),
+                'system': platform.system()
+            }
+
+
+def compare(results, old):
+
+    print('\nRatio to results for commit %s (< 1 is faster or smaller)'
+          % old['environment']['commit'])
+    old = {(r['label'], r['n']): r for r in old['results']}
+    for r in results:
+        o = old.get((r['label'], r['n']), None)
+        if o is None:
+            continue
+        print('%-25s n=%-9d time %5.2f  memory %5.2f' % (r['label'], r['n'],
+              r['time']/o['time'], r['peak_memory']/max(o['peak_memory'], 1)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=float, nargs='+', default=[1e3, 1e4, 1e5, 1e6],
+                        help='Numbers of records (up to 1e7)')
+    parser.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS,
+                        help='Kinds of parameters for hapiplot benchmark')
+    parser.add_argument('--benchmarks', nargs='+', default=benchmarks, choices=benchmarks)
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per case')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of workers for workers benchmark')
+    parser.add_argument('--delay', type=float, default=0,
+                        help='Delay of local HAPI server responses in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='Bandwidth of local HAPI server in bytes/s')
+    parser.add_argument('--format', default='binary', choices=['binary', 'csv'],
+                        help='Format of local HAPI server data responses')
+    parser.add_argument('--json', default=None, help='Write results to this file')
+    parser.add_argument('--compare', default=None, help='Compare with results in this file')
+    args = parser.parse_args()
+
+    results = []
+    for n in [int(n) for n in args.n]:
+        with HAPIServer(n=n, kinds=args.kinds, delay=args.delay, bandwidth=args.bandwidth) as server:
+            for benchmark in args.benchmarks:
+                for label, setup in cases(benchmark, n, args.kinds, server, args.format,
+                                           args.workers):
+                    median, times, peak = measure(setup, args.repeat)
+                    results.append({'label': label, 'n': n, 'time': median,
+                                    'times': times, 'peak_memory': peak})
+                    print('%-25s n=%-9d %9.3f s %9.1f MB' % (label, n, median, peak/1e6))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({'environment': environment(), 'options': vars(args), 'results': results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -1,11 +1,49 @@
-# Allow "from hapiplot import hapiplot"
-from hapiplot.hapiplot import hapiplot
+import sys
+import types
 
+# The functions below are imported when first used so that "import hapiplot"
+# does not import Matplotlib, hapiclient (which imports pandas), Autoplot
+# code, or gallery code.
+#
+# Allow "from hapiplot import hapiplot"
+# Allow "from hapiplot import hapiplot_batch"
 # Allow "from hapiplot import autoplot"
-from hapiplot.autoplot.autoplot import autoplot
-
 # Allow "from hapiplot import gallery"
-from hapiplot.gallery.gallery import gallery
+# Allow "from hapiplot import pregenerate"
+_lazy = {
+            'hapiplot': 'hapiplot.hapiplot',
+            'hapiplot_batch': 'hapiplot.batch',
+            'autoplot': 'hapiplot.autoplot.autoplot',
+            'gallery': 'hapiplot.gallery.gallery',
+            'pregenerate': 'hapiplot.gallery.gallery'
+        }
+
+
+class _Package(types.ModuleType):
+    # A module class is used instead of a module-level __getattr__ so that
+    # Python < 3.7 is supported.
+
+    def __getattr__(self, name):
+        if name in _lazy:
+            import importlib
+            value = getattr(importlib.import_module(_lazy[name]), name)
+            types.ModuleType.__setattr__(self, name, value)
+            return value
+        raise AttributeError("module 'hapiplot' has no attribute '%s'" % name)
+
+    def __setattr__(self, name, value):
+        # Importing hapiplot.hapiplot, hapiplot.autoplot, or hapiplot.gallery
+        # sets the attribute of the same name to the (sub)module. Keep the
+        # function instead.
+        if name in _lazy and isinstance(value, types.ModuleType):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+    def __dir__(self):
+        return sorted(set(types.ModuleType.__dir__(self)) | set(_lazy))
+
+
+sys.modules[__name__].__class__ = _Package
 
 # This is needed because setopts reads all rcParams and adds passed rcParams.
 # The default rcParams include those that are depricated and so a warning is
@@ -16,4 +54,4 @@ import warnings
 #ignores = ['datapath','savefig.frameon', 'text.latex.unicode', 'verbose.fileo', 'verbose.level', 'datapath']
 warnings.filterwarnings(action='ignore', category=UserWarning)
 
-__version__ = '0.2.3b2'
\ No newline at end of file
+__version__ = '0.2.3b2'
@@ -1,20 +1,39 @@
+import os
+import re
+import json
+import time
+import contextlib
+import threading
+
+# Sessions keyed on (port, version, cachedir). Used by autoplot() so that
+# repeated calls reuse the connection and cached checks.
+_sessions = {}
+_sessionslock = threading.Lock()
+
+
 def autoplot(server, dataset, parameters, start, stop, **kwargs):
     """Plot data from a HAPI server using Autoplot.
-    
-    If not found, autoplot.jar is downloaded an launched. If found, 
+
+    If not found, autoplot.jar is downloaded an launched. If found,
     autoplot.jar is updated if server version is newer than cached version.
-    
+
+    The Autoplot server, Java version, and whether autoplot.jar is up to
+    date are checked using an `AutoplotSession` that is kept for the port,
+    version, and cachedir. When Autoplot is running, a call makes one
+    request to it. Use `session()` to get the session and plot several
+    requests over one connection with `AutoplotSession.ploturis()`.
+
     Example
     -------
     >>> from hapiclient import autoplot
     >>> server = 'http://hapi-server.org/servers/TestData2.0/hapi'
     >>> autoplot(server, 'dataset1', 'scalar,vector', '1970-01-01', '1970-01-02')
-    
+
     Autoplot application launches or its canvas is updated.
-    
+
     The options are the same as that for `hapiplot` with the addition of
     the kwargs
-    
+
     stack : bool [False] Create a stack plot of parameters.
 
     port : int [8079]
@@ -22,20 +41,33 @@ def autoplot(server, dataset, parameters, start, stop, **kwargs):
 
     version : string ['devel']
         The version of Autoplot to use. Can be a version string, e.g.,
-        'v2018a_11', 'devel', 'latest', or 'nightly'. See 
+        'v2018a_11', 'devel', 'latest', or 'nightly'. See
         <http://autoplot.org/developer#Development_Versions> for a
         description of the difference between versions.
 
+    ttl : float [86400]
+        Seconds for which the Java version and the check of whether
+        autoplot.jar is up to date are reused. The results are saved in
+        cachedir, so they are also reused by other Python processes.
+
+    timeout : float [60]
+        Seconds to wait for a response from Autoplot and for Autoplot to
+        start after it is launched.
+
     """
-    
-    import os
-    import re
-    import platform
-    import subprocess
-    
-    from hapiclient.util import setopts, log, urlopen, urlretrieve, urlquote
+
+    session(**kwargs).plot(server, dataset, parameters, start, stop)
+
+
+def session(**kwargs):
+    """Return the AutoplotSession for the options of `autoplot()`.
+
+    The same session is returned for the same port, version, and cachedir.
+    """
+
+    from hapiclient.util import setopts
     from hapiclient.hapi import cachedir
-        
+
     opts = {
                 'logging': False,
                 'cache': True,
@@ -43,98 +75,331 @@ def autoplot(server, dataset, parameters, start, stop, **kwargs):
                 'usecache': False,
                 'newwindow': False,
                 'version': 'devel',
-                'port': 8079
+                'port': 8079,
+                'ttl': 86400,
+                'timeout': 60
             }
 
     # Override defaults
     opts = setopts(opts, kwargs)
 
-    autoplotserver = "http://localhost:" + str(opts['port']) + "/"
+    key = (opts['port'], opts['version'], opts['cachedir'])
+    with _sessionslock:
+        if key not in _sessions:
+            _sessions[key] = AutoplotSession(port=opts['port'], version=opts['version'],
+                                             cachedir=opts['cachedir'])
+        s = _sessions[key]
+    s.logging = opts['logging']
+    s.ttl = opts['ttl']
+    s.timeout = opts['timeout']
+    return s
 
-    url = server + "?id=" + dataset + "&parameters=" + parameters
-    url = url + "&timerange=" + start + "/" + stop
 
-    serverrunning = False
-    try:
-        # See if server needs to be started.
-        if opts['logging']: log('Trying test. Requesting ' + autoplotserver, opts)
-        f = urlopen(autoplotserver)
-        res = f.read().decode('utf-8')
-        if res.startswith('OK'):
-            log('Server running.', opts)
-            serverrunning = True
+class AutoplotSession:
+    """Connection to an Autoplot server started with server.jy.
+
+    s = AutoplotSession(port=8079, version='devel', cachedir=None,
+                        logging=False, ttl=86400, timeout=60)
+    s.plot(server, dataset, parameters, start, stop)
+    s.ploturis([uri1, uri2, ...])
+
+    The HTTP connection to Autoplot is kept open when Autoplot allows it and
+    Autoplot is assumed to be running until a request fails or Autoplot
+    does not respond with OK. Only then is Autoplot launched, which
+    requires Java and autoplot.jar. The Java
+    version and the result of checking whether autoplot.jar needs to be
+    downloaded are saved in cachedir/jar/autoplot.json and are reused for
+    ttl seconds. After a launch, requests wait up to timeout seconds for
+    the server to start.
+    """
+
+    def __init__(self, port=8079, version='devel', cachedir=None, logging=False,
+                 ttl=86400, timeout=60):
+
+        if cachedir is None:
+            from hapiclient.hapi import cachedir as _cachedir
+            cachedir = _cachedir()
+
+        self.port = port
+        self.version = version
+        self.cachedir = cachedir
+        self.logging = logging
+        self.ttl = ttl
+        self.timeout = timeout
+        self.requests = 0
+
+        self._conn = None
+        self._launched = None
+        self._lock = threading.Lock()
+
+    def _log(self, msg):
+        if self.logging:
+            from hapiclient.util import log
+            log(msg)
+
+    @staticmethod
+    def uri(server, dataset, parameters, start, stop):
+        """Return Autoplot URI for a HAPI request."""
+        url = server + "?id=" + dataset + "&parameters=" + parameters
+        url = url + "&timerange=" + start + "/" + stop
+        return "vap+hapi:" + url
+
+    def plot(self, server, dataset, parameters, start, stop):
+        """Plot a HAPI request. Returns True if Autoplot plotted it or was launched."""
+        return self.ploturis([self.uri(server, dataset, parameters, start, stop)])[0]
+
+    def ploturis(self, uris):
+        """Plot each Autoplot URI in uris in turn.
+
+        Autoplot (server.jy) plots one URI per request, so one request is
+        made for each URI. The requests use the same connection.
+
+        Returns list of True or False for each URI. If Autoplot is not
+        running or does not respond with OK, it is launched with the URI and
+        the remaining URIs are sent when it has started. Autoplot is
+        launched at most once per call.
+        """
+
+        from urllib.parse import quote
+
+        results = []
+        relaunched = False
+        with self._lock:
+            for uri in uris:
+                self._log('Requesting plot of ' + uri)
+                path = "/?uri=" + quote(uri, safe='')
+                if self._launched is not None and self._launched > time.time() - self.timeout:
+                    # Launched but may not have started yet.
+                    self._wait()
+                ok = self._request(path)
+                if not ok and not relaunched and (self._launched is None
+                        or time.time() - self._launched >= self.timeout):
+                    if ok is False:
+                        self._log('Request unsuccessful. Launching Autoplot.')
+                    ok = self.launch(uri)
+                    relaunched = True
+                results.append(bool(ok))
+
+        return results
+
+    def _request(self, path):
+        """Send request to Autoplot server.
+
+        Returns True if the response starts with 'OK', False if it does not,
+        and None if the server is not running.
+        """
+
+        import http.client
+
+        for attempt in range(2):
+            fresh = self._conn is None
+            if fresh:
+                self._conn = http.client.HTTPConnection('localhost', self.port, timeout=self.timeout)
+            try:
+                self.requests += 1
+                self._conn.request('GET', path)
+                res = self._conn.getresponse()
+                body = res.read().decode('utf-8', 'replace')
+                if res.will_close:
+                    self._conn.close()
+                    self._conn = None
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if fresh:
+                    self._log('Autoplot server not running.')
+                    return None
+                # Kept connection was closed by server. Try a new one.
+                continue
+
+            self._launched = None
+            if not body.startswith('OK'):
+                self._log('Autoplot server responded with: ' + body.strip())
+                return False
+            return True
+
+        return None
+
+    def _wait(self):
+        """Wait until launched server responds or launch timeout."""
+        while self._launched is not None and time.time() - self._launched < self.timeout:
+            if self._request('/') is not None:
+                return
+            time.sleep(0.5)
+
+    def jarurl(self):
+        """Return URL of autoplot.jar for self.version."""
+
+        if self.version == 'nightly':
+            return 'https://ci-pw.physics.uiowa.edu/job/autoplot-release/lastSuccessfulBuild/artifact/autoplot/Autoplot/dist/autoplot.jar'
+        if self.version == 'devel':
+            return 'http://autoplot.org/jnlp/devel/autoplot.jar'
+        if self.version.startswith('v'):
+            return 'http://autoplot.org/jnlp/' + self.version + '/autoplot.jar'
+        return 'http://autoplot.org/jnlp/latest/autoplot.jar'
+
+    def jarpath(self):
+        version = self.version
+        if version not in ('nightly', 'devel') and not version.startswith('v'):
+            version = 'latest'
+        return os.path.join(self.cachedir, 'jar', 'autoplot-' + version + '.jar')
+
+    def javaversion(self):
+        """Return Java version or None if Java not found. Cached for ttl seconds."""
+        return _cached(self.cachedir, 'java', self.ttl, _javaversion)
+
+    def updatejar(self):
+        """Download autoplot.jar if it is not found or is out of date.
+
+        The server is checked for a newer version at most once per ttl
+        seconds. If the server can't be reached, an existing jar is used
+        (see _updatejar()).
+        """
+
+        jarurl = self.jarurl()
+        jarpath = self.jarpath()
+        if not os.path.exists(jarpath):
+            _cached(self.cachedir, jarurl, 0, lambda: _updatejar(jarurl, jarpath))
         else:
-            log('Server responding but with wrong response to test.', opts)
-        f.close()
-    except:
-        log('Server not running. Will start server.', opts)
-        
-    print(url)
-    if serverrunning:
-        # Send request to update GUI.
+            _cached(self.cachedir, jarurl, self.ttl, lambda: _updatejar(jarurl, jarpath))
+        return jarpath
+
+    def launch(self, uri):
+        """Launch Autoplot and plot uri. Returns False if Java not found."""
+
+        import platform
+        from urllib.parse import quote
+
+        version = self.javaversion()
+        if version is None:
+            # TODO: Automatically download and extract from https://jdk.java.net/14/?
+            self._log("Java is required. See https://www.java.com/en/download/ or https://jdk.java.net/14/")
+            return False
+        self._log("Java version: " + version)
+
+        self._log('Checking if autoplot.jar needs to be downloaded or updated.')
+        jarpath = self.updatejar()
+
+        jydir = os.path.dirname(os.path.realpath(__file__))
+        jaricon = os.path.join(jydir, 'autoplot.png')
+
+        com = "java"
+
+        if 'darwin' in platform.platform().lower():
+            com = com + " -Xdock:icon=" + jaricon
+            com = com + ' -Xdock:name="Autoplot"'
+        com = com + " -DPORT=" + str(self.port)
+        com = com + " -DHAPI_DATA=" + self.cachedir
+        com = com + " -DhapiServerCache=true"
+        com = com + " -jar " + jarpath
+        com = com + " --noAskParams"
+        com = com + " '" + os.path.join(jydir, 'server.jy?uri=')
+        com = com + quote(uri, safe='') + "'"
+        com = com + " &"
+        self._log("Executing " + com)
+        os.system(com)
+        # TODO: Show console output?
+
+        self._launched = time.time()
+        return True
+
+
+def _javaversion():
+    import subprocess
+    try:
+        result = subprocess.check_output('java -version', shell=True, stderr=subprocess.STDOUT)
+    except Exception:
+        return None
+    return re.sub(r'.*"(.*)".*', r'\1', result.decode().split('\n')[0])
+
+
+def _updatejar(jarurl, jarpath):
+    """Download jarurl to jarpath if jarpath does not exist or is older.
+
+    Returns the Last-Modified header of jarurl. If jarurl can't be reached
+    and jarpath exists, jarpath is used with a warning and None is returned
+    so that the check is not cached.
+    """
+
+    import urllib.request
+    from email.utils import parsedate_to_datetime
+
+    request = urllib.request.Request(jarurl, method='HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as res:
+            modified = res.headers.get('Last-Modified', None)
+    except OSError as e:
+        # urllib.error.URLError and timeouts are OSErrors.
+        if not os.path.exists(jarpath):
+            raise
+        from hapiclient.util import warning
+        warning('Could not check for a newer version of %s (%s). Using %s.' % (jarurl, e, jarpath))
+        return None
+
+    download = not os.path.exists(jarpath)
+    if not download and modified is not None:
+        download = parsedate_to_datetime(modified).timestamp() > os.path.getmtime(jarpath)
+
+    if download:
+        os.makedirs(os.path.dirname(jarpath), exist_ok=True)
+        import shutil
+        with urllib.request.urlopen(jarurl) as res, _tempfile(jarpath) as tmp:
+            shutil.copyfileobj(res, tmp)
+        os.replace(tmp.name, jarpath)
+
+    # '' so that the check is cached if there is no Last-Modified header.
+    return modified or ''
+
+
+def _cached(cachedir, key, ttl, func):
+    """Return func() or its value saved less than ttl seconds ago.
+
+    Values are saved in cachedir/jar/autoplot.json. None is not saved.
+    """
+
+    fname = os.path.join(cachedir, 'jar', 'autoplot.json')
+
+    state = {}
+    if os.path.exists(fname):
         try:
-            # This won't detect if the version requested matches
-            # the version running.
-            rurl = autoplotserver + "?uri=" + urlquote("vap+hapi:"+ url)
-            if opts['logging']: print("autoplot(): Requesting " + rurl)
-            log('Autoplot GUI should be updating.', opts)
-            f = urlopen(rurl)
-            res = f.read().decode('utf-8')
-            if res.startswith('OK'):
-                log('Request successful. Autoplot GUI updated.', opts)
-                f.close()
-                return
-            else:
-                f.close()
-                log('Request unsuccessful.', opts)
-                serverrunning = False
-        except Exception as e:
-            print(e)
-
-    # Request was sent, so return.
-    if serverrunning == True: return
-
-    if opts['version'] == 'nightly':
-        jarurl = 'https://ci-pw.physics.uiowa.edu/job/autoplot-release/lastSuccessfulBuild/artifact/autoplot/Autoplot/dist/autoplot.jar'
-    elif opts['version'] == 'devel':
-        jarurl = 'http://autoplot.org/jnlp/devel/autoplot.jar'
-    elif opts['version'].startswith('v'):
-        jarurl = 'http://autoplot.org/jnlp/'+opts['version']+'/autoplot.jar'
-    else:
-        opts['version'] = 'latest'
-        jarurl = 'http://autoplot.org/jnlp/latest/autoplot.jar'
+            with open(fname) as f:
+                state = json.load(f)
+        except ValueError:
+            state = {}
+
+    if key in state and time.time() - state[key]['time'] < ttl:
+        return state[key]['value']
+
+    value = func()
+    if value is None:
+        return value
+
+    state[key] = {'time': time.time(), 'value': value}
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with _tempfile(fname, mode='w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f.name, fname)
+
+    return value
+
+
+@contextlib.contextmanager
+def _tempfile(fname, mode='wb'):
+    """Open a temporary file in the directory of fname.
+
+    The file has a unique name, so processes that share cachedir do not
+    write to the same file. Rename it to fname with os.replace(). The file
+    is removed if an exception is raised.
+    """
+
+    import tempfile
 
+    f = tempfile.NamedTemporaryFile(mode=mode, dir=os.path.dirname(fname),
+                                    prefix=os.path.basename(fname) + '.',
+                                    suffix='.tmp', delete=False)
     try:
-       result = subprocess.check_output('java -version', shell=True, stderr=subprocess.STDOUT)
-       version = re.sub(r'.*"(.*)".*',r'\1', result.decode().split('\n')[0])
-       log("Java version: " + version, opts)
-    except:
-        # TODO: Automatically download and extract from https://jdk.java.net/14/?
-        log("Java is required. See https://www.java.com/en/download/ or https://jdk.java.net/14/", opts)
-        return
-
-    jydir = os.path.dirname(os.path.realpath(__file__))
-    jarpath = os.path.join(opts['cachedir'], 'jar/autoplot-' + opts['version'] + '.jar')
-    jaricon = os.path.join(jydir, 'autoplot.png')
-
-    # Download jar file if needed.
-    log('Checking if autoplot.jar needs to be downloaded or updated.', opts)
-    urlretrieve(jarurl, jarpath, check_last_modified=True, **opts)
-    #download(jarpath, jarurl, **opts)
-
-    com = "java"
-    
-    if 'darwin' in platform.platform().lower():
-        com = com + " -Xdock:icon=" + jaricon
-        com = com + ' -Xdock:name="Autoplot"'
-    com = com + " -DPORT=" + str(opts['port'])
-    com = com + " -DHAPI_DATA=" + opts['cachedir']
-    com = com + " -DhapiServerCache=true"
-    com = com + " -jar " + jarpath
-    com = com + " --noAskParams"
-    com = com + " '" + os.path.join(jydir, 'server.jy?uri=')
-    com = com + urlquote("vap+hapi:"+ url) + "'"
-    com = com + " &"
-    if opts['logging']: log("Executing " + com, opts)
-    os.system(com)
-    # TODO: Show console output?
+        with f:
+            yield f
+    except BaseException:
+        os.remove(f.name)
+        raise
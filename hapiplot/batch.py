@@ -0,0 +1,133 @@
+import numpy as np
+
+from hapiplot.plot.util import log, warning
+
+from hapiplot.hapiplot import hapiplot, hapiplotopts, _cachedimages
+from hapiplot.times import hapitime2datetime64
+
+
+def hapiplot_batch(server, dataset, parameter, intervals, mergeintervals=1, **kwargs):
+    """Plot parameters for many time intervals and reuse figures.
+
+    metas = hapiplot_batch(server, dataset, parameter, intervals, **kwargs)
+
+    is equivalent to
+
+        metas = []
+        for start, stop in intervals:
+            data, meta = hapiplot(server, dataset, parameter, start, stop,
+                                  returnimage=True, **kwargs)
+            metas.append(meta)
+
+    and returns the same images. Instead of creating a new figure for each
+    interval, the figure created for the first interval is updated with new
+    data when the only differences are the data values and time range (the
+    labels, legend, line style, and whether there are NaNs or gaps are the
+    same). Otherwise, a new figure is created and used for the following
+    intervals.
+
+    Parameters
+    ----------
+    server, dataset : str
+        See `hapiplot()`
+    parameter : str
+        A parameter or comma-separated list of parameters in `dataset`
+    intervals : list
+        List of [start, stop] time pairs
+    mergeintervals : int
+        Maximum number of contiguous intervals (stop of one equals start of
+        the next) to request with one `hapi()` call. The response is split
+        into intervals before plotting. Use, e.g., 31 for daily plots to
+        make one request per month instead of one per day.
+    kwargs
+        `hapiplot()` and `hapi()` options. returnimage is always True and
+        workers is always 1.
+
+    Returns
+    -------
+    List of `meta`, one per interval, as returned by `hapiplot()`. The data
+    are not returned. The value of meta['parameters'][i]['hapiplot']['figure']
+    is the same figure for intervals that reused it and shows the last
+    interval plotted with it.
+
+    Example
+    -------
+        >>> from hapiplot import hapiplot_batch
+        >>> server  = 'http://hapi-server.org/servers/TestData2.0/hapi'
+        >>> days = ['1970-01-%02dT00:00:00Z' % d for d in range(1, 11)]
+        >>> intervals = list(zip(days[:-1], days[1:]))
+        >>> metas = hapiplot_batch(server, 'dataset1', 'scalar', intervals)
+        >>> metas[0]['parameters'][1]['hapiplot']['image'] # PNG of first day
+    """
+
+    from hapiclient.hapi import hapiopts
+    from hapiclient.hapi import hapi
+
+    kwargs = kwargs.copy()
+    if kwargs.get('returnimage', True) is not True:
+        warning('hapiplot_batch() requires returnimage=True. Using returnimage=True.')
+    kwargs['returnimage'] = True
+    if kwargs.get('workers', 1) != 1:
+        warning('hapiplot_batch() does not use workers. Using workers=1.')
+    kwargs['workers'] = 1
+
+    # Extract hapi() options from kwargs
+    kwargs_allowed = hapiopts()
+    kwargs_reduced = {}
+    for key, value in kwargs.items():
+        if key in kwargs_allowed:
+            kwargs_reduced[key] = value
+    # Remove options that are only hapi() options (see hapiplot()).
+    opts = hapiplotopts()
+    kwargs_plot = {k: v for k, v in kwargs.items() if k in opts or k not in kwargs_allowed}
+
+    # Last figure created for each parameter
+    figures = {}
+
+    metas = []
+    for group in _groups(intervals, mergeintervals):
+        cached = []
+        for start, stop in group:
+            cached.append(_cachedimages(server, dataset, parameter, start, stop, kwargs))
+            if cached[-1] is not None:
+                log('All images for %s/%s found in image cache' % (start, stop))
+
+        if all(meta is not None for meta in cached):
+            metas.extend(cached)
+            continue
+
+        data, meta = hapi(server, dataset, parameter, group[0][0], group[-1][1], **kwargs_reduced)
+
+        if len(group) > 1:
+            timename = meta['parameters'][0]['name']
+            Time = hapitime2datetime64(data[timename])
+
+        for k, (start, stop) in enumerate(group):
+            if cached[k] is not None:
+                metas.append(cached[k])
+                continue
+            datak, metak = data, meta
+            if len(group) > 1:
+                # Records with start <= Time < stop
+                tr = hapitime2datetime64(np.array([start, stop]))
+                i0, i1 = np.searchsorted(Time, tr)
+                datak = data[i0:i1]
+                metak = meta.copy()
+                metak['parameters'] = [p.copy() for p in meta['parameters']]
+                metak['x_time.min'] = start
+                metak['x_time.max'] = stop
+            metas.append(hapiplot(datak, metak, _figures=figures, **kwargs_plot))
+
+    return metas
+
+
+def _groups(intervals, n):
+    """Split intervals into lists of up to n contiguous intervals."""
+
+    groups = []
+    for start, stop in intervals:
+        if len(groups) > 0 and len(groups[-1]) < n and groups[-1][-1][1] == start:
+            groups[-1].append((start, stop))
+        else:
+            groups.append([(start, stop)])
+    return groups
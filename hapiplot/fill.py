@@ -0,0 +1,206 @@
+"""Fill values of HAPI parameters.
+
+Fill values are found with one comparison of the data and the fill value.
+The comparison is done on the values returned by the HAPI client, which
+are numbers for double and integer parameters and strings for string
+parameters. Times of isotime parameters are compared after they are parsed
+to numpy.datetime64 (see hapiplot.times), so that fills written in a
+different but equivalent ISO 8601 form are found and times are not
+compared as arrays of datetime objects.
+
+For plotting, fills of double and integer parameters are replaced with NaN
+so that lines have gaps and heatmap tiles are empty. Integers are converted
+to float32 if this is lossless. Fills of isotime parameters are replaced
+with NaT and those of string parameters are masked, which also shows them
+as gaps in lines.
+"""
+
+import numpy as np
+
+from hapiplot.times import hapitime2datetime64, DTYPE
+from hapiplot.plot.util import warning
+
+
+def fillvalue(y, fill, name=None):
+    """Return fill as a value that can be compared with y.
+
+    Returns None if no values of y can be fills, which is the case if fill
+    is "nan" or is not valid for y. A warning is given if fill is not valid.
+    """
+
+    if y.dtype.kind in 'SU':
+        if y.dtype.kind == 'S' and isinstance(fill, str):
+            return fill.encode('utf-8')
+        return fill
+
+    if fill.lower() == 'null':
+        msg = (
+            f'fill value string of "null" in metadata for parameter {name} '
+            f'with float dtype {y.dtype} is not valid. '
+            f'No fill values replaced with NaN.'
+        )
+        warning(msg)
+        return None
+
+    try:
+        yfill = np.float64(fill)
+    except Exception:
+        msg = (
+            f'Invalid fill value of "{fill}" in metadata for parameter {name} '
+            f'with float dtype {y.dtype}: float("{fill}") raised an exception.'
+        )
+        warning(msg)
+        return None
+
+    if np.isnan(yfill):
+        # NaNs are already plotted as fills.
+        return None
+
+    if y.dtype.kind in 'iu':
+        if not yfill.is_integer():
+            msg = (
+                f'Fill value of "{fill}" in metadata for parameter {name} '
+                f'with integer dtype {y.dtype} is not an integer. '
+                f'No fill values replaced.'
+            )
+            warning(msg)
+            return None
+        return int(yfill)
+
+    return yfill
+
+
+def fillmask(y, fill, name=None):
+    """Return a boolean array that is True where y is fill.
+
+    y may have any numeric or string dtype. If no values are fills,
+    np.ma.nomask is returned.
+
+    For floats, if no values equal fill and values equal np.float32(fill),
+    as happens when float32 data were written as doubles, the latter are
+    used with a warning.
+    """
+
+    if fill is None:
+        return np.ma.nomask
+
+    yfill = fillvalue(y, fill, name)
+    if yfill is None:
+        return np.ma.nomask
+
+    mask = y == yfill
+    if not mask.any():
+        if y.dtype.kind != 'f' or yfill == np.float32(yfill):
+            return np.ma.nomask
+        mask = y == np.float32(yfill)
+        if not mask.any():
+            return np.ma.nomask
+        yfill = np.float32(yfill)
+        msg = (
+            f'Fill value of "{fill}" in metadata and values of '
+            f'np.float32("{fill}") = {np.float32(fill)} in data array for '
+            f'parameter "{name}" suggests fill value should have been {np.float32(yfill)}. '
+            f'Using {np.float32(yfill)} as fill value for plotting instead of {fill}.'
+        )
+        warning(msg)
+
+    return mask
+
+
+def fill2nan(y, fill, name=None):
+    """Replace fill values in float array y with NaN in place and return y."""
+
+    # Check that dtype is double.
+    if y.dtype.kind != 'f':
+        msg = (
+            f'fill2nan() called for parameter {name} with non-float dtype '
+            f'{y.dtype}. No fill values replaced with NaN.'
+        )
+        warning(msg)
+        return y
+
+    # Replace fills with NaN for plotting (so gaps shown in lines for time
+    # series an empty tiles for spectra).
+    mask = fillmask(y, fill, name)
+    if mask is not np.ma.nomask:
+        y[mask] = np.nan
+
+    return y
+
+
+def int2float(y, mask=np.ma.nomask):
+    """Return integers y as floats with NaN where mask is True.
+
+    The float type is float32 if all values that are not masked are exactly
+    representable as float32 and float64 otherwise.
+    """
+
+    dtype = np.float64
+    if y.dtype.itemsize <= 2:
+        dtype = np.float32
+    elif y.size > 0:
+        where = True if mask is np.ma.nomask else ~mask
+        lo = np.min(y, where=where, initial=0)
+        hi = np.max(y, where=where, initial=0)
+        if -2**24 <= lo and hi <= 2**24:
+            dtype = np.float32
+
+    yf = y.astype(dtype)
+    if mask is not np.ma.nomask:
+        yf[mask] = np.nan
+
+    return yf
+
+
+def fill2float(y, fill, name=None):
+    """Return double or integer y with fill values replaced with NaN.
+
+    Floats are changed in place (see fill2nan()). Integers are converted
+    (see int2float()).
+    """
+
+    if y.dtype.kind in 'iu':
+        return int2float(y, fillmask(y, fill, name))
+    return fill2nan(y, fill, name)
+
+
+def fill2mask(y, fill, name=None):
+    """Return y as a masked array with fill values masked.
+
+    The data of y are not copied. The mask is np.ma.nomask if y has no
+    fills.
+    """
+
+    return np.ma.masked_array(y, mask=fillmask(y, fill, name), copy=False)
+
+
+def fill2nat(y, fill, name=None):
+    """Return HAPI times y as numpy.datetime64 with NaT where y is fill.
+
+    Fills are found by comparing the parsed times with the parsed fill, so
+    a fill in another form (e.g., precision, trailing Z, or day-of-year) is
+    found. If fill is not a valid time, fills are found by comparing strings
+    (see fillmask()) and are replaced with a valid time before parsing.
+    """
+
+    tfill = None
+    if fill is not None:
+        try:
+            tfill = hapitime2datetime64(np.array([fill]))[0]
+        except Exception:
+            pass
+
+    if tfill is None:
+        mask = fillmask(y, fill, name)
+        if mask is not np.ma.nomask:
+            if mask.all():
+                return np.full(y.shape, np.datetime64('NaT'), dtype=DTYPE)
+            y = np.where(mask, y[~mask].flat[0], y)
+        t = hapitime2datetime64(y)
+    else:
+        t = hapitime2datetime64(y)
+        mask = t == tfill
+
+    if mask is not np.ma.nomask:
+        t[mask] = np.datetime64('NaT')
+    return t
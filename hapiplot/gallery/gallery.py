@@ -1,3 +1,11 @@
+import os
+import re
+import json
+import datetime
+
+import numpy as np
+
+
 def prompt(msg):
     '''Python 2/3 imput compatability function. Pauses for user input.
 
@@ -126,3 +134,211 @@ def gallery(*args, **kwargs):
     prompt("\n\033[0;34mPress a key at any time to terminate ViViz gallery server.\033[0m\n\n")
     process.terminate()
     print("ViViz gallery server has terminated.")
+
+
+def pregenerate(server, dataset, parameter, start, stop, cadence, workers=None,
+                manifest=None, overwrite=False, **kwargs):
+    """Create the images of a gallery (aka "PNG Walk") ahead of time.
+
+    Plots `parameter` for each interval of duration `cadence` from `start` to
+    `stop`, saves the images in the image cache (see `hapiplot()` option
+    `cachedir`), and writes a manifest (JSON) that lists the images of each
+    interval. Intervals for which all images are already in the image cache
+    are skipped, so a walk can be extended or an interrupted run continued
+    by calling again with the same arguments.
+
+    Usage
+    ----------
+    manifest = pregenerate(server, dataset, parameter, start, stop, cadence)
+
+    Example
+    ----------
+    >>> from hapiplot import pregenerate
+    >>> server = 'http://hapi-server.org/servers/TestData2.0/hapi'
+    >>> pregenerate(server, 'dataset1', 'scalar', '1970-01-01Z',
+    ...             '1970-02-01Z', 'P1D', workers=4)
+
+    Parameters
+    ----------
+    server, dataset, start, stop : str
+        See `hapiplot()`
+    parameter : str
+        A parameter or comma-separated list of parameters in `dataset`
+    cadence : str, datetime.timedelta, or numpy.timedelta64
+        Duration of each interval. A string is an ISO 8601 duration with
+        weeks, days, hours, minutes, and seconds, e.g., 'P1D' or 'PT6H'.
+        The last interval ends at `stop` if `stop - start` is not a
+        multiple of `cadence`.
+    workers : int
+        Number of processes that create images. Default is the number of
+        CPUs. Each process plots a block of contiguous intervals using
+        `hapiplot_batch()`.
+    manifest : str
+        File to write manifest to. Default is the image cache file name for
+        the request with extension ".gallery.json".
+    overwrite : bool
+        Create all images even if they are in the image cache. The image
+        cache is not used (see `hapiplot()` option `useimagecache`).
+    kwargs
+        `hapiplot_batch()`, `hapiplot()`, and `hapi()` options. returnimage
+        and saveimage are always True. If the image cache has a size limit
+        (see `imagecachesize`), it must be large enough to keep all images
+        of the walk in the image cache.
+
+    Returns
+    ----------
+    The manifest, a dict with keys 'server', 'dataset', 'parameters', 'start',
+    'stop', 'cadence' (in seconds), and 'intervals', a list with a dict for
+    each interval with keys 'start', 'stop', and 'images', which has the
+    file name of the image for each parameter relative to the directory of
+    the manifest file. For a parameter with size [N1, N2], there is an image
+    for each component, e.g., 'matrix[0,:]' (see `hapiplot()`).
+    """
+
+    import concurrent.futures
+
+    from hapiclient.hapi import hapi, hapiopts, request2path
+    from hapiplot.hapiplot import hapiplotopts, _imagefile, _plotnames, _returnformat
+    from hapiplot.plot.util import setopts
+
+    if parameter is None or parameter.strip() == '':
+        raise ValueError('parameter must be given.')
+    parameters = [name.strip() for name in parameter.split(',')]
+
+    # Options are normalized as in hapiplot() so that image file names are
+    # those that hapiplot() uses.
+    kwargs = _returnformat(kwargs).copy()
+    kwargs['returnimage'] = True
+    kwargs['saveimage'] = True
+    if overwrite:
+        kwargs['useimagecache'] = False
+    opts = setopts(hapiplotopts(), {k: v for k, v in kwargs.items() if k in hapiplotopts()})
+
+    intervals = _intervals(start, stop, cadence)
+
+    # A parameter with size [N1, N2] has an image for each component, so
+    # names of images are found from the parameter sizes in the metadata.
+    info = hapi(server, dataset, parameter,
+                **{k: v for k, v in kwargs.items() if k in hapiopts()})
+    names = []
+    for p in info['parameters'][1:]:
+        if len(_plotnames(p)) == 0:
+            raise ValueError("Parameter '%s' has more than two dimensions and can't be plotted." % p['name'])
+        names.extend(_plotnames(p))
+
+    # Image file names. See hapiplot._cachedimages().
+    images = []
+    for t0, t1 in intervals:
+        meta = {
+                'x_server': server,
+                'x_dataset': dataset,
+                'x_time.min': t0,
+                'x_time.max': t1,
+                'parameters': [{}] + [{'name': name} for name in names]
+        }
+        images.append([_imagefile(meta, i, opts, kwargs) for i in range(1, len(meta['parameters']))])
+
+    todo = [interval for interval, files in zip(intervals, images)
+            if overwrite or not all(os.path.exists(file) for file in files)]
+    print('pregenerate(): %d of %d intervals need images.' % (len(todo), len(intervals)))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(todo)))
+
+    # Blocks of contiguous intervals so that figures are reused and data
+    # requests can be merged (see hapiplot_batch() option mergeintervals).
+    # More blocks than workers balances the load.
+    blocks = []
+    if len(todo) > 0:
+        size = max(1, -(-len(todo)//(4*workers)))
+        blocks = [todo[k:k+size] for k in range(0, len(todo), size)]
+
+    if workers == 1:
+        for block in blocks:
+            _pregenerate(server, dataset, parameter, block, kwargs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_pregenerate, server, dataset, parameter, block, kwargs)
+                       for block in blocks]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+    if manifest is None:
+        manifest = request2path(server, dataset, parameter, start, stop, opts['cachedir'])
+        manifest = manifest + '.gallery.json'
+
+    mdir = os.path.dirname(os.path.abspath(manifest))
+    index = {
+                'server': server,
+                'dataset': dataset,
+                'parameters': parameters,
+                'start': start,
+                'stop': stop,
+                'cadence': _duration(cadence).total_seconds(),
+                'intervals': []
+            }
+    for (t0, t1), files in zip(intervals, images):
+        index['intervals'].append({
+            'start': t0,
+            'stop': t1,
+            'images': {name: os.path.relpath(file, mdir) for name, file in zip(names, files)}
+        })
+
+    if not os.path.exists(mdir):
+        os.makedirs(mdir)
+    with open(manifest, 'w') as f:
+        json.dump(index, f, indent=2)
+    print('pregenerate(): Wrote ' + manifest)
+
+    return index
+
+
+def _pregenerate(server, dataset, parameter, intervals, kwargs):
+    """Create images for intervals. Called in a worker process."""
+
+    from hapiplot.batch import hapiplot_batch
+
+    # Only the images saved in the image cache are needed, so the returned
+    # metas (with images and figures) are not sent back to the parent.
+    hapiplot_batch(server, dataset, parameter, intervals, **kwargs)
+
+
+def _duration(cadence):
+    """Return cadence as a datetime.timedelta.
+
+    cadence is a datetime.timedelta, numpy.timedelta64, or ISO 8601
+    duration string with no years or months, e.g., 'P1D' or 'PT1H30M'.
+    """
+
+    if isinstance(cadence, datetime.timedelta):
+        return cadence
+    if isinstance(cadence, np.timedelta64):
+        return datetime.timedelta(microseconds=int(cadence/np.timedelta64(1, 'us')))
+
+    m = re.fullmatch(r'P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d*)?)S)?)?',
+                     str(cadence))
+    if m is None or str(cadence) in ('P', 'PT'):
+        raise ValueError("cadence must be an ISO 8601 duration such as 'P1D' or 'PT1H'. Got %s." % cadence)
+    weeks, days, hours, minutes, seconds = [float(v) if v else 0 for v in m.groups()]
+    return datetime.timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def _intervals(start, stop, cadence):
+    """Return list of (start, stop) intervals of duration cadence.
+
+    Times are formatted as ISO 8601 with a trailing Z.
+    """
+
+    from hapiplot.times import hapitime2datetime64, isoformat
+
+    dt = np.timedelta64(_duration(cadence))
+    if dt <= np.timedelta64(0):
+        raise ValueError('cadence must be positive.')
+
+    t0, t1 = hapitime2datetime64(np.array([start, stop]))
+    edges = np.arange(t0, t1, dt)
+    edges = np.append(edges, t1)
+    times = [isoformat(t) for t in edges]
+
+    return list(zip(times[:-1], times[1:]))
@@ -1,19 +1,19 @@
 import os
-import hashlib
-import json
+import time
 
 import numpy as np
 from matplotlib import rc_context
 from matplotlib import rcParams
 
 from datetick import datetick
-from hapiclient.hapitime import hapitime2datetime
-from hapiclient.hapi import request2path
-from hapiclient.hapi import cachedir
-from hapiclient.util import log, warning
 from hapiplot.plot.timeseries import timeseries
 from hapiplot.plot.heatmap import heatmap
-from hapiplot.plot.util import setopts
+from hapiplot.plot import categories
+from hapiplot.fill import fill2nan, fill2float, fill2nat, int2float
+from hapiplot.times import hapitime2datetime64, time_edges
+from hapiplot.plot.util import setopts, rcdigest, Stages, log, warning
+from hapiplot.imagecache import imagecache
+from hapiplot.plot.figurepool import figurepool
 
 def hapiplot(*args, **kwargs):
     """Plot response from HAPI server.
@@ -53,8 +53,18 @@ def hapiplot(*args, **kwargs):
         meta['parameters'][i]['hapiplot']['colorbar'] is a reference to the
             colorbar on the figure (if parameter plotted as a heatmap)
 
+        meta['parameters'][i]['hapiplot']['decimation'] describes the
+            decimation applied before plotting (if parameter plotted as a
+            time series). See `timeseries()`.
+
+        meta['parameters'][i]['hapiplot']['rebin'] describes the rebinning
+            applied before plotting (if parameter plotted as a heatmap).
+            See `heatmap()`.
+
         meta['parameters'][i]['hapiplot']['image'] is PNG, PDF, or SVG data
-            and is included only if `returnimage=True`. Usage example:
+            or, for returnformat='rgba' or 'array', the pixels of the figure
+            (see `returnformat`) and is included only if `returnimage=True`.
+            Usage example:
 
             >>> img = meta['parameters'][i]['hapiplot']['image']
             >>> Image.open(io.BytesIO(img)).show()
@@ -63,6 +73,33 @@ def hapiplot(*args, **kwargs):
             >>> f.write(img)
             >>> f.close()
 
+        meta['parameters'][i]['hapiplot']['stats'] is included only if
+            `timing=True` and is a dict with
+                'timing': durations in seconds of the stages of plotting:
+                    'time' (parsing of the Time parameter, which is shared
+                    by all parameters), 'imagecache' (image cache lookup),
+                    'fill' (handling of fill values), 'labels' (labels and
+                    bins), 'plot' (the `timeseries()` or `heatmap()` call,
+                    which includes 'decimate' or 'rebin', 'draw', and
+                    'datetick'), 'encode' (creating the image), 'save'
+                    (writing the image to the image cache), and 'total'
+                'records': number of records
+                'nbytes': size of the parameter's data in bytes
+                'points_plotted': number of values plotted after decimation
+                    or rebinning
+                'imagecache': 'hit', 'miss', or None if the image cache was
+                    not used
+                'image_bytes': size of the image in bytes or None
+            For the five-argument form, when all images are returned from
+            the image cache without calling `hapi()`, 'records', 'nbytes',
+            and 'points_plotted' are None.
+
+        meta['parameters'][i]['hapiplot']['components'] is a list with the
+            above for each component of a parameter with size [N1, N2].
+            One plot is created for each of the min(N1, N2) components. The
+            other values in meta['parameters'][i]['hapiplot'] are those of
+            the first component.
+
     See Also
     ---------
         `hapi()`: Get data from a HAPI server
@@ -81,11 +118,65 @@ def hapiplot(*args, **kwargs):
     Other kwargs
     ------------
         * returnimage: [False] If True, `hapiplot()` returns binary image data
-        * returnformat: [png], svg, or pdf
+        * returnformat: [None] png, svg, pdf, rgba, or array. None uses
+            the format in rcParams['savefig.format'] (png by default). With
+            'rgba' or 'array', the image is not encoded:
+            `meta['parameters'][i]['hapiplot']['image']` is the Agg canvas
+            buffer of the figure (`fig.canvas.buffer_rgba()`) as a
+            memoryview ('rgba') or a NumPy uint8 array ('array') with
+            shape `meta['parameters'][i]['hapiplot']['imageshape']`, which
+            is (height, width, 4). The buffer is the whole figure at
+            rcParams['figure.dpi']; it is not cropped as for
+            savefig.bbox='tight'. The image cache is not used for these
+            formats, although saveimage=True still saves an encoded image.
+            The buffer is not a copy and is owned by the figure in
+            `meta['parameters'][i]['hapiplot']['figure']`: it is valid
+            while the figure is referenced and not drawn again (e.g., by
+            a change to it followed by `fig.canvas.draw()`, `fig.savefig()`,
+            or showing it). When figures are reused (figurepool and
+            `hapiplot_batch()`) or created in another process
+            (workertype='process'), the buffer is a copy that is not tied
+            to a figure.
         * cachedir: Directory to store images. Default is hapiclient.hapi.cachedir()
-        * useimagecache: [True] Used cached image (when returnimage=True)
+        * useimagecache: [True] Used cached image (when returnimage=True).
+            For `hapiplot(server, dataset, parameters, start, stop)`, if
+            images for all parameters are cached, `hapi()` is not called
+            and the returned `data` is None. The returned `meta` then has
+            only the `x_` request keys and, for i > 0,
+            `meta['parameters'][i]['name']` and
+            `meta['parameters'][i]['hapiplot']`.
         * saveimage: [False] Save image to `cachedir`
+        * imagecachesize: ['default'] Maximum total size in bytes of images
+            saved in `cachedir`. When exceeded, images are deleted according
+            to `imagecachepolicy`. None means no limit. The size is saved in
+            the image cache index and used by later calls and other
+            processes; 'default' uses the saved size, which is None unless
+            set. See `hapiplot.imagecache.imagecache()` for setting,
+            inspecting, and pruning the image cache.
+        * imagecachepolicy: ['default'], 'lru', or 'lfu'. Delete least
+            recently used or least frequently used images first. Saved as
+            for `imagecachesize`; the initial saved policy is 'lru'.
         * saveformat: [png], svg, or pdf
+        * workers: [1] Number of parameters to plot at the same time when
+            `returnimage=True`
+        * workertype: ['process'] or 'thread'. Type of pool used when
+            workers > 1. Drawing and image encoding hold the GIL, so only
+            processes plot parameters in parallel on several CPUs. With
+            'process', only the image and stats are returned from the
+            worker processes, so `meta['parameters'][i]['hapiplot']` has no
+            'figure' or 'colorbar'; use 'thread' if they are needed. Use
+            `benchmark/plot_time.py --benchmarks workers` to compare.
+        * timing: [False] If True, record the duration of each stage of
+            plotting and the size of the data and image in
+            `meta['parameters'][i]['hapiplot']['stats']`
+        * figurepool: [False] If True or a `FigurePool`, get figures from a
+            pool of figures when `returnimage=True` and return them to the
+            pool after the image is created instead of creating a new figure
+            for each parameter. True uses the pool returned by
+            `hapiplot.plot.figurepool.figurepool()`; use its `stats()`
+            method to get the pool size and hit rate. The returned
+            `meta['parameters'][i]['hapiplot']` then has no `figure` or
+            `colorbar`.
 
     Example
     --------
@@ -107,6 +198,8 @@ def hapiplot(*args, **kwargs):
 
     """
 
+    kwargs = _returnformat(kwargs)
+
     if len(args) == 5:
         # For consistency with gallery and autoplot functions, allow usage of
         # hapiplot(server, dataset, parameters, start, stop, **kwargs)
@@ -118,54 +211,20 @@ def hapiplot(*args, **kwargs):
         for key, value in kwargs.items():
             if key in kwargs_allowed:
                 kwargs_reduced[key] = value
+        meta = _cachedimages(args[0], args[1], args[2], args[3], args[4], kwargs)
+        if meta is not None:
+            return None, meta
         data, meta = hapi(args[0], args[1], args[2], args[3], args[4], **kwargs_reduced)
+        # Remove options that are only hapi() options.
+        opts = hapiplotopts()
+        kwargs = {k: v for k, v in kwargs.items() if k in opts or k not in kwargs_allowed}
         meta = hapiplot(data, meta, **kwargs)
         return data, meta
     else:
         data = args[0]
         meta = args[1]
 
-    # Default options
-    opts = {
-                'logging': False,
-                'saveimage': False,
-                'returnimage': False,
-                'usecache': True,
-                'useimagecache': True,
-                'cachedir': cachedir(),
-                'backend': 'default',
-                'style': 'fast',
-
-                'title': '',
-                'ztitle': '',
-                'xlabel': '',
-                'ylabel': '',
-                'zlabel': '',
-                'logx': False,
-                'logy': False,
-                'logz': False,
-
-                'tsopts': {},
-                'hmopts': {},
-
-                'rcParams':
-                    {
-                        'savefig.dpi': 144,
-                        'savefig.format': 'png',
-                        'savefig.bbox': 'tight',
-                        'savefig.transparent': False,
-                        'figure.max_open_warning': 50,
-                        'figure.figsize': (7, 3),
-                        'figure.dpi': 144,
-                        'axes.titlesize': 10,
-                        "font.family": "serif",
-                        "font.serif": rcParams['font.serif'],
-                        "font.weight": "normal"
-                    },
-                '_rcParams': {
-                        'figure.bbox': 'standard'
-                }
-            }
+    opts = hapiplotopts()
 
     # Override defaults
     opts = setopts(opts, kwargs)
@@ -186,26 +245,32 @@ def hapiplot(*args, **kwargs):
 
     if opts["saveimage"]:
         # Create cache directory
+        from hapiclient.hapi import cachedir
         dir = cachedir(opts['cachedir'], meta['x_server'])
         if not os.path.exists(dir): os.makedirs(dir)
 
     # Convert from NumPy array of byte literals to NumPy array of
-    # datetime objects.
+    # datetime64 values. datetime objects are not created.
     timename = meta['parameters'][0]['name']
 
+    t0 = time.perf_counter()
     nodata = False
     if len(data[timename]) == 0:
         nodata = True
         # Set time to request range to set x-axis
-        Time = hapitime2datetime(np.array([meta['x_time.min'], meta['x_time.max']]), allow_missing_Z=True)
+        Time = hapitime2datetime64(np.array([meta['x_time.min'], meta['x_time.max']]))
     else:
-        Time = hapitime2datetime(data[timename], allow_missing_Z=True)
+        Time = hapitime2datetime64(data[timename])
+    ttime = time.perf_counter() - t0
 
     if len(meta["parameters"]) == 1:
         a = 0 # Time is only parameter
     else:
         a = 1 # Time plus one or more parameters
 
+    # Parameters and components of parameters to plot using _plotparameter().
+    # Each job is (index of parameter, data, meta, index in meta, title).
+    jobs = []
     for i in range(a, len(meta["parameters"])):
 
         meta["parameters"][i]['hapiplot'] = {}
@@ -231,520 +296,846 @@ def hapiplot(*args, **kwargs):
                 sidx = 1
                 nplts = data[name].shape[2]
 
-            if opts['returnimage']:
-                warning('Only returning first image for parameter with size[1] > 1.')
-                nplts = 1
-
             for j in range(nplts):
-                timename = meta['parameters'][0]['name']
-
-                # Name to indicate what is plotted
+                metar, title = _componentmeta(meta, i, j, pidx, sidx)
+                # Views of data[name]; no data are copied.
                 if pidx > sidx:
-                    name_new = name + "[" + str(j) + ",:]"
+                    ydata = data[name][:, j, :]
                 else:
-                    name_new = name + "[:," + str(j) + "]"
+                    ydata = data[name][:, :, j]
+                jobs.append((i, ydata, metar, 1, title))
+            continue
 
-                # Reduced data ND Array
-                datar = np.ndarray(shape=(data[name].shape[0]),
-                                   dtype=[
-                                           (timename, data.dtype[timename]),
-                                           (name_new, data[name].dtype.str, 
-                                            data[name].shape[1+pidx])
-                                         ])
+        jobs.append((i, data[name], meta, i, None))
 
-                datar[timename] = data[timename]
-                if pidx > sidx:
-                    datar[name_new] = data[name][:, j, :]
-                else:
-                    datar[name_new] = data[name][:, :, j]
-
-                # Copy metadata to create a reduced metadata object
-                metar = meta.copy()  # Shallow copy
-                metar["parameters"] = []
-                # Create parameters array with elements of Time parameter ...
-                metar["parameters"].append(meta["parameters"][0])
-                # .... and this parameter
-                metar["parameters"].append(meta["parameters"][i].copy())
-                # Give new name to indicate it is a subset of full parameter
-                metar["parameters"][1]['name'] = name_new
-                metar["parameters"][1]['name_orig'] = name
-
-                # New size is N1 or N2
-                metar["parameters"][1]['size'] = [meta["parameters"][i]['size'][pidx]]
-
-                if 'units' in metar["parameters"][1]:
-                    if type(meta["parameters"][i]['units']) == str or meta["parameters"][i]['units'] == None:
-                        # Same units applies to all dimensions
-                        metar["parameters"][1]["units"] = meta["parameters"][i]['units']
-                    else:
-                        metar["parameters"][1]["units"] = meta["parameters"][i]['units'][j]
+    if opts['workers'] > 1 and len(jobs) > 1 and not opts['returnimage']:
+        warning('workers > 1 requires returnimage=True. Plotting parameters sequentially.')
 
-                if 'label' in metar["parameters"][1]:
-                    if type(meta["parameters"][i]['label']) == str:
-                        # Same label applies to all dimensions
-                        metar["parameters"][1]["label"] = meta["parameters"][i]['label']
-                    else:
-                        metar["parameters"][1]["label"] = meta["parameters"][i]['label'][j]
-
-                # Extract bins corresponding to jth column of data[name]
-                if 'bins' in metar["parameters"][1]:
-                    metar["parameters"][1]['bins'] = []
-                    metar["parameters"][1]['bins'].append(meta["parameters"][i]['bins'][pidx])
-
-
-                bin_title = ""
-                if 'bins' in meta["parameters"][i] and len(meta["parameters"][i]['bins']) > 1:
-                    bin_title = meta["parameters"][i]['bins'][sidx]['name']
-                    if 'centers' in meta["parameters"][i]['bins'][sidx]:
-                        bin_title = bin_title  + " = " + str(meta["parameters"][i]['bins'][sidx]['centers'][j])
-                        if 'units' in meta["parameters"][i]['bins'][sidx]:
-                            if meta["parameters"][i]['bins'][sidx]['units'] is not None:
-                                bin_title = bin_title + " [" + meta["parameters"][i]['bins'][sidx]['units'] + "]"
-                            bin_title = "\n" + bin_title
-
-                opts['title'] = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + name_new + bin_title
-
-                # rcParams is modified by setopts to have all rcParams.
-                # reset to original passed rcParams so that imagepath
-                # computes file name based on rcParams passed to hapiplot.
-                if 'rcParams' in kwargs:
-                    opts['rcParams'] = kwargs['rcParams']
-
-                metar = hapiplot(datar, metar, **opts)
-
-                meta["parameters"][i]['hapiplot'] = metar["parameters"][1]['hapiplot']
-            return meta
-
-        # Return cached image (case where we are returning binary image data)
-        # imagepath() options. Only need filename under these conditions.
-        if opts['saveimage'] or (opts['returnimage'] and opts['useimagecache']):
-            # Will use given rc style parameters and style name to generate file name.
-            # Assumes rc parameters of style and hapiplot defaults never change.
-            styleParams = {}
-            fmt = opts['rcParams']['savefig.format']
-            if 'rcParams' in kwargs:
-                styleParams = kwargs['rcParams']
-                if 'savefig.format' in kwargs['rcParams']:
-                    kwargs['rcParams']['savefig.format']
-
-            fnameimg = imagepath(meta, i, opts['cachedir'], styleParams, fmt)
-
-        if opts['useimagecache'] and opts['returnimage'] and os.path.isfile(fnameimg):
-            log('Returning cached binary image data in ' + fnameimg, opts)
+    if opts['workers'] > 1 and len(jobs) > 1 and opts['returnimage']:
+        hps = _plotparameters(jobs, Time, nodata, a == 0, opts, kwargs)
+    else:
+        hps = []
+        for job in jobs:
+            hps.append(_plotparameter(job[1], Time, job[2], job[3], nodata, a == 0,
+                                      _jobopts(opts, job[4]), kwargs))
+
+    for job, hp in zip(jobs, hps):
+        i = job[0]
+        if 'stats' in hp:
+            hp['stats']['timing']['time'] = ttime
+        if job[2] is meta:
+            meta["parameters"][i]['hapiplot'] = hp
+        else:
+            # Component of parameter with size [N1, N2]
+            if 'components' not in meta["parameters"][i]['hapiplot']:
+                meta["parameters"][i]['hapiplot'] = hp.copy()
+                meta["parameters"][i]['hapiplot']['components'] = []
+            meta["parameters"][i]['hapiplot']['components'].append(hp)
 
-            meta["parameters"][i]['hapiplot']['imagefile'] = fnameimg
-            with open(fnameimg, "rb") as f:
-                meta["parameters"][i]['hapiplot']['image'] = f.read()
-            continue
+    return meta
+
+
+def _returnformat(kwargs):
+    """Return kwargs with rcParams['savefig.format'] set to returnformat.
+
+    Only if returnformat is png, svg, or pdf. This format is used for the
+    image and its image cache file name.
+    """
+
+    fmt = kwargs.get('returnformat', None)
+    if fmt not in (None, 'png', 'svg', 'pdf', 'rgba', 'array'):
+        raise ValueError("returnformat must be None, 'png', 'svg', 'pdf', 'rgba', or 'array'.")
+    if fmt not in ('png', 'svg', 'pdf'):
+        return kwargs
+
+    kwargs = kwargs.copy()
+    kwargs['rcParams'] = dict(kwargs.get('rcParams', {}))
+    kwargs['rcParams']['savefig.format'] = fmt
+    return kwargs
+
+
+def _componentname(name, j, pidx, sidx):
+    """Return name of component j of parameter with size [N1, N2]."""
+
+    if pidx > sidx:
+        return name + "[" + str(j) + ",:]"
+    return name + "[:," + str(j) + "]"
 
-        log("Plotting parameter '%s'" % name, opts)
 
-        if opts['title'] != '':
-            title = opts['title']
+def _plotnames(parameter):
+    """Return names used for the images of a parameter (an element of
+    meta['parameters']).
+
+    The name is the parameter name or, for a parameter with size [N1, N2],
+    the name of each component (see _componentmeta()). An empty list is
+    returned for a parameter with more than two dimensions, which is not
+    plotted.
+    """
+
+    name = parameter['name']
+    size = parameter.get('size', [])
+    if len(size) > 2:
+        return []
+    if len(size) < 2:
+        return [name]
+
+    # Same as the choice of components in hapiplot() for data with shape
+    # (Time, N1, N2).
+    pidx, sidx, nplts = 1, 0, size[0]
+    if size[0] > size[1]:
+        pidx, sidx, nplts = 0, 1, size[1]
+    return [_componentname(name, j, pidx, sidx) for j in range(nplts)]
+
+
+def _componentmeta(meta, i, j, pidx, sidx):
+    """Return meta and title for component j of parameter i with size [N1, N2].
+
+    The returned meta has the Time parameter and one parameter with size
+    [N1] (if pidx = 0) or [N2] (if pidx = 1).
+    """
+
+    name = meta["parameters"][i]["name"]
+
+    # Name to indicate what is plotted
+    name_new = _componentname(name, j, pidx, sidx)
+
+    # Copy metadata to create a reduced metadata object
+    metar = meta.copy()  # Shallow copy
+    metar["parameters"] = []
+    # Create parameters array with elements of Time parameter ...
+    metar["parameters"].append(meta["parameters"][0])
+    # .... and this parameter
+    metar["parameters"].append(meta["parameters"][i].copy())
+    metar["parameters"][1].pop('hapiplot', None)
+    # Give new name to indicate it is a subset of full parameter
+    metar["parameters"][1]['name'] = name_new
+    metar["parameters"][1]['name_orig'] = name
+
+    # New size is N1 or N2
+    metar["parameters"][1]['size'] = [meta["parameters"][i]['size'][pidx]]
+
+    if 'units' in metar["parameters"][1]:
+        if type(meta["parameters"][i]['units']) == str or meta["parameters"][i]['units'] == None:
+            # Same units applies to all dimensions
+            metar["parameters"][1]["units"] = meta["parameters"][i]['units']
         else:
-            if 'name_orig' in meta["parameters"][i]:
-                title = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + meta["parameters"][i]['name_orig']
-            else:
-                title = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + name
+            metar["parameters"][1]["units"] = meta["parameters"][i]['units'][j]
 
-        as_heatmap = False
-        if 'size' in meta['parameters'][i] and meta['parameters'][i]['size'][0] > 10:
-            as_heatmap = True
+    if 'label' in metar["parameters"][1]:
+        if type(meta["parameters"][i]['label']) == str:
+            # Same label applies to all dimensions
+            metar["parameters"][1]["label"] = meta["parameters"][i]['label']
+        else:
+            metar["parameters"][1]["label"] = meta["parameters"][i]['label'][j]
 
-        if 'bins' in meta['parameters'][i]:
-            as_heatmap = True
+    # Extract bins corresponding to jth column of data[name]
+    if 'bins' in metar["parameters"][1]:
+        metar["parameters"][1]['bins'] = []
+        metar["parameters"][1]['bins'].append(meta["parameters"][i]['bins'][pidx])
 
-        if 'units' in meta["parameters"][i] and type(meta["parameters"][i]["units"]) == list:
-            if as_heatmap:
-                # TODO: Verify that all units not the same
-                warning("Not plotting %s as heatmap because components have different units." % meta["parameters"][i]["name"])
-            as_heatmap = False
+    bin_title = ""
+    if 'bins' in meta["parameters"][i] and len(meta["parameters"][i]['bins']) > 1:
+        bin_title = meta["parameters"][i]['bins'][sidx]['name']
+        if 'centers' in meta["parameters"][i]['bins'][sidx]:
+            bin_title = bin_title  + " = " + str(meta["parameters"][i]['bins'][sidx]['centers'][j])
+            if 'units' in meta["parameters"][i]['bins'][sidx]:
+                if meta["parameters"][i]['bins'][sidx]['units'] is not None:
+                    bin_title = bin_title + " [" + meta["parameters"][i]['bins'][sidx]['units'] + "]"
+                bin_title = "\n" + bin_title
 
-        if as_heatmap:
-            # Plot as heatmap
+    title = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + name_new + bin_title
 
-            hmopts = {
-                        'returnimage': opts['returnimage'],
-                        'transparent': opts['rcParams']['savefig.transparent']
-                    }
+    return metar, title
 
-            if meta["parameters"][i]["type"] == "string":
-                warning("Plots for only types double, integer, and isotime implemented. Not plotting %s." % meta["parameters"][i]["name"])
-                continue
 
-            if nodata:
-                if a == 0:
-                    # Time is only parameter
-                    z = np.full((2,), np.nan)
-                else:
-                    if 'size' in meta['parameters'][i]:
-                        z = np.full((2, meta['parameters'][i]['size'][0]), np.nan)
-                    else:
-                        z = np.full((2,), np.nan)
-            else:
-                z = np.asarray(data[name])
-
-            if 'fill' in meta["parameters"][i] and meta["parameters"][i]['fill']:
-                ptype = meta["parameters"][i].get("type", None)
-                if ptype == 'integer' or ptype == 'double':
-                    if meta["parameters"][i]["type"] == 'integer':
-                        # Convert to float so that fill values can be replaced
-                        # with NaN for plotting.
-                        z = z.astype('<f8', copy=False)
-                    z = fill2nan(z, meta["parameters"][i]['fill'], meta["parameters"][i]['name'])
-
-            units = meta["parameters"][i].get("units", "")
-            nl = ""
-            if len(name) + len(units) > 30:
-                nl = "\n"
-
-            #zlabel = name + nl + " [" + units + "]"
-            zlabel = ""
-            if units is not None:
-                zlabel = " [" + units + "]"
-
-            bins = np.arange(meta['parameters'][i]['size'][0])
-            bins_time_dependent = False
-            if 'bins' in meta['parameters'][i]:
-                if 'ranges' in meta["parameters"][i]['bins'][0]:
-                    if isinstance(meta['parameters'][i]['bins'][0]['ranges'], str) is False:
-                        bins = np.array(meta["parameters"][i]['bins'][0]["ranges"])
-                    else:
-                        bins_time_dependent = True
-                else:
-                    if isinstance(meta['parameters'][i]['bins'][0]['centers'], str) is False:
-                        bins = np.array(meta["parameters"][i]['bins'][0]["centers"])
-                    else:
-                        bins_time_dependent = True
-
-            if 'bins' in meta['parameters'][i] and not bins_time_dependent:
-                units = meta["parameters"][i]['bins'][0].get("units", None)
-                if units is None:
-                    units = ""
-                name = meta["parameters"][i]['bins'][0]["name"]
-                ylabel = name + "[" + units + "]"
-            else:
-                ylabel = "bin #"
-                if bins_time_dependent:
-                    ylabel = "bin #\n(vals are time dependent)"
-
-            dt = np.diff(Time)
-            dtu = np.unique(dt)
-            if len(dtu) > 1:
-                warning('Time values are not uniformly spaced. Bin width for '
-                        'time will be based on time separation of consecutive time values.')
-                # Cadence != time bin width in general, so can't use cadence.
-                # See https://github.com/hapi-server/data-specification/issues/75
-                if 'timeStampLocation' in meta and meta['timeStampLocation'].lower() == "begin":
-                    deltat = dt[0]
-                    for t in range(0,Time.size):
-                        Time[t] = Time[t] + dt[t]
-                elif 'timeStampLocation' in meta and meta['timeStampLocation'].lower() == "end":
-                    for t in range(0,Time.size):
-                        deltat = -dt[0]
-                        Time[t] = Time[t] - dt[i]
-                else:
-                    deltat = -dt[0]/2
-
-                for t in range(0,Time.size):
-                    Time[t] = Time[t] + deltat
- 
-                Time = np.append(Time, Time[-1] + dt[-1])
-
-            elif 'timeStampLocation' in meta:
-                if meta['timeStampLocation'].lower() == "begin":
-                    Time = np.append(Time, Time[-1] + dtu[0])
-                elif meta['timeStampLocation'].lower() == "end":
-                    Time = Time - dtu[0]
-                    Time = np.append(Time, Time[-1] + dtu[0])
-                else:
-                    Time = Time - dtu[0]/2
-                    Time = np.append(Time, Time[-1] + dtu[0])
+def _jobopts(opts, title):
+    """Return opts with title set if title is not None."""
+    if title is None:
+        return opts
+    opts = opts.copy()
+    opts['title'] = title
+    return opts
 
-            if opts['xlabel'] != '' and 'xlabel' not in opts['hmopts']:
-                hmopts['xlabel'] = opts['xlabel']
 
-            opts['hmopts']['ylabel'] = ylabel
-            if opts['ylabel'] != '' and 'ylabel' not in opts['hmopts']:
-                hmopts['ylabel'] = opts['ylabel']
+def hapiplotopts():
+    """Return dict of default options for hapiplot()"""
 
-            opts['hmopts']['title'] = title
-            if opts['title'] != '' and 'title' not in opts['hmopts']:
-                hmopts['title'] = opts['title']
+    from hapiclient.hapi import cachedir
 
-            opts['hmopts']['zlabel'] = zlabel
-            if opts['zlabel'] != '' and 'zlabel' not in opts['hmopts']:
-                hmopts['zlabel'] = opts['zlabel']
+    # Default options
+    opts = {
+                'logging': False,
+                'saveimage': False,
+                'returnimage': False,
+                'usecache': True,
+                'useimagecache': True,
+                'imagecachesize': 'default',
+                'imagecachepolicy': 'default',
+                'cachedir': cachedir(),
+                'backend': 'default',
+                'style': 'fast',
+                'workers': 1,
+                'workertype': 'process',
+                'figurepool': False,
+                'timing': False,
+                'returnformat': None,
 
-            if False:
-                opts['hmopts']['ztitle'] = ztitle
-                if opts['ztitle'] != '' and 'ztitle' not in opts['hmopts']:
-                    hmopts['ztitle'] = opts['ztitle']
+                'title': '',
+                'ztitle': '',
+                'xlabel': '',
+                'ylabel': '',
+                'zlabel': '',
+                'logx': False,
+                'logy': False,
+                'logz': False,
+
+                'tsopts': {},
+                'hmopts': {},
+
+                'rcParams':
+                    {
+                        'savefig.dpi': 144,
+                        'savefig.format': 'png',
+                        'savefig.bbox': 'tight',
+                        'savefig.transparent': False,
+                        'figure.max_open_warning': 50,
+                        'figure.figsize': (7, 3),
+                        'figure.dpi': 144,
+                        'axes.titlesize': 10,
+                        "font.family": "serif",
+                        "font.serif": rcParams['font.serif'],
+                        "font.weight": "normal"
+                    },
+                '_rcParams': {
+                        'figure.bbox': 'standard'
+                },
+                # Figures to reuse, keyed on parameter name. Used by
+                # hapiplot_batch().
+                '_figures': None
+            }
 
-            if opts['logx'] is not False:
-                hmopts['logx'] = True
-            if opts['logy'] is not False:
-                hmopts['logy'] = True
-            if opts['logz'] is not False:
-                hmopts['logz'] = True
+    return opts
 
-            for key, value in opts['hmopts'].items():
-                hmopts[key] = value
 
-            with rc_context(rc=opts['rcParams']):
-                fig, cb = heatmap(Time, bins, np.transpose(z), **hmopts)
+def _cachedimages(server, dataset, parameters, start, stop, kwargs):
+    """Return meta with cached images for a five-argument hapiplot() call.
 
-            meta["parameters"][i]['hapiplot']['figure'] = fig
-            meta["parameters"][i]['hapiplot']['colorbar'] = cb
+    Returns None unless returnimage=True, useimagecache=True, and images for
+    all parameters are in the image cache.
+    """
+
+    opts = hapiplotopts()
+    opts = setopts(opts, {k: v for k, v in kwargs.items() if k in opts})
+
+    if not (opts['returnimage'] and opts['useimagecache']):
+        return None
+    if opts['returnformat'] in ('rgba', 'array'):
+        # Not in image cache.
+        return None
+    if parameters is None or parameters.strip() == '' or stop is None:
+        # Parameter names or stop time are only known after hapi() call.
+        return None
+
+    ic = imagecache(opts['cachedir'],
+                    maxbytes=opts['imagecachesize'],
+                    policy=opts['imagecachepolicy'])
+
+    meta = {
+            'x_server': server,
+            'x_dataset': dataset,
+            'x_parameters': parameters,
+            'x_time.min': start,
+            'x_time.max': stop,
+            'parameters': [{}]
+    }
+
+    for name in parameters.split(','):
+        meta['parameters'].append({'name': name.strip()})
+        i = len(meta['parameters']) - 1
+        fnameimg = _imagefile(meta, i, opts, kwargs)
+        image = ic.get(fnameimg)
+        if image is None:
+            return None
+        log('Returning cached binary image data in ' + fnameimg, opts)
+        meta['parameters'][i]['hapiplot'] = {'imagefile': fnameimg, 'image': image}
+        if opts['timing']:
+            # Data were not read, so records and nbytes are not known.
+            stats = _stats(None, None)
+            stats['imagecache'] = 'hit'
+            stats['image_bytes'] = len(image)
+            meta['parameters'][i]['hapiplot']['stats'] = stats
+
+    return meta
+
+
+def _stats(records, nbytes):
+    """Return initial value of meta['parameters'][i]['hapiplot']['stats']."""
+
+    return {
+                'timing': {},
+                'records': records,
+                'nbytes': nbytes,
+                'points_plotted': None,
+                'imagecache': None,
+                'image_bytes': None
+            }
+
+
+def _imagefile(meta, i, opts, kwargs):
+    """Return image cache file name for parameter i."""
+
+    # Will use given rc style parameters and style name to generate file name.
+    # Assumes rc parameters of style and hapiplot defaults never change.
+    styleParams = {}
+    fmt = opts['rcParams']['savefig.format']
+    if 'rcParams' in kwargs:
+        styleParams = kwargs['rcParams']
+
+    return imagepath(meta, i, opts['cachedir'], styleParams, fmt)
+
+
+def _plotparameters(jobs, Time, nodata, timeonly, opts, kwargs):
+    """Plot jobs (see hapiplot()) using a pool of opts['workers'] and return
+    list of values for meta['parameters'][i]['hapiplot']."""
+
+    import concurrent.futures
+
+    workers = min(opts['workers'], len(jobs))
+    log('Plotting %d parameters using %d %s workers' \
+        % (len(jobs), workers, opts['workertype']), opts)
+
+    # Figures are not reused by workers (see hapiplot_batch()).
+    opts = opts.copy()
+    opts['_figures'] = None
+    rgba = False
+    kwargs = {key: value for key, value in kwargs.items() if key != '_figures'}
+
+    plot = _plotparameter
+    if opts['workertype'] == 'thread':
+        Executor = concurrent.futures.ThreadPoolExecutor
+    elif opts['workertype'] == 'process':
+        Executor = concurrent.futures.ProcessPoolExecutor
+        # Pickling figures costs more than creating them, so only the image
+        # and stats are sent back.
+        plot = _plotparameterimage
+        # A FigurePool can't be shared between processes. Workers use their
+        # own.
+        opts['figurepool'] = opts['figurepool'] is not False
+        # A memoryview can't be pickled. Workers return an array.
+        if opts['returnformat'] == 'rgba':
+            opts['returnformat'] = 'array'
+            rgba = True
+    else:
+        raise ValueError("workertype must be 'thread' or 'process'.")
+
+    # rc_context() is not thread safe; on exit it restores the rcParams that
+    # were in effect when it was entered. Setting the rcParams here means that
+    # all threads enter and exit their rc_context() with the same rcParams.
+    with rc_context(rc=opts['rcParams']):
+        with Executor(max_workers=workers) as executor:
+            futures = []
+            for job in jobs:
+                futures.append(executor.submit(plot, job[1], Time,
+                                               job[2], job[3], nodata, timeonly,
+                                               _jobopts(opts, job[4]), kwargs))
+            hps = [future.result() for future in futures]
+
+    if rgba:
+        for hp in hps:
+            if 'image' in hp:
+                hp['image'] = memoryview(hp['image'])
 
+    return hps
+
+
+def _plotparameterimage(*args):
+    """Return _plotparameter(*args) without the figure and colorbar."""
+
+    hp = _plotparameter(*args)
+    hp.pop('figure', None)
+    hp.pop('colorbar', None)
+    return hp
+
+
+def _plotparameter(ydata, Time, meta, i, nodata, timeonly, opts, kwargs):
+    """Plot parameter i and return value for meta['parameters'][i]['hapiplot'].
+
+    ydata is data[meta['parameters'][i]['name']] and Time is the time
+    parameter converted to datetime64. Neither Time nor opts are modified
+    because this function may be called from a worker thread or process.
+    """
+
+    hp = {}
+    name = meta["parameters"][i]["name"]
+
+    stats = None
+    if opts['timing']:
+        t0 = time.perf_counter()
+        stats = _stats(0 if nodata else int(Time.size),
+                       0 if nodata else int(np.asarray(ydata).nbytes))
+        hp['stats'] = stats
+    stages = Stages(stats)
+
+    # opts['hmopts'] is modified below.
+    opts = opts.copy()
+    opts['hmopts'] = opts['hmopts'].copy()
+
+    # Return cached image (case where we are returning binary image data)
+    # imagepath() options. Only need filename under these conditions.
+    if opts['saveimage'] or (opts['returnimage'] and opts['useimagecache']):
+        fnameimg = _imagefile(meta, i, opts, kwargs)
+
+    if opts['saveimage'] or (opts['returnimage'] and opts['useimagecache']):
+        ic = imagecache(opts['cachedir'],
+                        maxbytes=opts['imagecachesize'],
+                        policy=opts['imagecachepolicy'])
+
+    raw = opts['returnformat'] in ('rgba', 'array')
+
+    if opts['useimagecache'] and opts['returnimage'] and not raw:
+        image = ic.get(fnameimg)
+        stages.lap('imagecache')
+        if stats is not None:
+            stats['imagecache'] = 'miss' if image is None else 'hit'
+        if image is not None:
+            log('Returning cached binary image data in ' + fnameimg, opts)
+            hp['imagefile'] = fnameimg
+            hp['image'] = image
+            if stats is not None:
+                stats['image_bytes'] = len(image)
+                stats['timing']['total'] = time.perf_counter() - t0
+            return hp
+
+    log("Plotting parameter '%s'" % name, opts)
+    stages.reset()
+
+    # Figures kept for reuse by hapiplot_batch() are not returned to pool.
+    pool = None
+    if opts['figurepool'] is not False and opts['returnimage'] and opts['_figures'] is None:
+        pool = opts['figurepool']
+        if pool is True:
+            pool = figurepool()
+
+    if opts['title'] != '':
+        title = opts['title']
+    else:
+        if 'name_orig' in meta["parameters"][i]:
+            title = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + meta["parameters"][i]['name_orig']
         else:
+            title = meta["x_server"] + "\n" + meta["x_dataset"] + " | " + name
 
-            tsopts = {
-                        'logging': opts['logging'],
-                        'returnimage': opts['returnimage'],
-                        'transparent': opts['rcParams']['savefig.transparent'],
-                        'backend': opts['backend']
-                    }
-
-            ptype = meta["parameters"][i]["type"]
-            if nodata:
-                if a == 0:
-                    # Time is only parameter
-                    y = np.full((2,), np.nan)
+    as_heatmap = False
+    if 'size' in meta['parameters'][i] and meta['parameters'][i]['size'][0] > 10:
+        as_heatmap = True
+
+    if 'bins' in meta['parameters'][i]:
+        as_heatmap = True
+
+    if 'units' in meta["parameters"][i] and type(meta["parameters"][i]["units"]) == list:
+        if as_heatmap:
+            # TODO: Verify that all units not the same
+            warning("Not plotting %s as heatmap because components have different units." % meta["parameters"][i]["name"])
+        as_heatmap = False
+
+    if as_heatmap:
+        # Plot as heatmap
+
+        hmopts = {
+                    'returnimage': opts['returnimage'],
+                    'transparent': opts['rcParams']['savefig.transparent'],
+                    'info': hp
+                }
+        if opts['_figures'] is not None:
+            hmopts['figure'] = opts['_figures'].get(name)
+        if pool is not None:
+            hmopts['figurepool'] = pool
+
+        if meta["parameters"][i]["type"] == "string":
+            warning("Plots for only types double, integer, and isotime implemented. Not plotting %s." % meta["parameters"][i]["name"])
+            return hp
+
+        if nodata:
+            if timeonly:
+                # Time is only parameter
+                z = np.full((2,), np.nan)
+            else:
+                if 'size' in meta['parameters'][i]:
+                    z = np.full((2, meta['parameters'][i]['size'][0]), np.nan)
                 else:
-                    if 'size' in meta['parameters'][i]:
-                        y = np.full((2,meta['parameters'][i]['size'][0]), np.nan)
-                    else:
-                        y = np.full((2,), np.nan)
+                    z = np.full((2,), np.nan)
+        else:
+            z = np.asarray(ydata)
+
+        if 'fill' in meta["parameters"][i] and meta["parameters"][i]['fill']:
+            ptype = meta["parameters"][i].get("type", None)
+            if ptype == 'integer' or ptype == 'double':
+                z = fill2float(z, meta["parameters"][i]['fill'], meta["parameters"][i]['name'])
+        stages.lap('fill')
+
+        units = meta["parameters"][i].get("units", "")
+        nl = ""
+        if len(name) + len(units) > 30:
+            nl = "\n"
+
+        #zlabel = name + nl + " [" + units + "]"
+        zlabel = ""
+        if units is not None:
+            zlabel = " [" + units + "]"
+
+        bins = np.arange(meta['parameters'][i]['size'][0])
+        bins_time_dependent = False
+        if 'bins' in meta['parameters'][i]:
+            if 'ranges' in meta["parameters"][i]['bins'][0]:
+                if isinstance(meta['parameters'][i]['bins'][0]['ranges'], str) is False:
+                    bins = np.array(meta["parameters"][i]['bins'][0]["ranges"])
+                else:
+                    bins_time_dependent = True
+            else:
+                if isinstance(meta['parameters'][i]['bins'][0]['centers'], str) is False:
+                    bins = np.array(meta["parameters"][i]['bins'][0]["centers"])
+                else:
+                    bins_time_dependent = True
+
+        if 'bins' in meta['parameters'][i] and not bins_time_dependent:
+            units = meta["parameters"][i]['bins'][0].get("units", None)
+            if units is None:
+                units = ""
+            name = meta["parameters"][i]['bins'][0]["name"]
+            ylabel = name + "[" + units + "]"
+        else:
+            ylabel = "bin #"
+            if bins_time_dependent:
+                ylabel = "bin #\n(vals are time dependent)"
+
+        # Time is shared by all parameters, so it is not modified.
+        edges, cadence = time_edges(Time, meta.get('timeStampLocation', None))
+        if cadence is None and Time.size > 1:
+            warning('Time values are not uniformly spaced. Bin width for '
+                    'time will be based on time separation of consecutive time values.')
+            # Cadence != time bin width in general, so can't use cadence.
+            # See https://github.com/hapi-server/data-specification/issues/75
+        if Time.size > 1:
+            # A single time is labeled with a tick (see heatmap()).
+            Time = edges
+
+        if opts['xlabel'] != '' and 'xlabel' not in opts['hmopts']:
+            hmopts['xlabel'] = opts['xlabel']
+
+        opts['hmopts']['ylabel'] = ylabel
+        if opts['ylabel'] != '' and 'ylabel' not in opts['hmopts']:
+            hmopts['ylabel'] = opts['ylabel']
+
+        opts['hmopts']['title'] = title
+        if opts['title'] != '' and 'title' not in opts['hmopts']:
+            hmopts['title'] = opts['title']
+
+        opts['hmopts']['zlabel'] = zlabel
+        if opts['zlabel'] != '' and 'zlabel' not in opts['hmopts']:
+            hmopts['zlabel'] = opts['zlabel']
+
+        if False:
+            opts['hmopts']['ztitle'] = ztitle
+            if opts['ztitle'] != '' and 'ztitle' not in opts['hmopts']:
+                hmopts['ztitle'] = opts['ztitle']
+
+        if opts['logx'] is not False:
+            hmopts['logx'] = True
+        if opts['logy'] is not False:
+            hmopts['logy'] = True
+        if opts['logz'] is not False:
+            hmopts['logz'] = True
+
+        for key, value in opts['hmopts'].items():
+            hmopts[key] = value
+
+        stages.lap('labels')
+        with rc_context(rc=opts['rcParams']):
+            fig, cb = heatmap(Time, bins, np.transpose(z), **hmopts)
+        stages.lap('plot')
+
+        hp['figure'] = fig
+        hp['colorbar'] = cb
+
+    else:
+
+        tsopts = {
+                    'logging': opts['logging'],
+                    'returnimage': opts['returnimage'],
+                    'transparent': opts['rcParams']['savefig.transparent'],
+                    'backend': opts['backend'],
+                    'info': hp
+                }
+        if opts['_figures'] is not None:
+            tsopts['figure'] = opts['_figures'].get(name)
+        if pool is not None:
+            tsopts['figurepool'] = pool
+
+        ptype = meta["parameters"][i]["type"]
+        if nodata:
+            if timeonly:
+                # Time is only parameter
+                y = np.full((2,), np.nan)
             else:
-              if ptype == "isotime":
-                  y = hapitime2datetime(data[name],allow_missing_Z=True)
-              elif ptype == 'string':
-                  y = data[name].astype('U')
-              else:
-                  y = np.asarray(data[name])
-
-            if 'fill' in meta["parameters"][i] and meta["parameters"][i]['fill']:
-                if (not nodata) and ptype in ('isotime', 'string'):
-                    fill_value = meta["parameters"][i]['fill']
-                    if ptype == 'isotime':
-                        fill_value = hapitime2datetime(fill_value, allow_missing_Z=True)[0]
-                    Igood = y != fill_value
-                    Nremoved = data[name].size - np.count_nonzero(Igood)
-                    if Nremoved > 0:
-                        # TODO: Implement masking so connected line plots will
-                        # show gaps as they do for NaN values.
-                        warning('Parameter ' + name + ' is of type ' + ptype + ' and has '
-                                + str(Nremoved) + ' fill value(s). Masking is not implemented, '
-                                'so removing fill elements before plotting.')
-                        Time = Time[Igood]
-                        y = y[Igood]
-                if ptype == 'integer':
-                    y = y.astype('<f8', copy=False)
-                if ptype == 'integer' or ptype == 'double':
-                    y = fill2nan(y, meta["parameters"][i]['fill'], meta["parameters"][i]['name'])
-
-            remove_mean = False
-            magdata = 'uk/GIN_' in meta['x_server']
-            magdata = magdata or 'wdcapi' in meta['x_server']
-            magdata = magdata or 'supermag' in meta['x_server']
-            if magdata and (ptype == 'integer' or ptype == 'double'):
-                remove_mean = True
-                y_mean = np.nanmean(y, axis=0)
-
-            units = None
-            if 'units' in meta["parameters"][i] and meta["parameters"][i]['units']:
-                units = meta["parameters"][i]["units"]
-
-
-            nl = ""
-            if type(units) == str:
-                if len(name) + len(units) > 30:
-                    nl = "\n" # TODO: Automatically figure out when this is needed.
+                if 'size' in meta['parameters'][i]:
+                    y = np.full((2,meta['parameters'][i]['size'][0]), np.nan)
+                else:
+                    y = np.full((2,), np.nan)
+        else:
+          if ptype == "isotime":
+              # Fills are shown as gaps (NaT).
+              y = fill2nat(ydata, meta["parameters"][i].get('fill', None) or None, name)
+          elif ptype == 'string':
+              # Strings are plotted using integer codes (see timeseries()).
+              fill_value = meta["parameters"][i].get('fill', None) or None
+              y, tsopts['ycategories'], Nfill = categories.encode(ydata, fill_value)
+              if Nfill > 0:
+                  # Fill values have code len(categories). Show as gaps.
+                  y = int2float(y, y == len(tsopts['ycategories']))
+          else:
+              y = np.asarray(ydata)
+
+        if 'fill' in meta["parameters"][i] and meta["parameters"][i]['fill']:
+            if ptype == 'integer' or ptype == 'double':
+                y = fill2float(y, meta["parameters"][i]['fill'], meta["parameters"][i]['name'])
+        stages.lap('fill')
+
+        remove_mean = False
+        magdata = 'uk/GIN_' in meta['x_server']
+        magdata = magdata or 'wdcapi' in meta['x_server']
+        magdata = magdata or 'supermag' in meta['x_server']
+        if magdata and (ptype == 'integer' or ptype == 'double'):
+            remove_mean = True
+            y_mean = np.nanmean(y, axis=0, dtype=np.float64)
+
+        units = None
+        if 'units' in meta["parameters"][i] and meta["parameters"][i]['units']:
+            units = meta["parameters"][i]["units"]
+
+
+        nl = ""
+        if type(units) == str:
+            if len(name) + len(units) > 30:
+                nl = "\n" # TODO: Automatically figure out when this is needed.
+
+        ylabel = name
+        if units is not None and type(units) is not list:
+            ylabel = name + nl + " [" + units + "]"
 
+        if type(units) == list:
             ylabel = name
-            if units is not None and type(units) is not list:
-                ylabel = name + nl + " [" + units + "]"
 
-            if type(units) == list:
-                ylabel = name
+        if not 'legendlabels' in opts['tsopts']:
+            legendlabels = []
+            if 'size' in meta['parameters'][i]:
+                for l in range(0,meta['parameters'][i]['size'][0]):
+                    bin_label = ''
+                    bin_name = ''
+                    col_name = ''
+                    if 'bins' in meta['parameters'][i]:
+                        bin_name = meta['parameters'][i]['bins'][0]['name']
+                        if 'label' in meta['parameters'][i]['bins'][0]:
+                            if type(meta['parameters'][i]['bins'][0]['label']) == str:
+                                bin_name = meta['parameters'][i]['bins'][0]['label']
+                            else:
+                                bin_name = meta['parameters'][i]['bins'][0]['label'][l]
+                        sep = ''
+                        if 'centers' in meta['parameters'][i]['bins'][0] and 'ranges' in meta['parameters'][i]['bins'][0]:
+                            bin_name = bin_name + ' bin with'
+                            sep = ';'
 
-            if not 'legendlabels' in opts['tsopts']:
-                legendlabels = []
-                if 'size' in meta['parameters'][i]:
-                    for l in range(0,meta['parameters'][i]['size'][0]):
                         bin_label = ''
-                        bin_name = ''
-                        col_name = ''
-                        if 'bins' in meta['parameters'][i]:
-                            bin_name = meta['parameters'][i]['bins'][0]['name']
-                            if 'label' in meta['parameters'][i]['bins'][0]:
-                                if type(meta['parameters'][i]['bins'][0]['label']) == str:
-                                    bin_name = meta['parameters'][i]['bins'][0]['label']
-                                else:
-                                    bin_name = meta['parameters'][i]['bins'][0]['label'][l]
-                            sep = ''
-                            if 'centers' in meta['parameters'][i]['bins'][0] and 'ranges' in meta['parameters'][i]['bins'][0]:
-                                bin_name = bin_name + ' bin with'
-                                sep = ';'
-
-                            bin_label = ''
-
-                            if 'units' in meta['parameters'][i]['bins'][0]:
-                                bin_units = meta['parameters'][i]['bins'][0]['units']
-                                if type(bin_units) == list:
-                                    if type(bin_units[l]) == str and bin_units != '':
-                                        bin_units = ' [' + bin_units[l] + ']'
-                                    elif bin_units[l] == None:
-                                        bin_units = ' '
-                                    else:
-                                        bin_units = ' '
+
+                        if 'units' in meta['parameters'][i]['bins'][0]:
+                            bin_units = meta['parameters'][i]['bins'][0]['units']
+                            if type(bin_units) == list:
+                                if type(bin_units[l]) == str and bin_units != '':
+                                    bin_units = ' [' + bin_units[l] + ']'
+                                elif bin_units[l] == None:
+                                    bin_units = ' '
                                 else:
-                                    if type(bin_units) == str and bin_units != '':
-                                       bin_units = ' [' + bin_units + ']'
-                                    else:
-                                       bin_units = ' '
-
-                            if 'centers' in meta['parameters'][i]['bins'][0]:
-                                if meta['parameters'][i]['bins'][0]['centers'][l] is not None:
-                                    bin_label = bin_label + ' center = ' + str(meta['parameters'][i]['bins'][0]['centers'][l]) + bin_units
-                                #else:
-                                #   bin_label = bin_label + ' center = None'
-
-                            if 'ranges' in meta['parameters'][i]['bins'][0]:
-                                if type(meta['parameters'][i]['bins'][0]['ranges'][l]) == list:
-                                    if meta['parameters'][i]['bins'][0]['ranges'][l][0] and meta['parameters'][i]['bins'][0]['ranges'][l][1] is not None:
-                                        bin_label = bin_label + sep + ' range = [' + str(meta['parameters'][i]['bins'][0]['ranges'][l][0]) + ', ' + str(meta['parameters'][i]['bins'][0]['ranges'][l][1]) + ']' + bin_units
-                                #else:
-                                #    bin_label = bin_label + sep + ' range = [None]'
-
-                            if bin_label != '':
-                                bin_label = 'bin: ' + bin_label
-                                col_name = bin_name + '#%d' % l
-
-                        if col_name == '':
-                            col_name = 'col #%d' % l
-
-                        if nodata:
-                            col_name = col_name + " [no data in interval]"
-
-                        if remove_mean:
-                            if y_mean[l] > 0:
-                                col_name = "{0:s} - {1:.2f}".format(col_name, y_mean[l])
-                            if y_mean[l] < 0:
-                                col_name = "{0:s} + {1:.2f}".format(col_name, -y_mean[l])
-
-                        if 'label' in meta['parameters'][i] and \
-                            type(meta['parameters'][i]['label']) == list and \
-                            len(meta['parameters'][i]['label']) > l and \
-                            meta['parameters'][i]['label'][l].strip() != '':
-                                col_name = meta['parameters'][i]['label'][l]
-                                if nodata:
-                                    col_name = col_name + " [no data in interval]"
+                                    bin_units = ' '
+                            else:
+                                if type(bin_units) == str and bin_units != '':
+                                   bin_units = ' [' + bin_units + ']'
                                 else:
-                                    if remove_mean:
-                                        if y_mean[l] > 0:
-                                            col_name = "{0:s} - {1:.2f}".format(col_name, y_mean[l])
-                                        if y_mean[l] < 0:
-                                            col_name = "{0:s} + {1:.2f}".format(col_name, -y_mean[l])
-
-
-                        if type(units) == list:
-                            if len(units) == 1:
-                                if units[0] != '':
-                                    legendlabels.append(col_name + ' [' + units[0] + '] ' + bin_label)
-                            elif type(units[l]) == str and units[l] != '':
-                                legendlabels.append(col_name + ' [' + units[l] + '] ' + bin_label)
-                            elif units[l] == None:
-                                legendlabels.append(col_name + ' ' + bin_label)
+                                   bin_units = ' '
+
+                        if 'centers' in meta['parameters'][i]['bins'][0]:
+                            if meta['parameters'][i]['bins'][0]['centers'][l] is not None:
+                                bin_label = bin_label + ' center = ' + str(meta['parameters'][i]['bins'][0]['centers'][l]) + bin_units
+                            #else:
+                            #   bin_label = bin_label + ' center = None'
+
+                        if 'ranges' in meta['parameters'][i]['bins'][0]:
+                            if type(meta['parameters'][i]['bins'][0]['ranges'][l]) == list:
+                                if meta['parameters'][i]['bins'][0]['ranges'][l][0] and meta['parameters'][i]['bins'][0]['ranges'][l][1] is not None:
+                                    bin_label = bin_label + sep + ' range = [' + str(meta['parameters'][i]['bins'][0]['ranges'][l][0]) + ', ' + str(meta['parameters'][i]['bins'][0]['ranges'][l][1]) + ']' + bin_units
+                            #else:
+                            #    bin_label = bin_label + sep + ' range = [None]'
+
+                        if bin_label != '':
+                            bin_label = 'bin: ' + bin_label
+                            col_name = bin_name + '#%d' % l
+
+                    if col_name == '':
+                        col_name = 'col #%d' % l
+
+                    if nodata:
+                        col_name = col_name + " [no data in interval]"
+
+                    if remove_mean:
+                        if y_mean[l] > 0:
+                            col_name = "{0:s} - {1:.2f}".format(col_name, y_mean[l])
+                        if y_mean[l] < 0:
+                            col_name = "{0:s} + {1:.2f}".format(col_name, -y_mean[l])
+
+                    if 'label' in meta['parameters'][i] and \
+                        type(meta['parameters'][i]['label']) == list and \
+                        len(meta['parameters'][i]['label']) > l and \
+                        meta['parameters'][i]['label'][l].strip() != '':
+                            col_name = meta['parameters'][i]['label'][l]
+                            if nodata:
+                                col_name = col_name + " [no data in interval]"
                             else:
-                                legendlabels.append(col_name + ' ' + bin_label)
+                                if remove_mean:
+                                    if y_mean[l] > 0:
+                                        col_name = "{0:s} - {1:.2f}".format(col_name, y_mean[l])
+                                    if y_mean[l] < 0:
+                                        col_name = "{0:s} + {1:.2f}".format(col_name, -y_mean[l])
+
+
+                    if type(units) == list:
+                        if len(units) == 1:
+                            if units[0] != '':
+                                legendlabels.append(col_name + ' [' + units[0] + '] ' + bin_label)
+                        elif type(units[l]) == str and units[l] != '':
+                            legendlabels.append(col_name + ' [' + units[l] + '] ' + bin_label)
+                        elif units[l] == None:
+                            legendlabels.append(col_name + ' ' + bin_label)
                         else:
-                            # Units are on y label
                             legendlabels.append(col_name + ' ' + bin_label)
-                    tsopts['legendlabels'] = legendlabels
+                    else:
+                        # Units are on y label
+                        legendlabels.append(col_name + ' ' + bin_label)
+                tsopts['legendlabels'] = legendlabels
 
-            # If xlabel in opts and opts['tsopts'], warn?
-            if opts['xlabel'] != '' and 'xlabel' not in opts['tsopts']:
-                tsopts['xlabel'] = opts['xlabel']
+        # If xlabel in opts and opts['tsopts'], warn?
+        if opts['xlabel'] != '' and 'xlabel' not in opts['tsopts']:
+            tsopts['xlabel'] = opts['xlabel']
 
-            tsopts['ylabel'] = ylabel
-            if opts['ylabel'] != '' and 'ylabel' not in opts['tsopts']:
-                tsopts['ylabel'] = opts['ylabel']
+        tsopts['ylabel'] = ylabel
+        if opts['ylabel'] != '' and 'ylabel' not in opts['tsopts']:
+            tsopts['ylabel'] = opts['ylabel']
 
-            tsopts['title'] = title
-            if opts['title'] != '' and 'title' not in opts['tsopts']:
-                tsopts['title'] = opts['title']
+        tsopts['title'] = title
+        if opts['title'] != '' and 'title' not in opts['tsopts']:
+            tsopts['title'] = opts['title']
 
-            if opts['logx'] is not False and 'logx' not in opts['tsopts'] :
-                tsopts['logx'] = True
-            if opts['logy'] is not False and 'logy' not in opts['tsopts']:
-                tsopts['logy'] = True
+        if opts['logx'] is not False and 'logx' not in opts['tsopts'] :
+            tsopts['logx'] = True
+        if opts['logy'] is not False and 'logy' not in opts['tsopts']:
+            tsopts['logy'] = True
 
-            # Apply tsopts
-            for key, value in opts['tsopts'].items():
-                tsopts[key] = value
+        # Apply tsopts
+        for key, value in opts['tsopts'].items():
+            tsopts[key] = value
 
-            if nodata == True:
-                tsopts['nodata'] = True
+        if nodata == True:
+            tsopts['nodata'] = True
 
-            if remove_mean:
-                with rc_context(rc=opts['rcParams']):
-                    fig = timeseries(Time, y-y_mean, **tsopts)
-            else:
-                with rc_context(rc=opts['rcParams']):
-                    fig = timeseries(Time, y, **tsopts)
-
-            meta["parameters"][i]['hapiplot']['figure'] = fig
+        stages.lap('labels')
+        if remove_mean:
+            with rc_context(rc=opts['rcParams']):
+                fig = timeseries(Time, y-y_mean, **tsopts)
+        else:
+            with rc_context(rc=opts['rcParams']):
+                fig = timeseries(Time, y, **tsopts)
+        stages.lap('plot')
+
+        hp['figure'] = fig
+
+    if opts['_figures'] is not None:
+        opts['_figures'][meta["parameters"][i]["name"]] = fig
+
+    if opts['saveimage']:
+        log('Writing %s' % fnameimg, opts)
+        hp['imagefile'] = fnameimg
+
+    if opts['returnimage'] and raw:
+        with rc_context(rc=opts['rcParams']):
+            fig.canvas.draw()
+        image = fig.canvas.buffer_rgba()
+        if pool is not None or opts['_figures'] is not None:
+            # Figure will be drawn again when it is reused.
+            image = memoryview(np.array(image))
+        if opts['returnformat'] == 'array':
+            image = np.asarray(image)
+        hp['image'] = image
+        hp['imageshape'] = tuple(image.shape)
+        stages.lap('encode')
+        if stats is not None:
+            stats['image_bytes'] = image.nbytes
 
+        if opts['saveimage']:
+            with rc_context(rc=opts['rcParams']):
+                fig.savefig(fnameimg)
+            ic.put(fnameimg, opts=opts)
+            stages.lap('save')
+
+        if pool is not None:
+            pool.release(fig)
+            hp.pop('figure', None)
+            hp.pop('colorbar', None)
+            log('Returned figure to pool. Pool stats: %s' % pool.stats(), opts)
+    elif opts['returnimage']:
+        from io import BytesIO
+        buf = BytesIO()
+        with rc_context(rc=opts['rcParams']):
+            fig.canvas.print_figure(buf)
+        hp['image'] = buf.getvalue()
+        stages.lap('encode')
+        if stats is not None:
+            stats['image_bytes'] = len(hp['image'])
 
         if opts['saveimage']:
-            log('Writing %s' % fnameimg, opts)
-            meta["parameters"][i]['hapiplot']['imagefile'] = fnameimg
+            ic.put(fnameimg, hp['image'], opts=opts)
+            stages.lap('save')
+
+        if pool is not None:
+            pool.release(fig)
+            hp.pop('figure', None)
+            hp.pop('colorbar', None)
+            log('Returned figure to pool. Pool stats: %s' % pool.stats(), opts)
+    else:
+        if opts['saveimage']:
+            with rc_context(rc=opts['rcParams']):
+                fig.savefig(fnameimg)
+            ic.put(fnameimg, opts=opts)
+            stages.lap('save')
         else:
             from io import BytesIO
-            fnameimg = BytesIO()
-
-        if opts['returnimage']:
             with rc_context(rc=opts['rcParams']):
-                fig.canvas.print_figure(fnameimg)
+                fig.savefig(BytesIO())
+            stages.lap('encode')
 
-            if opts['saveimage']:
-                with open(fnameimg, mode='rb') as f:
-                    meta["parameters"][i]['hapiplot']['image'] = f.read()
-            else:
-                meta["parameters"][i]['hapiplot']['image'] = fnameimg.getvalue()
-        else:
-            with rc_context(rc=opts['rcParams']):
-                fig.savefig(fnameimg)
+        # Two calls to fig.tight_layout() may be needed b/c of bug in PyQt:
+        # https://github.com/matplotlib/matplotlib/issues/10361
+        if opts['_rcParams']['figure.bbox'] == 'tight':
+            fig.tight_layout()
 
-            # Two calls to fig.tight_layout() may be needed b/c of bug in PyQt:
-            # https://github.com/matplotlib/matplotlib/issues/10361
-            if opts['_rcParams']['figure.bbox'] == 'tight':
-                fig.tight_layout()
+    if stats is not None:
+        stats['timing']['total'] = time.perf_counter() - t0
 
-    return meta
+    return hp
 
 
 def imagepath(meta, i, cachedir, opts, fmt):
 
-    # The value of axis.prop_cycle is a cycler
-    # https://matplotlib.org/cycler/
-    # and can't be serialized by json.dumps.
-    if 'axes.prop_cycle' in opts:
-        opts['axes.prop_cycle'] = list(opts['axes.prop_cycle'])
-
-    try:
-        optsmd5 = hashlib.md5(json.dumps(opts, sort_keys=True).encode('utf8')).hexdigest()
-    except:
-        # Remove elements that can't be serialized.
-        for key in opts:
-            try:
-                json.dumps(opts[key])
-            except:
-                #print('Removed ' + key)
-                opts[key] = None
-        optsmd5 = hashlib.md5(json.dumps(opts, sort_keys=True).encode('utf8')).hexdigest()
+    from hapiclient.hapi import request2path
+
+    # opts are the rcParams passed to hapiplot(). The digest is memoized so
+    # that repeated calls with the same rcParams do not re-serialize them.
+    optsmd5 = rcdigest(opts)
 
     fname = request2path(meta['x_server'],
                          meta['x_dataset'],
@@ -755,60 +1146,3 @@ def imagepath(meta, i, cachedir, opts, fmt):
 
     return fname + "-" + optsmd5 + "." + fmt
 
-
-def fill2mask(y, fill):
-    """Create a masked array for a non-numeric fill value."""
-
-    # TODO: Write. Needed for ISOTime parameters with a fill value.
-    pass
-
-
-def fill2nan(y, fill, name=None):
-
-    # Check that dtype is double.
-    if y.dtype.kind != 'f':
-        msg = (
-            f'fill2nan() called for parameter {name} with non-float dtype '
-            f'{y.dtype}. No fill values replaced with NaN.'
-        )
-        warning(msg)
-        return y
-
-    if fill.lower() == 'null':
-        msg = (
-            f'fill value string of "null" in metadata for parameter {name} '
-            f'with float dtype {y.dtype} is not valid. '
-            f'No fill values replaced with NaN.'
-        )
-        warning(msg)
-
-        return y
-
-    if fill.lower() == 'nan':
-        yfill = np.nan
-
-    try:
-        yfill = np.float64(fill)
-    except Exception:
-        msg = (
-            f'Invalid fill value of "{fill}" in metadata for parameter {name} ',
-            f'with float dtype {y.dtype}: float("{fill}") raised an exception.'
-        )
-        warning(msg)
-        return y
-
-    if np.float64(fill) != np.float32(fill) and np.any(y == np.float32(fill)):
-        yfill = np.float32(fill)
-        msg = (
-            f'Fill value of "{fill}" in metadata and values of '
-            f'np.float32("{fill}") = {np.float32(fill)} in data array for '
-            f'parameter "{name}" suggests fill value should have been {np.float32(yfill)}. '
-            f'Using {np.float32(yfill)} as fill value for plotting instead of {fill}.'
-        )
-        warning(msg)
-
-    # Replace fills with NaN for plotting (so gaps shown in lines for time
-    # series an empty tiles for spectra).
-    y[y == yfill] = np.nan
-
-    return y
@@ -0,0 +1,397 @@
+import os
+import time
+import atexit
+import sqlite3
+import threading
+
+from hapiplot.plot.util import log
+
+# Name of index file written in the top-level image cache directory.
+INDEXFILE = 'hapiplot-imagecache.sqlite'
+
+# Sequence number of an access. Evaluated in the statement that uses it, so
+# it is unique across threads and processes.
+_NEXTSEQ = '(SELECT COALESCE(MAX(seq), 0) + 1 FROM images)'
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def imagecache(cachedir, **kwargs):
+    """Return the ImageCache for cachedir.
+
+    One ImageCache object is kept per directory so that repeated calls to
+    hapiplot() do not re-open the index. If maxbytes or policy are given
+    as keyword arguments and are not 'default', they are set on the
+    ImageCache object, which saves them in the index.
+
+    Example
+    -------
+        >>> from hapiclient.hapi import cachedir
+        >>> from hapiplot.imagecache import imagecache
+        >>> ic = imagecache(cachedir())
+        >>> ic.stats()
+        >>> ic.prune(maxbytes=100*2**20) # Reduce to 100 MB
+    """
+
+    cachedir = os.path.abspath(cachedir)
+    with _lock:
+        if cachedir not in _caches:
+            _caches[cachedir] = ImageCache(cachedir)
+        ic = _caches[cachedir]
+    for key, value in kwargs.items():
+        if key not in ['maxbytes', 'policy']:
+            raise ValueError('Invalid keyword argument "%s"' % key)
+        if value != 'default':
+            setattr(ic, key, value)
+    return ic
+
+
+@atexit.register
+def _flushall():
+    for ic in list(_caches.values()):
+        try:
+            ic.flush()
+        except Exception:
+            pass
+
+
+class ImageCache:
+    """Image files under cachedir with a size quota.
+
+    The path, size, last access time, number of accesses, and access
+    sequence number of each image are stored in an SQLite index file
+    (INDEXFILE) in cachedir along with the total size of all images. When
+    an image is added and the total exceeds maxbytes, the least recently
+    used (policy='lru') or least frequently used (policy='lfu') images are
+    deleted until the total is below maxbytes. The index is used for this,
+    so the directory is never walked except by rebuild().
+
+    Each access increments the sequence number, which gives the order of
+    use. Access times are only used by prune(maxage=...), so eviction
+    does not depend on the resolution of the clock.
+
+    Each thread keeps one connection to the index. The index is in WAL
+    mode, so reads do not block and are not blocked by writes. A get() of
+    a cached image does not write to the index. Its access is kept in
+    memory and written with the other pending accesses of the ImageCache
+    object in one transaction by flush(). flush() is called by put() in the
+    transaction that takes the write lock for adding the image, by get()
+    when the oldest pending access is more than flushinterval seconds
+    old or there are flushsize pending accesses, by prune(), stats(),
+    entries(), and rebuild(), and at interpreter exit. Until then, other
+    processes evict without these accesses, and accesses not flushed when
+    a process exits without running atexit handlers (e.g., a
+    multiprocessing worker) are lost, which only affects eviction order.
+
+    Files under cachedir that are not in the index (e.g., images written by
+    older versions of hapiplot) are added to the index the first time they
+    are read with get() or all at once with rebuild().
+
+    maxbytes and policy are saved in the index, so they apply to all
+    ImageCache objects and processes that use cachedir until they are
+    changed. maxbytes=None means no limit. The default of 'default' keeps
+    the saved value, which is initially None for maxbytes and 'lru' for
+    policy.
+    """
+
+    flushinterval = 1.0
+    flushsize = 1000
+
+    def __init__(self, cachedir, maxbytes='default', policy='default'):
+
+        self.cachedir = os.path.abspath(cachedir)
+        self.indexfile = os.path.join(self.cachedir, INDEXFILE)
+
+        self._local = threading.local()
+
+        # Accesses not yet written to index, keyed on path relative to
+        # cachedir, in order of last access. Values are [hits, atime, size].
+        self._pending = {}
+        self._pendingpid = os.getpid()
+        self._pendingtime = None
+        self._pendinglock = threading.Lock()
+
+        if not os.path.exists(self.cachedir):
+            os.makedirs(self.cachedir, exist_ok=True)
+
+        # Persistent setting of the index file. Must be outside a transaction.
+        self._connect().execute('PRAGMA journal_mode=WAL')
+
+        with self._transaction() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, '
+                        'size INTEGER, atime REAL, hits INTEGER, seq INTEGER)')
+            con.execute('CREATE INDEX IF NOT EXISTS images_atime ON images (atime)')
+            con.execute('CREATE INDEX IF NOT EXISTS images_seq ON images (seq)')
+            con.execute('CREATE INDEX IF NOT EXISTS images_hits ON images (hits, seq)')
+            con.execute('CREATE TABLE IF NOT EXISTS total (bytes INTEGER)')
+            if con.execute('SELECT COUNT(*) FROM total').fetchone()[0] == 0:
+                con.execute('INSERT INTO total VALUES (0)')
+            con.execute('CREATE TABLE IF NOT EXISTS settings (maxbytes INTEGER, policy TEXT)')
+            if con.execute('SELECT COUNT(*) FROM settings').fetchone()[0] == 0:
+                con.execute("INSERT INTO settings VALUES (NULL, 'lru')")
+
+        if maxbytes != 'default':
+            self.maxbytes = maxbytes
+        if policy != 'default':
+            self.policy = policy
+
+    @property
+    def maxbytes(self):
+        return self._connect().execute('SELECT maxbytes FROM settings').fetchone()[0]
+
+    @maxbytes.setter
+    def maxbytes(self, maxbytes):
+        if maxbytes is not None and not maxbytes >= 0:
+            raise ValueError('maxbytes must be None or >= 0')
+        self._connect().execute('UPDATE settings SET maxbytes = ?', (maxbytes,))
+
+    @property
+    def policy(self):
+        return self._connect().execute('SELECT policy FROM settings').fetchone()[0]
+
+    @policy.setter
+    def policy(self, policy):
+        if policy not in ['lru', 'lfu']:
+            raise ValueError("policy must be 'lru' or 'lfu'")
+        self._connect().execute('UPDATE settings SET policy = ?', (policy,))
+
+    def _connect(self):
+        """Return the connection of this thread, opening it if needed."""
+        # The process ID is checked because a connection must not be used
+        # in a child created by fork(). The timeout allows for concurrent
+        # writes by workers.
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.indexfile, timeout=30, isolation_level=None)
+            # With WAL, commits are durable after a checkpoint rather than
+            # after each transaction, which is enough for a cache index.
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def _transaction(self, begin='BEGIN IMMEDIATE'):
+        # The default takes the write lock at the start so that the total
+        # is consistent across processes. Use begin='BEGIN' for reads.
+        return _Transaction(self._connect(), begin)
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.cachedir)
+
+    def _add(self, con, key, size, atime, hits):
+        row = con.execute('SELECT size FROM images WHERE path = ?', (key,)).fetchone()
+        if row is not None:
+            con.execute('UPDATE total SET bytes = bytes - ?', (row[0],))
+        con.execute('INSERT OR REPLACE INTO images (path, size, atime, hits, seq) '
+                    'VALUES (?, ?, ?, ?, %s)' % _NEXTSEQ, (key, size, atime, hits))
+        con.execute('UPDATE total SET bytes = bytes + ?', (size,))
+
+    def _remove(self, con, key):
+        row = con.execute('SELECT size FROM images WHERE path = ?', (key,)).fetchone()
+        if row is not None:
+            con.execute('DELETE FROM images WHERE path = ?', (key,))
+            con.execute('UPDATE total SET bytes = bytes - ?', (row[0],))
+
+    def get(self, path):
+        """Return the content of image file path or None if not in cache."""
+
+        key = self._key(path)
+
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+        except FileNotFoundError:
+            with self._pendinglock:
+                self._pending.pop(key, None)
+            # Only take the write lock if a deleted file is still indexed.
+            con = self._connect()
+            if con.execute('SELECT 1 FROM images WHERE path = ?', (key,)).fetchone() is not None:
+                with self._transaction() as con:
+                    self._remove(con, key)
+            return None
+
+        t = time.time()
+        with self._pendinglock:
+            if self._pendingpid != os.getpid():
+                # Accesses of parent process are flushed by parent.
+                self._pending = {}
+                self._pendingpid = os.getpid()
+            if len(self._pending) == 0:
+                self._pendingtime = t
+            # Removed and added so that order is that of last access.
+            access = self._pending.pop(key, [0, t, 0])
+            self._pending[key] = [access[0] + 1, t, len(image)]
+            flush = len(self._pending) >= self.flushsize \
+                    or t - self._pendingtime >= self.flushinterval
+        if flush:
+            self.flush()
+
+        return image
+
+    def flush(self):
+        """Write accesses by get() to the index."""
+        if len(self._pending) > 0:
+            with self._transaction() as con:
+                self._flush(con)
+
+    def _flush(self, con):
+        with self._pendinglock:
+            if self._pendingpid != os.getpid():
+                self._pending = {}
+                self._pendingpid = os.getpid()
+            pending = self._pending
+            self._pending = {}
+        for key, (hits, atime, size) in pending.items():
+            n = con.execute('UPDATE images SET atime = ?, hits = hits + ?, seq = %s '
+                            'WHERE path = ?' % _NEXTSEQ, (atime, hits, key)).rowcount
+            if n == 0 and os.path.exists(os.path.join(self.cachedir, key)):
+                # File not in index.
+                self._add(con, key, size, atime, hits)
+
+    def put(self, path, image=None, opts=None):
+        """Add image file path to cache.
+
+        If image is given, it is written to path. Otherwise, path must
+        exist. Images are evicted if needed to keep the total size below
+        maxbytes.
+        """
+
+        if image is not None:
+            d = os.path.dirname(path)
+            if not os.path.exists(d):
+                os.makedirs(d, exist_ok=True)
+            # Write then rename so readers never see a partial file.
+            tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(image)
+            os.replace(tmp, path)
+            size = len(image)
+        else:
+            size = os.path.getsize(path)
+
+        with self._transaction() as con:
+            self._flush(con)
+            self._add(con, self._key(path), size, time.time(), 0)
+            self._evict(con, self.maxbytes, keep=self._key(path), opts=opts)
+
+    def _evict(self, con, maxbytes, keep=None, opts=None):
+
+        if maxbytes is None:
+            return 0
+
+        if self.policy == 'lru':
+            order = 'seq'
+        else:
+            order = 'hits, seq'
+
+        n = 0
+        total = con.execute('SELECT bytes FROM total').fetchone()[0]
+        while total > maxbytes:
+            rows = con.execute('SELECT path, size FROM images WHERE path != ? '
+                               'ORDER BY %s LIMIT 100' % order, (keep or '',)).fetchall()
+            if len(rows) == 0:
+                break
+            for key, size in rows:
+                if total <= maxbytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cachedir, key))
+                except FileNotFoundError:
+                    pass
+                if opts is not None:
+                    log('Evicted %s from image cache' % key, opts)
+                self._remove(con, key)
+                total = total - size
+                n = n + 1
+
+        return n
+
+    def prune(self, maxbytes=None, maxage=None):
+        """Delete images to reduce total size to maxbytes or remove images
+        not accessed in maxage seconds. Returns number of images deleted.
+
+        If maxbytes and maxage are None, the cache's maxbytes is used.
+        """
+
+        if maxbytes is None and maxage is None:
+            maxbytes = self.maxbytes
+
+        n = 0
+        with self._transaction() as con:
+            self._flush(con)
+            if maxage is not None:
+                rows = con.execute('SELECT path FROM images WHERE atime < ?',
+                                   (time.time() - maxage,)).fetchall()
+                for (key,) in rows:
+                    try:
+                        os.remove(os.path.join(self.cachedir, key))
+                    except FileNotFoundError:
+                        pass
+                    self._remove(con, key)
+                    n = n + 1
+            n = n + self._evict(con, maxbytes)
+
+        return n
+
+    def clear(self):
+        """Delete all images in index."""
+        return self.prune(maxbytes=0)
+
+    def stats(self):
+        """Return dict with number of images, total bytes, and maxbytes."""
+        self.flush()
+        with self._transaction('BEGIN') as con:
+            total = con.execute('SELECT bytes FROM total').fetchone()[0]
+            count = con.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        return {'files': count, 'bytes': total,
+                'maxbytes': self.maxbytes, 'policy': self.policy}
+
+    def entries(self):
+        """Return list of dicts with path, size, atime, and hits of images,
+        most recently used first."""
+        self.flush()
+        rows = self._connect().execute('SELECT path, size, atime, hits FROM images '
+                                       'ORDER BY seq DESC').fetchall()
+        return [{'path': os.path.join(self.cachedir, r[0]), 'size': r[1],
+                 'atime': r[2], 'hits': r[3]} for r in rows]
+
+    def rebuild(self, exts=('png', 'svg', 'pdf')):
+        """Re-create index from image files under cachedir.
+
+        Access times and order are taken from file modification times.
+        """
+
+        found = []
+        for root, dirs, files in os.walk(self.cachedir):
+            for fname in files:
+                if fname.split('.')[-1] not in exts:
+                    continue
+                path = os.path.join(root, fname)
+                st = os.stat(path)
+                found.append((st.st_mtime, path, st.st_size))
+        found.sort()
+
+        with self._transaction() as con:
+            self._flush(con)
+            con.execute('DELETE FROM images')
+            con.execute('UPDATE total SET bytes = 0')
+            for mtime, path, size in found:
+                self._add(con, self._key(path), size, mtime, 0)
+
+
+class _Transaction:
+
+    def __init__(self, con, begin):
+        self.con = con
+        self.begin = begin
+
+    def __enter__(self):
+        self.con.execute(self.begin)
+        return self.con
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.con.execute('COMMIT')
+        else:
+            self.con.execute('ROLLBACK')
@@ -0,0 +1,158 @@
+"""Bin geometry for heatmap().
+
+Functions for computing bin edges from centers, tick locations and labels,
+and the rows or columns of NaNs inserted where bins given as [lower, upper]
+pairs are not contiguous. All use vectorized NumPy operations. Times are
+usually numpy.datetime64 arrays, for which the arithmetic is done by NumPy.
+Arrays of datetime objects use NumPy object arrays, so the arithmetic is
+that of the datetime objects and the results are datetime objects.
+"""
+
+import datetime
+
+import numpy as np
+
+
+def warning(message):
+    print("\x1b[31mheatmap() warning: \x1b[0m" + message)
+
+
+def iscategorical(x):
+    """True if x contains strings."""
+    return isinstance(x[0], np.character)
+
+
+def edges(c, coord='y'):
+    """Calculate bin edges given bin centers c.
+
+    If the separation of centers is constant, the edges are half-way
+    between centers and the first and last bins have the same width as the
+    others. Otherwise, the centers are used as lower edges and the upper
+    edge of the last bin is based on the separation of the last two
+    centers. A single center is given a bin of width 1 (2 seconds if it is
+    a datetime).
+    """
+
+    # TODO: Set bin width to 1 if y is not datetime.
+    # TODO: If datetime, guess cadence by inspecting and warn?
+
+    c = np.asarray(c)
+
+    if len(c) == 1:
+        # Put tick at center of bin; make bin have width = 1.
+        if type(c[0]) == datetime.datetime:
+            dt = datetime.timedelta(seconds=1.0)
+            return np.array([c[0]-dt, c[0]+dt])
+        if c.dtype.kind == 'M':
+            dt = np.timedelta64(1, 's')
+            return np.array([c[0]-dt, c[0]+dt])
+        return np.array([c[0]-0.5, c[0]+0.5])
+
+    dc = np.diff(c)
+    dcu = np.unique(dc)
+    if len(dcu) > 1:
+        warning(f'Only bin centers given for {coord} and bin separation distance is not constant. ' + \
+                 'Bin width assumed based on separation distance and data pickers will not work properly.')
+        return np.append(c, c[-1] + dc[-1])
+
+    e = np.append(c, c[-1] + dc[0])
+    return e - dcu[0]/2
+
+
+def centers(e, c):
+    """Return tick locations and labels for bins with edges e and centers c.
+
+    If the bin widths are not constant, edges() used the centers as lower
+    edges. The returned tick locations are then the middle of the bins and
+    the tick labels are the centers. Otherwise, c is returned with an empty
+    array of labels, which means the default labels are used.
+    """
+
+    de = np.diff(e)
+    if len(np.unique(de)) > 1:
+        # Labels are the values given as centers.
+        cl = np.copy(e)
+        # Midpoints cast to the type of e (as if assigned element-wise).
+        c = (e[0:-1] + de/2).astype(e.dtype, copy=False)
+    else:
+        # No adjustment needed. Indicate this with empty cl.
+        cl = np.array([])
+
+    return c, cl
+
+
+def boundaries(x, n, coord='y'):
+    """Return bin information for x, which has n bins.
+
+    Returns (x, xc, xedges, xcl, xlabels) where
+
+        x: bin edges if x has n values (centers) or x if x has n + 1 values
+           (edges) or is an (n, 2) array of [lower, upper] values.
+        xc: tick locations for centers or empty array if x is not centers
+        xedges: True if x was not centers
+        xcl: labels for xc or empty array if xc are labels (see centers())
+        xlabels: x if x contains strings (categories), otherwise None. In
+           this case, the centers are 0, 1, ..., n-1.
+    """
+
+    xlabels = None
+    xcl = None
+    if len(x.shape) == 1 and len(x) == n:
+        # Centers given. Calculate edges.
+        if iscategorical(x):
+            xlabels = x
+            x = np.linspace(0, x.shape[0]-1, x.shape[0], dtype='int32')
+        xedges = False
+        xc = x
+        x = edges(x, coord)
+        xc, xcl = centers(x, xc)
+    else:
+        xc = np.array([])
+        xedges = True
+
+    return x, xc, xedges, xcl, xlabels
+
+
+def gaps(e, z, axis=0):
+    """Insert NaNs in z where bins with edges e are not contiguous.
+
+    e is an (N, 2) array of [lower, upper] bin edges and z has N elements
+    along axis. Returns (edges, z, igaps) where edges has M + 1 values for
+    the M >= N rows (axis=0) or columns (axis=1) of the returned z and
+    igaps has the indices of the rows or columns of NaNs. The returned z
+    is allocated once. If there are no gaps, z is returned unmodified.
+    """
+
+    e = np.asarray(e)
+    N = e.shape[0]
+
+    # Bin k is followed by a gap if its upper edge is not the lower edge of
+    # bin k + 1.
+    isgap = np.asarray(e[0:-1, 1] != e[1:, 0], dtype=bool)
+    ngaps = int(np.count_nonzero(isgap))
+
+    # Position of bin k in output is k plus the number of gaps before it.
+    pos = np.arange(N)
+    pos[1:] += np.cumsum(isgap)
+    igaps = np.asarray(pos[0:-1][isgap] + 1, dtype=np.int32)
+
+    M = N + ngaps
+    enew = np.empty(M + 1, dtype=e.dtype)
+    enew[pos] = e[:, 0]
+    enew[igaps] = e[0:-1, 1][isgap]
+    enew[M] = e[-1, 1]
+
+    if ngaps == 0:
+        return enew, z, igaps
+
+    if axis == 1:
+        z = np.transpose(z)
+
+    dtype = z.dtype if z.dtype.kind in 'fc' else np.float64
+    znew = np.full((M,) + z.shape[1:], np.nan, dtype=dtype)
+    znew[pos] = z
+
+    if axis == 1:
+        znew = np.transpose(znew)
+
+    return enew, znew, igaps
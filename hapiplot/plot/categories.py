@@ -0,0 +1,49 @@
+"""Integer codes for parameters with string values.
+
+A string parameter is plotted by giving each unique string (category) an
+integer code. The codes are computed from the strings as returned by the
+HAPI client, which are usually bytes, using a single np.unique() call
+instead of comparing the strings with each category. Only the categories,
+and not the data, are converted to str for use as tick labels.
+"""
+
+import numpy as np
+
+
+def encode(y, fill=None):
+    """Return integer codes and categories for an array of strings.
+
+    codes, categories, nfill = encode(y, fill=None)
+
+    categories are the sorted unique values of y as str and codes has the
+    shape of y with the index in categories of each value of y. codes has
+    the smallest unsigned integer type that can hold the codes.
+
+    If fill is given, values of y equal to fill are not categories and
+    their code is len(categories); nfill is the number of these values.
+    Use codes < len(categories) to select the other values.
+    """
+
+    y = np.asarray(y)
+    categories, codes = np.unique(y.ravel(), return_inverse=True)
+    codes = codes.reshape(y.shape)
+
+    nfill = 0
+    if fill is not None and categories.size > 0:
+        if isinstance(fill, str) and categories.dtype.kind == 'S':
+            fill = fill.encode('utf-8')
+        k = np.searchsorted(categories, fill)
+        if k < categories.size and categories[k] == fill:
+            # Move fill to the end so that other codes are 0, ..., K-1.
+            isfill = codes == k
+            nfill = int(np.count_nonzero(isfill))
+            codes[codes > k] -= 1
+            codes[isfill] = categories.size - 1
+            categories = np.delete(categories, k)
+
+    codes = codes.astype(np.min_scalar_type(max(categories.size, 1)), copy=False)
+
+    if categories.dtype.kind == 'S':
+        categories = np.char.decode(categories, 'utf-8')
+
+    return codes, categories, nfill
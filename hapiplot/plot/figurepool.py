@@ -0,0 +1,159 @@
+import threading
+
+# Prefixes of rc parameters read when a figure and its axes are created.
+# Some are not read again by Axes.cla(), so figures are only reused if
+# these are the same as when they were created.
+_figurerc = ('figure.', 'axes.', 'xtick.', 'ytick.', 'grid.', 'font.', 'text.')
+
+_pool = None
+_poollock = threading.Lock()
+
+
+def figurepool():
+    """Return the FigurePool used by hapiplot(..., figurepool=True)."""
+
+    global _pool
+    with _poollock:
+        if _pool is None:
+            _pool = FigurePool()
+    return _pool
+
+
+class FigurePool:
+    """Pool of Agg figures for timeseries() and heatmap() with returnimage=True.
+
+    acquire() returns a figure with an Agg canvas and one axes created with
+    add_subplot(111), the same as a new figure. Figures given to release()
+    are kept with their axes, which are reset with cla() by acquire(), so
+    that the figure, canvas, Agg renderer (which holds the pixel buffer),
+    axes, and axis, tick, and spine objects are re-used by the next
+    acquire() with the same key instead of being created again. For heatmaps, the
+    colorbar axes are also kept and reset and are available as
+    fig._hapiplot_cax for use with fig.colorbar(..., cax=...). Other
+    axes and artists added to the figure are removed. The key is the plot
+    kind ('timeseries' or 'heatmap'), the figure size and dpi, whether
+    constrained layout is used, and the figure, axes, tick, grid, font, and
+    text rc parameters, which are read when a figure and its axes are
+    created.
+
+    At most maxsize figures are kept for each key. Additional figures passed
+    to release() are discarded.
+
+    Example
+    -------
+        >>> from hapiplot.plot.figurepool import figurepool
+        >>> pool = figurepool()
+        >>> # After hapiplot(..., returnimage=True, figurepool=True) calls
+        >>> pool.stats()
+        {'size': 2, 'keys': 2, 'acquired': 10, 'hits': 8, 'misses': 2,
+         'hitrate': 0.8, 'released': 10, 'discarded': 0, 'maxsize': 4}
+    """
+
+    def __init__(self, maxsize=4):
+
+        self.maxsize = maxsize
+        self._figures = {}
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0, 'released': 0, 'discarded': 0}
+
+    def _key(self, kind, figsize, constrained):
+
+        import matplotlib
+
+        rc = matplotlib.rcParams
+        if figsize is None:
+            figsize = rc['figure.figsize']
+        return (kind, tuple(figsize), rc['figure.dpi'], constrained) \
+                + tuple(str(rc[key]) for key in rc if key.startswith(_figurerc))
+
+    def acquire(self, kind, figsize=None, constrained=None):
+        """Return figure with Agg canvas and one axes, fig.axes[0].
+
+        figsize and constrained are passed to Figure() as figsize and
+        constrained_layout. Must be called with the rcParams used for
+        plotting in effect.
+        """
+
+        key = self._key(kind, figsize, constrained)
+        with self._lock:
+            figures = self._figures.get(key, [])
+            fig = figures.pop() if len(figures) > 0 else None
+            if fig is None:
+                self._counts['misses'] += 1
+            else:
+                self._counts['hits'] += 1
+
+        if fig is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+            fig = Figure(figsize=figsize, constrained_layout=constrained)
+            # Attach canvas to fig, which is needed by datetick and hapiplot.
+            FigureCanvas(fig)
+            fig._hapiplot_pool = (self, key)
+            fig._hapiplot_cax = None
+            fig.add_subplot(111)
+        else:
+            # cla() reads rcParams, so it is called here and not when the
+            # figure is released.
+            fig.axes[0].cla()
+            if fig._hapiplot_cax is not None:
+                fig._hapiplot_cax.cla()
+
+        return fig
+
+    def release(self, fig):
+        """Return figure obtained from acquire() to pool."""
+
+        pool, key = getattr(fig, '_hapiplot_pool', (None, None))
+        if pool is not self:
+            raise ValueError('Figure was not obtained from this FigurePool.')
+
+        # Keep axes and colorbar axes, which are reset by acquire(), remove
+        # other axes and figure legends and artists, and undo changes made
+        # by timeseries() and heatmap().
+        cb = getattr(fig, '_hapiplot_colorbar', None)
+        cax = None if cb is None else cb.ax
+        for a in fig.axes[1:]:
+            if a is not cax:
+                a.remove()
+        for artist in fig.legends + fig.texts + fig.lines + fig.patches \
+                      + fig.images + fig.artists:
+            artist.remove()
+        fig._hapiplot_cax = cax
+        fig.patch.set_alpha(None)
+        for attr in ['_hapiplot_layout', '_hapiplot_colorbar']:
+            if hasattr(fig, attr):
+                delattr(fig, attr)
+
+        with self._lock:
+            self._counts['released'] += 1
+            figures = self._figures.setdefault(key, [])
+            if any(f is fig for f in figures):
+                return
+            if len(figures) >= self.maxsize:
+                self._counts['discarded'] += 1
+                return
+            figures.append(fig)
+
+    def clear(self):
+        """Discard all figures in pool."""
+        with self._lock:
+            self._figures = {}
+
+    def stats(self):
+        """Return dict with number of figures in pool, number of keys, and
+        counts of acquire() hits and misses and release() calls."""
+
+        with self._lock:
+            stats = dict(self._counts)
+            stats['size'] = sum(len(f) for f in self._figures.values())
+            stats['keys'] = len([f for f in self._figures.values() if len(f) > 0])
+            stats['maxsize'] = self.maxsize
+
+        stats['acquired'] = stats['hits'] + stats['misses']
+        if stats['acquired'] > 0:
+            stats['hitrate'] = stats['hits']/stats['acquired']
+        else:
+            stats['hitrate'] = 0.0
+
+        return stats
@@ -1,4 +1,3 @@
-import datetime
 import warnings
 import numpy as np
 
@@ -6,13 +5,285 @@ import matplotlib
 from matplotlib import colors
 from matplotlib.patches import Patch
 from matplotlib.colors import LogNorm
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import QuadMesh
+from matplotlib.image import PcolorImage
+from matplotlib.transforms import IdentityTransform
 from matplotlib import rc_context
 
-from datetick import datetick
+from hapiplot.plot.util import hidden, datetick, registerconverters, colormaps, getcmap, Stages
+from hapiplot.plot import bins
+from hapiplot.plot.bins import iscategorical
+from hapiplot.times import isdatetime, isoformat
+
+
+def rebin(edges, z, n, axis, method='nanmean', gaps=None, log=False):
+    """Reduce z along axis so that no more than about n cells are drawn.
+
+    edges, z, gaps = rebin(edges, z, n, axis)
+
+    edges has length z.shape[axis] + 1 and may be numbers, datetimes, or
+    numpy.datetime64 values. Adjacent cells are combined when their lower
+    edges fall in the same of n equal-width columns spanning the edges, so
+    cells that are wider than a column are not changed. If log=True, the
+    columns have equal width on a log scale.
+
+    method is one of 'mean', 'max', 'min', 'nanmean', 'nanmax', or 'nanmin'.
+    The nan* methods ignore NaNs; the others return NaN for a combined
+    cell if any of its cells are NaN.
+
+    gaps are the indices of cells along axis that are data gaps (see
+    heatmap()). A combined cell is a gap if all of its cells are gaps.
+
+    If edges are not increasing, the inputs are returned unchanged.
+    """
+
+    methods = ['mean', 'max', 'min', 'nanmean', 'nanmax', 'nanmin']
+    if method not in methods:
+        raise ValueError('method must be one of ' + str(methods))
+
+    if gaps is None:
+        gaps = np.array([], dtype=np.int32)
+
+    u = np.asarray(edges)
+    if u.dtype.kind in 'OM':
+        from matplotlib.dates import date2num
+        u = date2num(u)
+    u = u.astype(np.float64)
+    if log and np.all(u > 0):
+        u = np.log10(u)
+
+    M = u.size - 1
+    if M <= n or not np.all(np.diff(u) > 0):
+        return edges, z, gaps
+
+    # Column of lower edge of each cell and index of first cell in each group.
+    col = np.floor((u[:-1] - u[0])*(n/(u[-1] - u[0])))
+    starts = np.flatnonzero(np.diff(col, prepend=-1))
+    if starts.size == M:
+        return edges, z, gaps
+
+    edges = np.asarray(edges)[np.append(starts, M)]
+
+    if method in ['max', 'min', 'nanmax', 'nanmin']:
+        ufunc = {'max': np.maximum, 'min': np.minimum,
+                 'nanmax': np.fmax, 'nanmin': np.fmin}[method]
+        z = ufunc.reduceat(z, starts, axis=axis)
+    elif method == 'mean':
+        counts = np.diff(np.append(starts, M))
+        shape = [1, 1]
+        shape[axis] = counts.size
+        z = np.add.reduceat(z, starts, axis=axis)/counts.reshape(shape)
+    else:
+        finite = ~np.isnan(z)
+        counts = np.add.reduceat(finite, starts, axis=axis)
+        z = np.add.reduceat(np.where(finite, z, 0), starts, axis=axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = z/counts
+
+    isgap = np.zeros(M, dtype=bool)
+    isgap[gaps] = True
+    gaps = np.flatnonzero(np.logical_and.reduceat(isgap, starts)).astype(np.int32)
+
+    return edges, z, gaps
+
+
+def cellcolors(z, tiles, mappable=None):
+    """Return (index, lut), where lut[index] are the RGBA colors of the cells of z.
+
+    Cells are colored using mappable.to_rgba(z) or are transparent if
+    mappable is None. tiles is a list of (cells, facecolor) for cells that
+    are not colored using mappable (gaps, NaNs, and zeros when logz=True).
+    cells is an index into z or a function that returns a boolean mask given
+    z, so masks are only created while they are used. Cells in later tiles
+    are colored over those in earlier tiles.
+
+    index is a small integer array with the shape of z and lut is an (n, 4)
+    array of RGBA values, so colors are not expanded to a (z.size, 4) array.
+    Cells colored using mappable have the same colors as mappable.to_rgba(z).
+    """
+
+    if mappable is None:
+        index = np.zeros(z.shape, dtype=np.int16)
+        lut = [(0., 0., 0., 0.)]
+    else:
+        # Same as Colormap.__call__() with the colormap's colors followed by
+        # its under, over, and bad colors. norm(z) is the only array with
+        # the size of z that is created.
+        cmap = mappable.get_cmap()
+        N = cmap.N
+        lut = list(cmap(np.arange(N))) \
+              + [cmap.get_under(), cmap.get_over(), cmap.get_bad()]
+        xn = mappable.norm(z)
+        bad = np.ma.getmask(xn)
+        xn = np.ma.getdata(xn)
+        xn *= N
+        xn[xn == N] = N - 1
+        np.floor(xn, out=xn)
+        np.clip(xn, -1, N, out=xn)
+        xn[xn == N] = N + 1
+        xn[xn == -1] = N
+        if bad is not np.ma.nomask:
+            xn[bad] = N + 2
+        xn[np.isnan(xn)] = N + 2
+        index = xn.astype(np.int16 if len(lut) + len(tiles) < 2**15 else np.int32)
+        del xn
+
+    for cells, facecolor in tiles:
+        if callable(cells):
+            cells = cells(z)
+        index[cells] = len(lut)
+        lut.append(facecolor)
+
+    return index, np.array(lut, dtype=np.float64)
+
+
+class MeshImage(PcolorImage):
+    """Image of cells with non-uniform edges drawn as pcolormesh() draws them.
+
+    pcolorfast() with non-uniform edges returns a PcolorImage, which spreads
+    the view limits over the axes bounding box rounded to pixels, so its cell
+    boundaries can be a pixel away from those of a QuadMesh. Here, each pixel
+    has the color of the cell that contains the pixel's center in the axes
+    transform, which is what a QuadMesh without antialiasing draws.
+
+    Only the public set_data(), changed(), and make_image() methods of
+    PcolorImage are overridden. If they differ in the installed Matplotlib,
+    MESHIMAGE is False and drawmesh() uses pcolormesh() instead.
+    """
+
+    def set_data(self, x, y, A):
+        super().set_data(x, y, A)
+        self._edges = (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        self._padded = None
+
+    def changed(self):
+        self._padded = None
+        super().changed()
+
+    def make_image(self, renderer, magnification=1.0, unsampled=False):
+
+        if unsampled:
+            raise ValueError('unsampled not supported on MeshImage')
+
+        if self._padded is None:
+            # Transparent cells for pixels outside of the edges.
+            A = self.to_rgba(self.get_array(), bytes=True)
+            self._padded = np.pad(A, [(1, 1), (1, 1), (0, 0)], 'constant')
+        padded = self._padded
+
+        l, b, r, t = self.axes.bbox.extents*magnification
+        l, b = int(np.floor(l)), int(np.floor(b))
+        r, t = int(np.ceil(r)), int(np.ceil(t))
+
+        x, y = self._edges
+        trans = self.axes.transData
+        xe = trans.transform(np.column_stack((x, np.zeros(x.size))))[:, 0]
+        ye = trans.transform(np.column_stack((np.zeros(y.size), y)))[:, 1]
+
+        def cell(e, centers):
+            # Index of cell in padded image that contains each pixel center.
+            e = e*magnification
+            if e[-1] < e[0]:
+                # Inverted axis
+                return e.size - np.searchsorted(e[::-1], centers, side='left')
+            return np.searchsorted(e, centers, side='right')
+
+        ix = cell(xe, np.arange(l, r) + 0.5)
+        iy = cell(ye, np.arange(b, t) + 0.5)
+        im = (padded.view(np.uint32).ravel()[np.add.outer(iy*padded.shape[1], ix)]
+              .view(np.uint8).reshape((t - b, r - l, 4)))
+        return im, l/magnification, b/magnification, IdentityTransform()
+
+
+def _meshimage():
+    """True if PcolorImage has the methods overridden by MeshImage."""
+
+    import inspect
+
+    try:
+        return list(inspect.signature(PcolorImage.set_data).parameters) == ['self', 'x', 'y', 'A'] \
+            and list(inspect.signature(PcolorImage.make_image).parameters) \
+                == ['self', 'renderer', 'magnification', 'unsampled'] \
+            and callable(getattr(PcolorImage, 'changed', None))
+    except (TypeError, ValueError):
+        return False
+
+
+MESHIMAGE = _meshimage()
+
+
+def meshtype(ax, x, y, image=True):
+    """Return the type of artist drawmesh() draws for edges x and y.
+
+    Returns 'image' (AxesImage), 'meshimage' (MeshImage), or 'quadmesh'
+    (QuadMesh). Also updates the units of the axes for x and y.
+    """
+
+    if not image:
+        return 'quadmesh'
+
+    xn = np.asarray(ax.xaxis.convert_units(x) if ax.xaxis.update_units(x) else x, dtype=np.float64)
+    yn = np.asarray(ax.yaxis.convert_units(y) if ax.yaxis.update_units(y) else y, dtype=np.float64)
+    if not (np.all(np.diff(xn) > 0) and np.all(np.diff(yn) > 0)):
+        return 'quadmesh'
+
+    def uniform(e, tol):
+        # Uniform if no edge differs from that of equal-width cells by more
+        # than tol of a cell width. pcolorfast() allows a 1% difference in
+        # widths, which can shift cells by many widths when there are many.
+        de = np.diff(e)
+        return np.max(np.abs(e - np.linspace(e[0], e[-1], e.size))) <= tol*de.mean()
+
+    if uniform(xn, 1e-3) and uniform(yn, 1e-3):
+        return 'image'
+    if MESHIMAGE:
+        return 'meshimage'
+    return 'quadmesh'
+
+
+def drawmesh(ax, x, y, c, image=True, **kwargs):
+    """Draw cells with edges x and y and values or RGBA colors c.
+
+    If image=True and the edges are increasing, an image is drawn: an
+    AxesImage (as imshow() does) if the edges are uniform and a MeshImage
+    otherwise (a QuadMesh if MESHIMAGE is False). Images are much faster to create and draw than the QuadMesh
+    that pcolormesh() returns, which is used if image=False or the edges are
+    not increasing, and have the same pixels. Images do not support edge
+    colors or log axis scales. The data limits are set as pcolormesh()
+    would. See meshtype().
+
+    Keywords are passed to pcolormesh() or, other than edgecolor and
+    rasterized, to the image.
+    """
+
+    kind = meshtype(ax, x, y, image=image)
+    if kind == 'quadmesh':
+        return ax.pcolormesh(x, y, c, **kwargs)
+
+    kwargs.pop('edgecolor', None)
+    kwargs.pop('rasterized', None)
+    xn = np.asarray(ax.xaxis.convert_units(x), dtype=np.float64)
+    yn = np.asarray(ax.yaxis.convert_units(y), dtype=np.float64)
+
+    if kind == 'image':
+        return ax.pcolorfast(xn[[0, -1]], yn[[0, -1]], c, **kwargs)
+
+    # As pcolorfast() does for a PcolorImage.
+    im = MeshImage(ax, xn, yn, c, extent=(xn[0], xn[-1], yn[0], yn[-1]), **kwargs)
+    ax.add_image(im)
+    if np.ndim(c) == 2:
+        im.autoscale_None()
+    im.set_clip_path(ax.patch)
+    im.sticky_edges.x[:] = [xn[0], xn[-1]]
+    im.sticky_edges.y[:] = [yn[0], yn[-1]]
+    ax.update_datalim(np.array([[xn[0], yn[0]], [xn[-1], yn[-1]]]))
+    ax.autoscale_view()
+    return im
 
 
 def heatmap(x, y, z, **kwargs):
-    """Plot a heatmap using pcolormesh and do typical configuration.
+    """Plot a heatmap using an image or pcolormesh and do typical configuration.
 
     plt, fig, canvas, ax, im, cb = heatmap(x, y, z, **kwargs)
 
@@ -37,6 +308,10 @@ def heatmap(x, y, z, **kwargs):
 
     The same logic is applied to y if y.shape = (z.shape[0], 2).
 
+    If edgecolor is None, no hatch is used, and the axes are not log scale,
+    cells are drawn as an image when the edges are increasing (see
+    drawmesh()); otherwise pcolormesh is used.
+
     kwargs:
 
         Axes
@@ -86,138 +361,36 @@ def heatmap(x, y, z, **kwargs):
         * nan.hatch
         * nan.hatch.color
         * nan.legend - Show legend entry for nans (True by default and if NaNs)
+
+        Rebinning
+        ---------
+        * rebin - ['nanmean'] If the number of cells along x or y is larger
+          than the number of pixels in the figure, adjacent cells that are
+          in the same pixel are combined using this method. See `rebin()`
+          for the other methods. Set to False to draw all cells.
+
+        * info - [None] If a dict, `info['rebin']` is set to a dict with the
+          method and the shape of z before and after rebinning. If info has
+          a 'stats' dict, the durations of the rebin, draw, and datetick
+          stages are added to `info['stats']['timing']` and the number of
+          cells plotted is `info['stats']['points_plotted']`.
+
+        Figure reuse
+        ------------
+        * figure - [None] A figure returned by a previous call with
+          returnimage=True. If the figure would differ only in the
+          values of z and the range of x, its heatmap is replaced and it is
+          returned instead of creating a new figure. Otherwise, a new figure
+          is created.
+        * figurepool - [None] A FigurePool (see hapiplot.plot.figurepool) to
+          get a new figure from when returnimage=True. Release the figure to
+          the pool with figurepool.release(fig) after it is no longer used.
     """
 
     ###########################################################################
     def warning(message):
         print("\x1b[31mheatmap() warning: \x1b[0m" + message)
 
-    def calcEdges(y, coord):
-        """Caclulate bin ranges given bin centers."""
-
-        # TODO: Set bin width to 1 if y is not datetime.
-        # TODO: If datetime, guess cadence by inspecting and warn?
-
-        if len(y) == 1:
-            # Put tick at center of bin; make bin have width = 1.
-            if type(y[0]) == datetime.datetime:
-                dt = datetime.timedelta(seconds=1.0)
-                y = np.array([y[0]-dt,y[0]+dt])
-            else:
-                y = np.array([y[0]-0.5,y[0]+0.5])
-        else:
-            # y are bin centers
-            dy = np.diff(y)
-            dyu = np.unique(dy)
-            if len(dyu) > 1:
-                warning(f'Only bin centers given for {coord} and bin separation distance is not constant. ' + \
-                         'Bin width assumed based on separation distance and data pickers will not work properly.')
-                y = np.append(y, y[-1] + dy[-1])
-            else:
-                y = np.append(y, y[-1] + dy[0])
-                y = y-dyu[0]/2
-
-        return y
-
-    def calcGaps(y, z, coord):
-
-        if coord == 'x':
-            z = np.transpose(z)
-
-        havegaps = False
-        Igaps = []
-        ynew = []
-        for k in range(0, len(y)-1):
-            ynew.append(y[k][0])
-            if y[k][1] != y[k+1][0]:
-                havegaps = True
-                break
-        if len(y) == 1:
-            ynew.append(y[0][0])
-            ynew.append(y[0][1])
-            y = ynew
-        elif not havegaps:
-            # Set top-most two bin edges.
-            ynew.append(y[k+1][0])
-            ynew.append(y[k+1][1])
-            y = ynew
-        else:
-            # Insert NaN rows where gaps
-            znew = z[0,:]
-            nanrow = np.nan*z[0,:]
-
-            ynew = []
-            ynew.append(y[0][0])
-            if y[0][1] != y[1][0]: # Gap between bins
-                ynew.append(y[0][1])
-                znew = np.vstack((znew, nanrow))
-                Igaps.append(1)
-
-            for k in range(1, len(y)-1):
-                ynew.append(y[k][0])
-                znew = np.vstack((znew, z[k,:]))
-                if y[k][1] != y[k+1][0]: # Gap between bins
-                    ynew.append(y[k][1])
-                    #print('inserting nan row or column')
-                    znew = np.vstack((znew, nanrow))
-                    Igaps.append(znew.shape[0]-1)
-
-            # Set top-most two bin edges
-            ynew.append(y[k+1][0])
-            ynew.append(y[k+1][1])
-            znew = np.vstack((znew, z[k+1,:]))
-
-            z = znew
-
-        Igaps = np.asarray(Igaps, dtype=np.int32)
-        y = np.array(ynew)
-
-        if coord == 'x':
-            z = np.transpose(z)
-
-        return y, z, Igaps
-
-    def adjustCenters(y, yc):
-        # Adjusts centers and their labels if nonuniform diff(y)
-        dy = np.diff(y)
-        dyu = np.unique(dy)
-        if len(dyu) > 1:
-            # If centers not uniform, they were used as lower edges.
-            # Need to adjust center location for ticks and labels.
-            ycl = np.copy(y) # y center labels
-            yc = np.copy(y[0:-1])
-            for i in range(0, y.shape[0]-1):
-                yc[i] = y[i] + (y[i+1]-y[i])/2
-        else:
-            # No adjustment needed. Indicate this with empty ycl.
-            ycl = np.array([])
-
-        return yc, ycl
-
-    def boundaryInfo(x, coord):
-        xlabels = None
-        xcl = None
-        N = Nx
-        if coord == "y":
-            N = Ny
-        if len(x.shape) == 1 and len(x) == N:
-            # Centers given. Calculate edges.
-            if iscategorical(x):
-                xlabels = x
-                x = np.linspace(0, x.shape[0]-1, x.shape[0], dtype='int32')
-            xedges = False
-            xc = x
-            x = calcEdges(x, coord)
-            xc, xcl = adjustCenters(x, xc)
-        else:
-            xc = np.array([])
-            xedges = True
-
-        return x, xc, xedges, xcl, xlabels
-
-    def iscategorical(x):
-        return isinstance(x[0], np.character)
-
     def categoryinfo(x):
         if len(x.shape) > 1:
             raise ValueError('If x contains characters, it must have one column or one row.')
@@ -269,7 +442,11 @@ def heatmap(x, y, z, **kwargs):
                 'logz0.alpha': 1,
                 'logz0.hatch': '',
                 'logz0.hatch.color': [0.95,0.95,0.95],
-                'logz0.legend': True
+                'logz0.legend': True,
+                'rebin': 'nanmean',
+                'info': None,
+                'figure': None,
+                'figurepool': None
             }
 
     for key, value in kwargs.items():
@@ -278,6 +455,13 @@ def heatmap(x, y, z, **kwargs):
         else:
             warnings.warn('Warning: Ignoring invalid keyword option "%s".' % key, SyntaxWarning)
 
+    registerconverters()
+
+    # datetick() sets callbacks that update the ticks on zoom if the backend
+    # is interactive. Finding the backend imports pyplot, which is not needed
+    # when returnimage=True.
+    setcb = not opts['returnimage']
+
     if opts['returnimage']:
         # When returnimage=True, the Matplotlib OO API is used b/c it is thread safe.
         # Otherwise, the pyplot API is used. Ideally would always use the OO API,
@@ -295,27 +479,17 @@ def heatmap(x, y, z, **kwargs):
 
     from matplotlib.ticker import MaxNLocator
 
-    if not opts['cmap.name'] in matplotlib.pyplot.colormaps():
+    if not opts['cmap.name'] in colormaps():
         warning('colormap name "'
                 + opts['cmap.name']
                 + '" is not in list of known names: '
-                + str(matplotlib.pyplot.colormaps())
+                + str(colormaps())
                 + ". Using 'viridis'.")
         opts['cmap.name'] = 'viridis'
 
     if not opts['cmap']:
-        opts['cmap'] = matplotlib.pyplot.get_cmap(\
-                        opts['cmap.name'], opts['cmap.numcolors'])
+        opts['cmap'] = getcmap(opts['cmap.name'], opts['cmap.numcolors'])
 
-    if opts['returnimage']:
-        fig = Figure()
-        # Calling FigureCanvas() attaches canvas to fig which is used later.
-        FigureCanvas(fig) 
-        ax = fig.add_subplot(111)
-    else:
-        fig, ax = plt.subplots()
-        if opts['logging']:
-            print("timeseries(): Using Matplotlib back-end " + matplotlib.get_backend())
 
     if type(x) == list:
         x = np.array(x)
@@ -351,40 +525,112 @@ def heatmap(x, y, z, **kwargs):
     if y.ndim == 1 and not (len(y) == Ny or len(y) == Ny+1):
         raise ValueError('Required: len(y) == z.shape[0] or len(y) == z.shape[0] + 1.')
 
-    inan = np.where(np.isnan(z))
-    havenans = False
-    allnan = False
-    if np.any(inan) > 0:
-        havenans = True
-    if np.all(np.isnan(z)):
-        allnan = True
+    havenans = bool(np.any(np.isnan(z)))
+    allnan = bool(np.all(np.isnan(z)))
 
-    if len(x) == 1 and type(x[0]) == datetime.datetime:
+    if len(x) == 1 and isdatetime(x[0]):
         # If single time value, we only want a tick value at that time.
-        stv = x[0].isoformat().replace("+00:00","Z")
-        x = np.array([stv])
+        x = np.array([isoformat(x[0])])
 
-    if len(y) == 1 and type(y[0]) == datetime.datetime:
+    if len(y) == 1 and isdatetime(y[0]):
         # If single time value, we only want a tick value at that time.
-        stv = y[0].isoformat().replace("+00:00","Z")
-        y = np.array([stv])
+        y = np.array([isoformat(y[0])])
 
     categoricalx = iscategorical(x)
-    x, xc, xedges, xcl, xlabels = boundaryInfo(x,'x')
+    x, xc, xedges, xcl, xlabels = bins.boundaries(x, Nx, 'x')
 
     categoricaly = iscategorical(y)
-    y, yc, yedges, ycl, ylabels = boundaryInfo(y,'y')
+    y, yc, yedges, ycl, ylabels = bins.boundaries(y, Ny, 'y')
 
     xgaps = np.array([], dtype=np.int32)
     if len(x.shape) == 2: # x is an matrix
-        x, z, xgaps = calcGaps(x, z, 'x')
+        x, z, xgaps = bins.gaps(x, z, axis=1)
 
     ygaps = np.array([], dtype=np.int32)
     if len(y.shape) == 2: # y is an matrix
-        y, z, ygaps = calcGaps(y, z, 'y')
+        y, z, ygaps = bins.gaps(y, z, axis=0)
+
+    stats = None
+    if isinstance(opts['info'], dict):
+        stats = opts['info'].get('stats', None)
+    stages = Stages(stats)
+
+    rebinned = {'method': None, 'shape': z.shape, 'shape_plotted': z.shape}
+    if opts['rebin'] and z.ndim == 2:
+        # Number of pixels in figure. Using figure instead of axes size means
+        # that no more than one cell is drawn per pixel.
+        dpi = matplotlib.rcParams['figure.dpi']
+        if matplotlib.rcParams['savefig.dpi'] != 'figure':
+            dpi = max(dpi, matplotlib.rcParams['savefig.dpi'])
+        width, height = matplotlib.rcParams['figure.figsize']
+        z0 = z
+        if not categoricalx and x.ndim == 1:
+            x, z, xgaps = rebin(x, z, int(np.ceil(width*dpi)), 1,
+                                method=opts['rebin'], gaps=xgaps, log=opts['logx'])
+        if not categoricaly and y.ndim == 1:
+            y, z, ygaps = rebin(y, z, int(np.ceil(height*dpi)), 0,
+                                method=opts['rebin'], gaps=ygaps, log=opts['logy'])
+        if z.shape != z0.shape:
+            rebinned = {'method': opts['rebin'], 'shape': z0.shape, 'shape_plotted': z.shape}
+            if z.dtype.kind == 'f' and allint(z0):
+                # Keep integer values so that colorbar has one color per value.
+                np.rint(z, out=z)
+            # Cells can become NaN, e.g., with method='max'. NaNs in the
+            # rows and columns of gaps are not counted.
+            isnan = np.isnan(z)
+            isnan[:,xgaps] = False
+            isnan[ygaps,:] = False
+            havenans = bool(np.any(isnan))
+            del isnan
+    if isinstance(opts['info'], dict):
+        opts['info']['rebin'] = rebinned
+    if stats is not None:
+        stats['points_plotted'] = int(z.size)
+    stages.lap('rebin')
+
+    # Everything that determines the figure other than z and the range of x.
+    # Only the case of a single heatmap and colorbar is handled.
+    ycopy = tuple(y.ravel())
+    layout = (type(x[0]), x.ndim, len(xgaps), len(ygaps), ycopy, tuple(yc),
+              None if ycl is None else tuple(ycl), xc.size > 10 or xc.size == 0,
+              x.size > 10, categoricalx, categoricaly, iscategorical(z),
+              opts['title'], opts['xlabel'], opts['ylabel'], opts['zlabel'],
+              opts['ztitle'], opts['logx'], opts['logy'], opts['logz'],
+              opts['edgecolor'], opts['cmap.name'], str(opts['cmap.clim']),
+              opts['transparent'], 'cmap' in kwargs)
+    reuse = opts['returnimage'] and opts['figure'] is not None \
+            and getattr(opts['figure'], '_hapiplot_layout', None) == layout \
+            and not havenans and len(xgaps) == 0 and len(ygaps) == 0 \
+            and not opts['logz'] and not categoricalx and not categoricaly \
+            and not iscategorical(z)
+
+    if reuse:
+        fig = opts['figure']
+        ax = fig.axes[0]
+        cb = fig._hapiplot_colorbar
+        (ax.images + ax.collections)[0].remove()
+        # Next drawmesh() call sets data limits.
+        ax.ignore_existing_data_limits = True
+    elif opts['returnimage'] and opts['figurepool'] is not None:
+        fig = opts['figurepool'].acquire('heatmap')
+        ax = fig.axes[0]
+        if fig._hapiplot_cax is not None and allnan:
+            # No colorbar, so remove colorbar axes kept by pool.
+            fig._hapiplot_cax.remove()
+            fig._hapiplot_cax = None
+    elif opts['returnimage']:
+        fig = Figure()
+        # Calling FigureCanvas() attaches canvas to fig which is used later.
+        FigureCanvas(fig) 
+        ax = fig.add_subplot(111)
+    else:
+        fig, ax = plt.subplots()
+        if opts['logging']:
+            print("timeseries(): Using Matplotlib back-end " + matplotlib.get_backend())
+    fig._hapiplot_layout = layout
 
     legendh = []
-    havegaps = False
+    havegaps = len(xgaps) > 0 or len(ygaps) > 0
 
     rasterized = False
     if z.size > 50000:
@@ -392,25 +638,33 @@ def heatmap(x, y, z, **kwargs):
         # was created that was not viewable in Chrome or Firefox.
         rasterized = True
 
+    # Gap, NaN, and logz0 cells are drawn with the data as one QuadMesh or
+    # image that has a color for each cell (see cellcolors()) instead of a
+    # pcolormesh for each. tiles has (cells, facecolor) for each type of
+    # cell. pcolormesh does not support hatch, so cells with a hatch are
+    # drawn using pcolor() and are transparent in the QuadMesh or image.
+    tiles = []
+    mesh = None
+    nanedgecolor = None
 
-    if len(xgaps) > 0 or len(ygaps) > 0:
-        havegaps = True
-        cmapg = colors.LinearSegmentedColormap.from_list('gap',[opts['gap.color'],opts['gap.color']],2)
-        zg = np.nan*np.copy(z)
-        if len(xgaps) > 0:
-            zg[:,xgaps] = 1
-        if len(ygaps) > 0:
-            zg[ygaps,:] = 1
-
+    if havegaps:
         if opts['gap.hatch'] == '':
-            im = ax.pcolormesh(x, y, zg, cmap=cmapg, rasterized=rasterized)
+            # Added after NaN tile (below) so gap color is used for gaps.
+            gaptiles = [(np.s_[:, xgaps], colors.to_rgba(opts['gap.color'], opts['gap.alpha'])),
+                        (np.s_[ygaps, :], colors.to_rgba(opts['gap.color'], opts['gap.alpha']))]
         else:
-            # pcolormesh does not support hatch
+            gaptiles = []
+            isgap = np.zeros(z.shape, dtype=bool)
+            if len(xgaps) > 0:
+                isgap[:,xgaps] = True
+            if len(ygaps) > 0:
+                isgap[ygaps,:] = True
             # TODO: Must set hatch.color through rc params and context manager.
             # opts['nan.hatch.color']
             # https://stackoverflow.com/a/42672782/1491619
+            cmapg = colors.LinearSegmentedColormap.from_list('gap',[opts['gap.color'],opts['gap.color']],2)
             with rc_context(rc={'hatch.color': opts['gap.hatch.color']}):
-                im = ax.pcolor(x, y, zg, cmap=cmapg, hatch=opts['gap.hatch'])
+                im = ax.pcolor(x, y, np.where(isgap, 1, np.nan), cmap=cmapg, hatch=opts['gap.hatch'])
         if opts['gap.legend']:
             with rc_context(rc={'hatch.color': opts['gap.hatch.color']}):
                 legendh.append(Patch(facecolor=opts['gap.color'],
@@ -421,25 +675,47 @@ def heatmap(x, y, z, **kwargs):
         edgecolor = opts['edgecolor']
         if allnan and edgecolor is None:
             edgecolor = 'k'
-        cmapn = colors.LinearSegmentedColormap.from_list('nan',[opts['nan.color'],opts['nan.color']],2)
-        zn = np.nan*np.copy(z)
-        if havegaps:
-            inan = np.where(np.logical_and(np.isnan(z),zg != 1))
-        zn[inan] = 1
 
         if opts['nan.hatch'] == '':
-            im = ax.pcolormesh(x, y, zn, edgecolor=edgecolor, cmap=cmapn,
-                               rasterized=rasterized)
+            tiles.append((np.isnan, colors.to_rgba(opts['nan.color'], opts['nan.alpha'])))
+            if allnan:
+                # If not allnan, edges are drawn for all cells (see below).
+                nanedgecolor = edgecolor
         else:
+            isnan = np.isnan(z)
+            isnan[:,xgaps] = False
+            isnan[ygaps,:] = False
             # Must set hatch.color through rc params and context manager.
+            cmapn = colors.LinearSegmentedColormap.from_list('nan',[opts['nan.color'],opts['nan.color']],2)
             with rc_context(rc={'hatch.color': opts['nan.hatch.color']}):
-                im = ax.pcolor(x, y, zn, cmap=cmapn, edgecolor=edgecolor, hatch=opts['nan.hatch'])
+                im = ax.pcolor(x, y, np.where(isnan, 1, np.nan), cmap=cmapn,
+                               edgecolor=edgecolor, hatch=opts['nan.hatch'])
         if opts['nan.legend']:
             with rc_context(rc={'hatch.color': opts['nan.hatch.color']}):
                 legendh.append(Patch(facecolor=opts['nan.color'],
                                      hatch=opts['nan.hatch']+opts['nan.hatch'],
                                      edgecolor=edgecolor, label='NaN'))
 
+    if havegaps:
+        tiles.extend(gaptiles)
+
+    # Images are used to draw cells unless a cell needs an edge or hatch or
+    # an axis has a log scale (see drawmesh()).
+    image = opts['edgecolor'] is None and not allnan \
+            and not opts['logx'] and not opts['logy'] \
+            and not (havenans and opts['nan.hatch'] != '') \
+            and not (havegaps and opts['gap.hatch'] != '')
+
+    if len(tiles) > 0 or image:
+        # Colors are set after the colormap limits are known. The colors of
+        # an image are written into its RGBA array, which is created here.
+        kind = meshtype(ax, x, y, image=image)
+        c = z if kind == 'quadmesh' else np.zeros(z.shape + (4,), dtype=np.uint8)
+        mesh = drawmesh(ax, x, y, c, image=image, edgecolor=None if allnan else opts['edgecolor'],
+                        rasterized=rasterized if allnan else True)
+        del c
+        im = mesh
+
     #for spine in ax.spines.values(): spine.set_edgecolor(None)
 
     # TODO: Handle case where > 10.
@@ -541,18 +817,15 @@ def heatmap(x, y, z, **kwargs):
             if len(Ig) == 2 and not 'cmap.name' in kwargs:
                 # Binary. Plot black and white.
                 cmap_name = 'gray'
-            opts['cmap'] = matplotlib.pyplot.get_cmap(cmap_name, nc)
+            opts['cmap'] = getcmap(cmap_name, nc)
 
         zmin = np.nanmin(z)
         zmax = np.nanmax(z)
         if zmin < 0 and zmax > 0:
             warning('Colorbar cannot have log scale when all values do not have the same sign.')
 
-        havelogz0 = False
-        if not opts['logz']:
-            im = ax.pcolormesh(x, y, z, cmap=opts['cmap'],
-                               edgecolor=opts['edgecolor'], rasterized=True)
-        else:
+        norm = None
+        if opts['logz']:
             # Log scale emits warning if data have NaNs.
             warnings.filterwarnings(action='ignore',
                                 message='invalid value encountered in less_equal')
@@ -562,24 +835,39 @@ def heatmap(x, y, z, **kwargs):
                 flipsign = True
             if zmin == 0:
                 #warning('Log scale for z requested but min(z) = 0.')
-                havelogz0 = True
-                logz0idx = np.where(z==0)
-                z[z == 0] = np.nan
-                havelogz0 = True
-                zmin = np.nanmin(z)
-            norm = LogNorm(vmin=zmin, vmax=zmax)
-            im = ax.pcolormesh(x, y, z, cmap=opts['cmap'], norm=norm,
-                               edgecolor=opts['edgecolor'], rasterized=True)
-            if havelogz0:
-                cmapz = colors.LinearSegmentedColormap.from_list('logz0',[opts['logz0.color'],opts['logz0.color']],2)
-                z = np.nan*z
-                z[logz0idx] = 1
-                ax.pcolormesh(x, y, z, cmap=cmapz, rasterized=True)
+                tiles.append((lambda z: z == 0, colors.to_rgba(opts['logz0.color'], opts['logz0.alpha'])))
+                znz = z[z != 0]
+                zmin = np.nanmin(znz) if znz.size > 0 else np.nan
                 if opts['logz0.legend']:
                     legendh.append(Patch(facecolor=opts['logz0.color'],
                                          edgecolor='k', label='0.0'))
+            norm = LogNorm(vmin=zmin, vmax=zmax)
 
-        cb = fig.colorbar(im, ax=ax, pad=0.01)
+        if len(tiles) == 0 and mesh is None:
+            im = ax.pcolormesh(x, y, z, cmap=opts['cmap'], norm=norm,
+                               edgecolor=opts['edgecolor'], rasterized=True)
+        else:
+            # The colorbar uses a ScalarMappable because mesh has a color
+            # for each cell.
+            if norm is None:
+                norm = colors.Normalize(vmin=zmin, vmax=zmax)
+            im = ScalarMappable(norm=norm, cmap=opts['cmap'])
+            if mesh is None:
+                mesh = drawmesh(ax, x, y, z, image=image, edgecolor=opts['edgecolor'], rasterized=True)
+
+        if reuse:
+            im.colorbar = cb
+            im.colorbar_cid = im.callbacks.connect('changed', cb.update_normal)
+            cb.update_normal(im)
+        elif getattr(fig, '_hapiplot_cax', None) is not None:
+            # Kept by pool with the position and aspect set by fig.colorbar().
+            fig._hapiplot_cax.grid(visible=False, which='both', axis='both')
+            cb = fig.colorbar(im, cax=fig._hapiplot_cax)
+            fig._hapiplot_colorbar = cb
+        else:
+            cb = fig.colorbar(im, ax=ax, pad=0.01)
+            # The mappable of cb is not the artist drawn if mesh is used.
+            fig._hapiplot_colorbar = cb
 
         if allintz:
             # Put tick label at center of color patch.
@@ -616,10 +904,39 @@ def heatmap(x, y, z, **kwargs):
                     zlabels[i].set_text('-'+text)
             cb.ax.set_yticklabels(zlabels)
 
-    if isinstance(x[0], datetime.datetime):
-        datetick('x', axes=ax)
-    if isinstance(y[0], datetime.datetime):
-        datetick('y', axes=ax)
+    if mesh is not None:
+        index, lut = cellcolors(z, tiles, None if allnan else im)
+        if isinstance(mesh, QuadMesh):
+            mesh.set_array(index)
+            mesh.set_cmap(colors.ListedColormap(lut))
+            mesh.set_norm(colors.NoNorm())
+            if nanedgecolor is not None:
+                # All cells are NaN and are in the first tile. Gap cells do
+                # not have an edge.
+                edgecolors = np.array([(0., 0., 0., 0.), colors.to_rgba(nanedgecolor)])
+                mesh.set_edgecolor(edgecolors[(index == 1).ravel().astype(np.intp)])
+        else:
+            # Colors are rounded to bytes as is done for a QuadMesh; an image
+            # would truncate them.
+            rgba = np.ma.getdata(mesh.get_array())
+            np.take(np.round(255*lut).astype(np.uint8), index, axis=0, out=rgba)
+            mesh.changed()
+        del index
+
+    if reuse:
+        # Apply autoscaling now with the xlim_changed callback set by
+        # datetick() blocked so that it is not called twice.
+        with ax.callbacks.blocked():
+            ax.get_xlim()
+            ax.get_ylim()
+
+    stages.lap('draw')
+    with hidden(ax.images + ax.collections):
+        if isdatetime(x[0]):
+            datetick('x', axes=ax, set_cb=setcb)
+        if isdatetime(y[0]):
+            datetick('y', axes=ax, set_cb=setcb)
+    stages.lap('datetick')
 
     # The following two conditions will be replaced by more general
     # code that calculates ax and cb position and dimensions based on
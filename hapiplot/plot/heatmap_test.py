@@ -21,7 +21,7 @@ if not os.path.exists(outdir):
 
 def testimg(fig, tn, tl):
     import os
-    from imgcheck import imgcheck
+    from hapiplot.plot.imgcheck import imgcheck
     ref_file = os.path.join(outdir,'heatmap_test{0:d}{1:s}.ref.png'.format(tn,tl))
     now_file = os.path.join(outdir, 'heatmap_test{0:d}{1:s}.now.png'.format(tn,tl))
     fig.savefig(now_file)
@@ -1 +0,0 @@
-../../test/imgcheck.py
\ No newline at end of file
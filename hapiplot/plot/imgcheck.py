@@ -0,0 +1,235 @@
+"""Compare images with reference images.
+
+imgcheck() compares one image with a reference image and imgcheck_tree()
+compares all reference images in a directory tree with images in another
+tree using a pool of processes.
+
+Images are compared by compare(). Files with the same bytes are the same
+without being decoded. Otherwise both are decoded and, if the hashes of the
+pixel buffers differ, the absolute difference of each channel is computed
+using NumPy. A pixel has changed if the difference of any channel exceeds
+tol and the images are the same if the fraction of changed pixels does not
+exceed max_ratio. The default tol=0 and max_ratio=0 require identical
+pixels. The now and diff images are written only if the images differ.
+"""
+
+import os
+import io
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+
+def _read(img):
+    """Return bytes of img, which is bytes or a file name."""
+    if isinstance(img, bytes):
+        return img
+    with open(img, 'rb') as f:
+        return f.read()
+
+
+def _pixels(img_bytes):
+    """Return decoded image as RGBA uint8 array with shape (height, width, 4)."""
+    with Image.open(io.BytesIO(img_bytes)) as img:
+        return np.asarray(img.convert('RGBA'))
+
+
+def pixelhash(pixels):
+    """Return MD5 hex digest of array of pixels and its shape."""
+    md5 = hashlib.md5(str(pixels.shape).encode())
+    md5.update(np.ascontiguousarray(pixels).data)
+    return md5.hexdigest()
+
+
+def compare(ref, now, tol=0, max_ratio=0.0):
+    """Compare image now with reference image ref.
+
+    ref and now are bytes or file names. Returns a dict with
+
+        'same': True if images are the same given tol and max_ratio
+        'identical': True if the pixels are identical
+        'ratio': fraction of pixels with a channel difference > tol (1.0 if
+                 the image sizes differ)
+        'max': maximum difference of a channel
+        'diff': RGB uint8 array of channel differences if the pixels are not
+                identical and the sizes are equal, otherwise None
+    """
+
+    ref_bytes = _read(ref)
+    now_bytes = _read(now)
+
+    result = {'same': True, 'identical': True, 'ratio': 0.0, 'max': 0, 'diff': None}
+    if ref_bytes == now_bytes:
+        return result
+
+    ref_pixels = _pixels(ref_bytes)
+    now_pixels = _pixels(now_bytes)
+    if pixelhash(ref_pixels) == pixelhash(now_pixels):
+        return result
+
+    result['identical'] = False
+    if ref_pixels.shape != now_pixels.shape:
+        result['same'] = False
+        result['ratio'] = 1.0
+        result['max'] = 255
+        return result
+
+    diff = np.abs(ref_pixels.astype(np.int16) - now_pixels).astype(np.uint8)
+    changed = np.any(diff > tol, axis=-1)
+    result['ratio'] = np.count_nonzero(changed)/changed.size
+    result['max'] = int(diff.max())
+    result['same'] = result['ratio'] <= max_ratio
+    result['diff'] = diff[..., 0:3]
+
+    return result
+
+
+def imgcheck(ref_file, now_file, show_diff=False, generate_ref_files=False,
+             tol=0, max_ratio=0.0):
+    """Compare image now_file with reference image ref_file.
+
+    now_file is bytes or a file name. If ref_file does not exist or
+    generate_ref_files=True, now_file is written to ref_file and False is
+    returned. Otherwise True is returned if the images are the same (see
+    compare() for tol and max_ratio). If they differ, the image of channel
+    differences is written to ref_file with ".ref." replaced by ".dif."
+    and, if now_file is bytes, now_file is written to ref_file with ".ref."
+    replaced by ".now.".
+    """
+
+    ref_dir = os.path.dirname(ref_file)
+
+    if ref_dir != '' and not os.path.exists(ref_dir):
+        os.makedirs(ref_dir)
+
+    if not os.path.exists(ref_file) or generate_ref_files:
+
+        if not os.path.exists(ref_file):
+            print('Reference file does not exist. Writing ' + ref_file)
+        else:
+            print('Generating reference file.')
+
+        if isinstance(now_file, bytes):
+            with open(ref_file, 'wb') as f:
+                f.write(now_file)
+        else:
+            import shutil
+            shutil.copyfile(now_file, ref_file)
+
+        return False
+
+    result = compare(ref_file, now_file, tol=tol, max_ratio=max_ratio)
+
+    if result['same']:
+        print("imgcheck(): \033[32mPASS\033[0m: Images same:")
+        print("   " + ref_file)
+        if not isinstance(now_file, bytes):
+            print("   " + now_file)
+        return True
+
+    if isinstance(now_file, bytes):
+        with open(ref_file.replace(".ref.", ".now."), 'wb') as f:
+            f.write(now_file)
+
+    if result['diff'] is None:
+        print("imgcheck(): \033[0;31mFAIL\033[0m: Image sizes differ: " + ref_file)
+        return False
+
+    diff_file = ref_file.replace(".ref.", ".dif.")
+    imgd = Image.fromarray(result['diff'])
+    imgd.save(diff_file)
+    if show_diff:
+        imgd.show()
+
+    print("imgcheck(): \033[0;31mFAIL\033[0m: Images differ (%.3g%% of pixels). "
+          "See diff image: %s" % (100*result['ratio'], diff_file))
+    return False
+
+
+def _checkpair(ref_file, now_file, diff_file, tol, max_ratio):
+    """Compare a pair of files for imgcheck_tree()."""
+
+    summary = {'ref': ref_file, 'now': now_file, 'status': 'pass',
+               'ratio': 0.0, 'max': 0, 'diff': None}
+
+    if not os.path.exists(now_file):
+        summary['status'] = 'missing'
+        return summary
+
+    try:
+        result = compare(ref_file, now_file, tol=tol, max_ratio=max_ratio)
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = str(e)
+        return summary
+
+    summary['ratio'] = result['ratio']
+    summary['max'] = result['max']
+    if not result['same']:
+        summary['status'] = 'fail'
+        if result['diff'] is not None:
+            os.makedirs(os.path.dirname(diff_file), exist_ok=True)
+            Image.fromarray(result['diff']).save(diff_file)
+            summary['diff'] = diff_file
+
+    return summary
+
+
+def imgcheck_tree(ref_dir, now_dir, diff_dir=None, extensions=('.png',),
+                  tol=0, max_ratio=0.0, workers=None):
+    """Compare images in directory tree now_dir with those in ref_dir.
+
+    Each file in ref_dir and its subdirectories that ends with one of
+    extensions is compared with the file with the same relative path in
+    now_dir using compare(). Comparisons are done by a pool of workers
+    processes (the default is the number of CPUs); use workers=1 to
+    compare in this process. For images that differ, the image of channel
+    differences is written to the same relative path in diff_dir or, if
+    diff_dir is None, next to the now_dir file with ".dif" inserted before
+    the extension.
+
+    Returns a dict with keys 'pass', 'fail', 'missing' (no file in now_dir),
+    and 'error' (file could not be read or decoded). Each is a list of dicts
+    with keys 'ref', 'now', 'ratio', 'max', and 'diff' (the diff file or
+    None). A summary is printed.
+    """
+
+    pairs = []
+    for root, dirs, files in os.walk(ref_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.endswith(tuple(extensions)):
+                continue
+            rel = os.path.relpath(os.path.join(root, file), ref_dir)
+            if diff_dir is None:
+                base, ext = os.path.splitext(rel)
+                diff_file = os.path.join(now_dir, base + '.dif' + ext)
+            else:
+                diff_file = os.path.join(diff_dir, rel)
+            pairs.append((os.path.join(ref_dir, rel), os.path.join(now_dir, rel),
+                          diff_file, tol, max_ratio))
+
+    if workers == 1 or len(pairs) < 2:
+        summaries = [_checkpair(*pair) for pair in pairs]
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(_checkpair, *zip(*pairs), chunksize=8))
+
+    report = {'pass': [], 'fail': [], 'missing': [], 'error': []}
+    for summary in summaries:
+        report[summary.pop('status')].append(summary)
+
+    print("imgcheck_tree(): %d images: %d pass, %d fail, %d missing, %d error"
+          % (len(summaries), len(report['pass']), len(report['fail']),
+             len(report['missing']), len(report['error'])))
+    for summary in report['fail']:
+        print("  \033[0;31mFAIL\033[0m: %s (%.3g%% of pixels)"
+              % (summary['now'], 100*summary['ratio']))
+    for summary in report['missing']:
+        print("  MISSING: " + summary['now'])
+    for summary in report['error']:
+        print("  ERROR: %s: %s" % (summary['now'], summary['error']))
+
+    return report
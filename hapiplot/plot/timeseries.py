@@ -4,18 +4,94 @@ import warnings
 import numpy as np
 import matplotlib
 
-from datetick import datetick
-
-# https://github.com/pandas-dev/pandas/issues/18301
-# Suppresses depreciation warning.
-# TODO: determine what version of pandas this is needed for.
-# Observed in Matplotlib 3.0, pandas 0.25.3, Python 3.5.
-from pandas.plotting import register_matplotlib_converters
-register_matplotlib_converters()
+from hapiplot.plot.util import hidden, datetick, registerconverters, Stages
+from hapiplot.plot import categories
+from hapiplot.times import datetime64, isdatetime
+
+
+def decimate(x, y, n):
+    """Indices of the points of y(x) needed to draw it n pixel columns wide.
+
+    Uses min/max (M4) decimation: the range of x is split into n columns and
+    for each column the first, last, minimum, and maximum values of y are
+    kept. For columns that contain NaNs, the first and last NaN are also
+    kept so that gaps in the line are drawn. x must be numeric and
+    non-decreasing. If y is 2-D, the union of the indices found for each
+    column of y is returned.
+    """
+
+    def first(Ik, starts, ends):
+        # First element of sorted Ik in each [starts[j], ends[j])
+        if Ik.size == 0:
+            return Ik
+        k = np.searchsorted(Ik, starts)
+        Ik = np.append(Ik, ends[-1])[k]
+        return Ik[Ik < ends]
+
+    def last(Ik, starts, ends):
+        # Last element of sorted Ik in each [starts[j], ends[j])
+        if Ik.size == 0:
+            return Ik
+        k = np.searchsorted(Ik, ends) - 1
+        Ik = np.insert(Ik, 0, -1)[k + 1]
+        return Ik[Ik >= starts]
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    N = x.shape[0]
+    if N < 3 or x[-1] <= x[0]:
+        return np.arange(N)
+
+    # Column of each point. x is sorted, so points in a column are contiguous.
+    col = ((x - x[0])*(n/(x[-1] - x[0]))).astype(np.int64)
+    np.clip(col, 0, n - 1, out=col)
+    starts = np.flatnonzero(np.diff(col, prepend=-1))
+    ends = np.append(starts[1:], N)
+    counts = ends - starts
+
+    I = [starts, ends - 1]
+    if y.ndim == 1:
+        y = y.reshape(-1, 1)
+    for k in range(y.shape[1]):
+        yk = y[:, k]
+        # fmin and fmax ignore NaNs; min or max is NaN only if all are NaN.
+        ymin = np.repeat(np.fmin.reduceat(yk, starts), counts)
+        ymax = np.repeat(np.fmax.reduceat(yk, starts), counts)
+        I.append(first(np.flatnonzero(yk == ymin), starts, ends))
+        I.append(first(np.flatnonzero(yk == ymax), starts, ends))
+        if yk.dtype.kind == 'f':
+            Inan = np.flatnonzero(np.isnan(yk))
+            I.append(first(Inan, starts, ends))
+            I.append(last(Inan, starts, ends))
+
+    return np.unique(np.concatenate(I))
 
 
 def timeseries(t, y, **kwargs):
-    """Plot a time series"""
+    """Plot a time series
+
+    kwargs (in addition to labeling and backend options):
+
+        * decimate: ['m4'] Decimation method used when number of values in y
+          exceeds `decimate.threshold`. Set to False to plot all values.
+        * decimate.threshold: [100000]
+        * info: [None] If a dict, `info['decimation']` is set to a dict that
+          describes the decimation that was applied. If info has a 'stats'
+          dict, the durations of the decimate, draw, and datetick stages are
+          added to `info['stats']['timing']` and the number of values
+          plotted is `info['stats']['points_plotted']`.
+        * figure: [None] A figure returned by a previous call with
+          returnimage=True. If the figure would have the same lines, labels,
+          and legend, its line data are replaced and it is returned instead
+          of creating a new figure. Otherwise, a new figure is created.
+        * figurepool: [None] A FigurePool (see hapiplot.plot.figurepool) to
+          get the figure from when returnimage=True. Release the figure to
+          the pool with figurepool.release(fig) after it is no longer used.
+        * ycategories: [None] If y has integer codes for strings, the
+          strings, so that y == k is plotted with label ycategories[k] (see
+          hapiplot.plot.categories.encode()). If y has strings, codes and
+          categories are computed from them.
+    """
 
     opts = {
                 'logging': False,
@@ -28,7 +104,13 @@ def timeseries(t, y, **kwargs):
                 'backend': 'default',
                 'returnimage': False,
                 'transparent': False,
-                'legendlabels': []
+                'legendlabels': [],
+                'decimate': 'm4',
+                'decimate.threshold': 100000,
+                'info': None,
+                'figure': None,
+                'figurepool': None,
+                'ycategories': None
             }
 
     for key, value in kwargs.items():
@@ -37,6 +119,13 @@ def timeseries(t, y, **kwargs):
         else:
             warnings.warn('Warning: Ignoring invalid keyword option "%s".' % key, SyntaxWarning)
 
+    registerconverters()
+
+    # datetick() sets callbacks that update the ticks on zoom if the backend
+    # is interactive. Finding the backend imports pyplot, which is not needed
+    # when returnimage=True.
+    setcb = not opts['returnimage']
+
     if opts['returnimage']:
         # When returnimage=True, the Matplotlib OO API is used b/c it is thread safe.
         # Otherwise, the pyplot API is used. Ideally would always use the OO API,
@@ -69,7 +158,13 @@ def timeseries(t, y, **kwargs):
     if not isinstance(y, np.ndarray) and len(y) > 1 and len(y[0] > 1):
         y = np.array(y).T
     else:
-        y = np.array(y)
+        # Masked values (e.g., fills) are shown as gaps.
+        y = np.array(y, subok=True)
+
+    if np.ma.is_masked(y) and isinstance(y.data.flat[0], datetime.datetime):
+        # Masked datetimes are plotted by some unit converters (e.g., the
+        # one registered by pandas) but NaT is not.
+        y = datetime64(y)
 
     t = np.array(t)
 
@@ -92,34 +187,19 @@ def timeseries(t, y, **kwargs):
     width, height = matplotlib.rcParams.get('figure.figsize', (7, 3))
 
     if issubclass(y.dtype.type, np.flexible):
-        categorical = True
         # See https://docs.scipy.org/doc/numpy-1.13.0/reference/arrays.scalars.html
         # for diagram of subclasses.
         # Find unique strings and give each an integer value.
         # Modify tick labels to correspond to unique strings
-        yu = np.unique(y)
-        if len(yu) > 20:
-            height = height * (len(yu)/5)
-            #height = min(height * (len(yu) / 20.0), 12)
-        yi = np.zeros((y.shape))
-        for i in range(0, len(yu)):
-            yi[y == yu[i]] = i
-        ylabels = yu
-        y = yi
+        y, opts['ycategories'], _ = categories.encode(y)
 
+    if opts['ycategories'] is not None:
+        categorical = True
+        ylabels = opts['ycategories']
+        if len(ylabels) > 20:
+            height = height * (len(ylabels)/5)
+            #height = min(height * (len(ylabels) / 20.0), 12)
 
-    # Can't use matplotlib.style.use(style) because not thread safe.
-    # Set context using 'with'.
-    # Setting stylesheet method: https://stackoverflow.com/a/22794651/1491619
-    if opts['returnimage']:
-        # See note above about OO API for explanation for why this is
-        # done differently if returnimage=True
-        fig = Figure(figsize=(width, height), constrained_layout=categorical)
-        # Attach canvas to fig, which is needed by datetick and hapiplot.
-        FigureCanvas(fig)
-        ax = fig.add_subplot(111)
-    else:
-        fig, ax = plt.subplots(figsize=(width, height), constrained_layout=categorical)
 
     if len(y.shape) > 1:
         all_nan = np.full((y.shape[1]), False)
@@ -167,6 +247,92 @@ def timeseries(t, y, **kwargs):
                 else:
                     legendlabels =  ['All {0:d} values are NaN'.format(len(y))]
 
+    stats = None
+    if isinstance(opts['info'], dict):
+        stats = opts['info'].get('stats', None)
+    stages = Stages(stats)
+
+    decimation = {'method': None, 'npoints': y.shape[0], 'npoints_plotted': y.shape[0]}
+    if opts['decimate'] and y.size > opts['decimate.threshold'] \
+        and y.dtype.kind in 'fiuM' and not np.all(all_nan):
+        if opts['decimate'] != 'm4':
+            raise ValueError("decimate must be False or 'm4'.")
+        from matplotlib.dates import date2num
+        tn = t
+        if t.dtype.kind in 'OM':
+            tn = date2num(t)
+        # Times (isotime parameter) are decimated using their plotted
+        # values. NaT becomes NaN and is kept as a gap.
+        yn = y
+        if y.dtype.kind == 'M':
+            yn = date2num(y)
+        if tn.dtype.kind in 'fiu' and np.all(np.diff(tn) >= 0):
+            # Number of pixel columns in figure. Using figure instead of
+            # axes width means that columns are narrower than pixels.
+            dpi = matplotlib.rcParams['figure.dpi']
+            if matplotlib.rcParams['savefig.dpi'] != 'figure':
+                dpi = max(dpi, matplotlib.rcParams['savefig.dpi'])
+            ncols = int(np.ceil(width*dpi))
+            I = decimate(tn, yn, ncols)
+            t = t[I]
+            y = y[I]
+            decimation = {'method': 'm4', 'npoints': decimation['npoints'],
+                          'npoints_plotted': I.size, 'ncolumns': ncols}
+    if isinstance(opts['info'], dict):
+        opts['info']['decimation'] = decimation
+    if stats is not None:
+        stats['points_plotted'] = int(y.size)
+    stages.lap('decimate')
+
+    # Everything that determines the figure other than the line data.
+    layout = (width, height, str(props), y.ndim, y.shape[1:], y.dtype.kind,
+              type(t[0]), type(y[0]), tuple(legendlabels),
+              opts['title'], opts['xlabel'], opts['ylabel'],
+              opts['logx'], opts['logy'], opts['transparent'])
+    reuse = opts['returnimage'] and opts['figure'] is not None \
+            and getattr(opts['figure'], '_hapiplot_layout', None) == layout \
+            and not categorical and not np.any(all_nan) and y.shape[0] > 1
+    if reuse:
+        fig = opts['figure']
+        ax = fig.axes[0]
+        if y.ndim == 1:
+            ax.get_lines()[0].set_data(t, y)
+        else:
+            for i, line in enumerate(ax.get_lines()):
+                line.set_data(t, y[:, i])
+        # Block the xlim_changed callback set by datetick() so that it is
+        # not called twice.
+        with ax.callbacks.blocked():
+            ax.relim()
+            ax.autoscale_view()
+        stages.lap('draw')
+        with hidden(ax.get_lines()):
+            if isdatetime(t[0]):
+                datetick('x', axes=ax, set_cb=setcb)
+            if isdatetime(y[0]):
+                datetick('y', axes=ax, set_cb=setcb)
+        stages.lap('datetick')
+        return fig
+
+    # Can't use matplotlib.style.use(style) because not thread safe.
+    # Set context using 'with'.
+    # Setting stylesheet method: https://stackoverflow.com/a/22794651/1491619
+    if opts['returnimage']:
+        # See note above about OO API for explanation for why this is
+        # done differently if returnimage=True
+        if opts['figurepool'] is not None:
+            fig = opts['figurepool'].acquire('timeseries', figsize=(width, height),
+                                             constrained=categorical)
+            ax = fig.axes[0]
+        else:
+            fig = Figure(figsize=(width, height), constrained_layout=categorical)
+            # Attach canvas to fig, which is needed by datetick and hapiplot.
+            FigureCanvas(fig)
+            ax = fig.add_subplot(111)
+    else:
+        fig, ax = plt.subplots(figsize=(width, height), constrained_layout=categorical)
+    fig._hapiplot_layout = layout
+
     if np.all(all_nan):
         ax.set_yticklabels([])
         ax.set_yticks([])
@@ -206,14 +372,16 @@ def timeseries(t, y, **kwargs):
         ax.grid()
 
     if not np.all(all_nan) and len(ylabels) > 0:
-        ax.set_yticks(np.unique(y))
+        ax.set_yticks(np.arange(len(ylabels)))
         ax.set_yticklabels(ylabels)
 
-
-    if isinstance(t[0], datetime.datetime):
-        datetick('x', axes=ax)
-    if isinstance(y[0], datetime.datetime):
-        datetick('y', axes=ax)
+    stages.lap('draw')
+    with hidden(ax.get_lines()):
+        if isdatetime(t[0]):
+            datetick('x', axes=ax, set_cb=setcb)
+        if isdatetime(y[0]):
+            datetick('y', axes=ax, set_cb=setcb)
+    stages.lap('datetick')
 
     # savefig.transparent=True requires the following for the saved image
     # to have a transparent background. Seems as though figure.facealpha
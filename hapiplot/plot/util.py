@@ -1,4 +1,55 @@
+import sys
+import json
+import time
+import hashlib
 import warnings
+from contextlib import contextmanager
+
+# Resolved rc dicts and cache-key digests keyed on style and user rcParams.
+# Both depend only on matplotlib.rcParamsDefault, the style library, and the
+# arguments, which are assumed to not change after import.
+_rccache = {}
+_digestcache = {}
+_cachesize = 64
+
+_convertersregistered = False
+
+
+class FrozenDict(dict):
+    """dict that raises TypeError on modification.
+
+    Returned by setopts() as opts['rcParams'] so that the memoized value can
+    be shared between calls. Use dict(d) to get a modifiable copy.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('FrozenDict can not be modified. Use dict(d) to make a copy.')
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # Default dict subclass pickling calls __setitem__.
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _cachekey(rcParams):
+    # rcParams values may be lists or cyclers, which are not hashable.
+    return repr(sorted(rcParams.items(), key=lambda item: item[0]))
+
+
+def _memoize(cache, key, value):
+    if len(cache) >= _cachesize:
+        cache.pop(next(iter(cache)))
+    cache[key] = value
+    return value
+
 
 def setopts(opts, kwargs):
     import matplotlib
@@ -16,21 +67,37 @@ def setopts(opts, kwargs):
         for key, value in kwargs['rcParams'].items():
             opts['rcParams'][key] = kwargs['rcParams'][key]
 
-    if opts['backend'] != 'default':
+    if opts['backend'] != 'default' and \
+        opts['backend'].lower() != matplotlib.get_backend().lower():
         try:
             matplotlib.use(opts['backend'], force=True)
         except:
             matplotlib.use(matplotlib.get_backend(), force=True)
             warnings.warn('Warning: matplotlib(' + opts['backend'] + \
-                          ') call failed. Using default backend of ' + 
+                          ') call failed. Using default backend of ' +
                           matplotlib.get_backend(), SyntaxWarning)
 
-    style = opts['style']
+    key = (opts['style'], _cachekey(opts['rcParams']))
+    if key not in _rccache:
+        _memoize(_rccache, key, FrozenDict(rcresolve(opts['style'], opts['rcParams'])))
+
+    opts['rcParams'] = _rccache[key]
+    return opts
+
+
+def rcresolve(style, rcParams):
+    """Return dict of all rc parameters for a style and user rcParams.
+
+    Values in rcParams override those of the style, which override
+    matplotlib.rcParamsDefault.
+    """
+    import matplotlib
     import matplotlib.style
+
     rclib =  matplotlib.style.library
     if style in matplotlib.style.available:
         # rc parameters for style that differ from default
-        rcstyle = dict(rclib[style]) 
+        rcstyle = dict(rclib[style])
     else:
         rcstyle = dict(rclib['fast'])
         warnings.warn('style "' + style + \
@@ -45,12 +112,185 @@ def setopts(opts, kwargs):
     for key in rcstyle:
         rc[key] = rcstyle[key]
 
+    # The default value of backend is a sentinel. Setting it using
+    # rc_context() causes pyplot to be imported to resolve the backend, and
+    # it is not preserved by pickling. The backend is set by the backend
+    # option of hapiplot() and not by rc_context().
+    rc.pop('backend', None)
+
     # Override default rc style values with user-provided values
-    for key in opts['rcParams']:
-        if key in rc: # Is an actual rc parameter
-            rc[key] = opts['rcParams'][key]
+    for key in rcParams:
+        if key in rc or key == 'backend': # Is an actual rc parameter
+            rc[key] = rcParams[key]
         else:
             warnings.warn('rc parameter "' + key + '" is not in a known rc parameter.', SyntaxWarning)
 
-    opts['rcParams'] = rc
-    return opts
\ No newline at end of file
+    return rc
+
+
+def rcdigest(rcParams):
+    """Return md5 hex digest of rcParams for use in image cache file names.
+
+    Values that can't be serialized by json.dumps are replaced with None.
+    rcParams is not modified.
+    """
+
+    key = _cachekey(rcParams)
+    if key in _digestcache:
+        return _digestcache[key]
+
+    opts = dict(rcParams)
+
+    # The value of axis.prop_cycle is a cycler
+    # https://matplotlib.org/cycler/
+    # and can't be serialized by json.dumps.
+    if 'axes.prop_cycle' in opts:
+        opts['axes.prop_cycle'] = list(opts['axes.prop_cycle'])
+
+    try:
+        optsjson = json.dumps(opts, sort_keys=True)
+    except:
+        # Remove elements that can't be serialized.
+        for k in opts:
+            try:
+                json.dumps(opts[k])
+            except:
+                opts[k] = None
+        optsjson = json.dumps(opts, sort_keys=True)
+
+    digest = hashlib.md5(optsjson.encode('utf8')).hexdigest()
+    return _memoize(_digestcache, key, digest)
+
+
+@contextmanager
+def hidden(artists):
+    """Temporarily hide artists.
+
+    datetick() draws the figure several times to measure tick label sizes.
+    Hiding data artists during these draws does not change the labels but
+    makes the draws much faster.
+    """
+
+    artists = [artist for artist in artists if artist.get_visible()]
+    for artist in artists:
+        artist.set_visible(False)
+    try:
+        yield
+    finally:
+        for artist in artists:
+            artist.set_visible(True)
+
+
+class Stages:
+    """Record the duration of consecutive stages of a computation.
+
+    stages = Stages(stats)
+    ... # Code for stage 'a'
+    stages.lap('a')
+    ... # Not timed
+    stages.reset()
+    ... # Code for stage 'b'
+    stages.lap('b')
+
+    adds the time since the last lap() or reset() to stats['timing']['a']
+    and stats['timing']['b']. If stats is None, nothing is recorded and
+    lap() and reset() return immediately.
+    """
+
+    def __init__(self, stats):
+        self.timing = None
+        if stats is not None:
+            self.timing = stats.setdefault('timing', {})
+            self.t = time.perf_counter()
+
+    def reset(self):
+        if self.timing is not None:
+            self.t = time.perf_counter()
+
+    def lap(self, name):
+        if self.timing is not None:
+            t = time.perf_counter()
+            self.timing[name] = self.timing.get(name, 0.0) + t - self.t
+            self.t = t
+
+
+def log(msg, opts):
+    """Call hapiclient.util.log().
+
+    hapiclient imports pandas, which is slow to import, so hapiclient is
+    imported when first used instead of when hapiplot modules are imported.
+    """
+
+    from hapiclient.util import log
+    log(msg, opts)
+
+
+def warning(*args):
+    """Call hapiclient.util.warning(). See log()."""
+
+    from hapiclient.util import warning
+    warning(*args)
+
+
+def datetick(*args, **kwargs):
+    """Call datetick.datetick().
+
+    When tick labels overlap, datetick reduces their font size using
+    matplotlib.pyplot.setp() but does not import matplotlib.pyplot. Whether
+    labels overlap is only known during the call, so pyplot is imported
+    before the first call. hapiplot does not otherwise import pyplot when
+    returnimage=True; once Matplotlib is imported, this takes ~25 ms.
+    """
+
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib.pyplot
+    from datetick import datetick
+    return datetick(*args, **kwargs)
+
+
+def registerconverters():
+    """Register pandas Matplotlib converters if pandas has been imported.
+
+    https://github.com/pandas-dev/pandas/issues/18301
+    Suppresses depreciation warning.
+    TODO: determine what version of pandas this is needed for.
+    Observed in Matplotlib 3.0, pandas 0.25.3, Python 3.5.
+
+    pandas is not imported here because it is slow to import and the
+    converters are only needed if pandas is used.
+    """
+
+    global _convertersregistered
+    if _convertersregistered or 'pandas' not in sys.modules:
+        return
+    from pandas.plotting import register_matplotlib_converters
+    register_matplotlib_converters()
+    _convertersregistered = True
+
+
+def colormaps():
+    """Return list of registered colormap names without importing pyplot."""
+    import matplotlib
+    try:
+        # Matplotlib >= 3.5
+        return list(matplotlib.colormaps)
+    except AttributeError:
+        from matplotlib import pyplot
+        return pyplot.colormaps()
+
+
+def getcmap(name, lut=None):
+    """Return colormap name resampled to lut colors without importing pyplot.
+
+    Same as matplotlib.pyplot.get_cmap(name, lut).
+    """
+    import matplotlib
+    try:
+        # Matplotlib >= 3.6
+        cmap = matplotlib.colormaps[name]
+        if lut is not None:
+            cmap = cmap.resampled(lut)
+        return cmap
+    except AttributeError:
+        from matplotlib import cm
+        return cm.get_cmap(name, lut)
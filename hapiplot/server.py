@@ -0,0 +1,318 @@
+"""HTTP server that returns plots of HAPI data.
+
+    from hapiplot.server import PlotServer
+    with PlotServer(workers=4) as server:
+        print(server.url)
+
+serves
+
+    /plot?server=URL&id=DATASET&parameters=NAME&time.min=START&time.max=STOP&format=png
+
+which returns the image for parameter NAME created by
+
+    hapiplot(URL, DATASET, NAME, START, STOP, returnimage=True)
+
+Images are created by a pool of worker processes and saved in the image
+cache, so repeated requests are answered from the cache. Requests for an
+image that is being created wait for it instead of creating it again. If
+the number of images waiting to be created is more than `queue`, requests
+for new images are answered with 429 Too Many Requests.
+
+The ETag of a response is derived from the image cache file name (see
+hapiplot.hapiplot.imagepath()), which depends on the request and the
+rcParams. The image is assumed to not change for a given ETag, as is
+assumed by the image cache. A request with an If-None-Match header that
+matches is answered with 304 Not Modified without creating the image.
+
+The server runs in a thread from start() to stop() or in a with block. The
+same requests can be handled by a WSGI or ASGI server using the wsgi() and
+asgi() methods, e.g., wsgiref.simple_server.make_server('', 5000,
+server.wsgi). Run python -m hapiplot.server --help for a command-line
+server.
+"""
+
+import json
+import hashlib
+import threading
+import concurrent.futures
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf'}
+
+
+class PlotServer:
+    """HTTP server for hapiplot() images.
+
+    server = PlotServer(workers=4, queue=16, maxage=0, host='127.0.0.1',
+                        port=0, **kwargs)
+
+    workers is the number of processes that create images and queue is the
+    number of images that may wait for a worker. maxage is the max-age
+    in seconds of the Cache-Control header. kwargs are hapiplot() and
+    hapi() options used for all requests (e.g., cachedir and rcParams).
+    returnimage, saveimage, and useimagecache are always True.
+
+    server.url is the URL of the server and server.stats counts requests
+    by outcome.
+    """
+
+    def __init__(self, workers=4, queue=16, maxage=0, host='127.0.0.1', port=0, **kwargs):
+
+        self.workers = workers
+        self.queue = queue
+        self.maxage = maxage
+        self.host = host
+        self.port = port
+        self.url = None
+        self.stats = {'requests': 0, 'rendered': 0, 'merged': 0, 'cached': 0,
+                      'not_modified': 0, 'rejected': 0, 'errors': 0}
+
+        self.kwargs = kwargs.copy()
+        self.kwargs['returnimage'] = True
+        self.kwargs['saveimage'] = True
+        self.kwargs['useimagecache'] = True
+
+        # Reentrant because a done callback of a future that is already done
+        # is called by add_done_callback().
+        self._lock = threading.RLock()
+        # Images being created, keyed on ETag.
+        self._inflight = {}
+        self._executor = None
+        self._httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start worker pool and server thread and return self."""
+
+        self._startpool()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.plotserver = self
+        self.url = 'http://%s:%d' % self._httpd.server_address[0:2]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _startpool(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def response(self, path, query, headers=None):
+        """Return (HTTP status, dict of headers, body) for a request.
+
+        headers is a dict of request headers with lower-case names.
+        """
+
+        headers = headers or {}
+        self._count('requests')
+
+        if path.rstrip('/') != '/plot':
+            return _error(HTTPStatus.NOT_FOUND, 'Only /plot is served.')
+
+        args = {k: v[0] for k, v in parse_qs(query).items()}
+        request = {
+                    'server': args.get('server', None),
+                    'dataset': args.get('id', args.get('dataset', None)),
+                    'parameter': args.get('parameters', None),
+                    'start': args.get('time.min', args.get('start', None)),
+                    'stop': args.get('time.max', args.get('stop', None))
+                  }
+        missing = [key for key, value in request.items() if not value]
+        if missing:
+            names = {'dataset': 'id', 'parameter': 'parameters', 'start': 'time.min', 'stop': 'time.max'}
+            return _error(HTTPStatus.BAD_REQUEST, 'Missing query parameter(s): '
+                          + ', '.join(names.get(key, key) for key in missing))
+        if ',' in request['parameter']:
+            return _error(HTTPStatus.BAD_REQUEST, 'Only one parameter may be given.')
+
+        fmt = args.get('format', 'png')
+        if fmt not in FORMATS:
+            return _error(HTTPStatus.BAD_REQUEST, 'format must be one of ' + ', '.join(FORMATS))
+
+        kwargs = self.kwargs.copy()
+        kwargs['rcParams'] = dict(kwargs.get('rcParams', {}))
+        kwargs['rcParams']['savefig.format'] = fmt
+
+        etag = '"%s"' % _etag(request, kwargs)
+        rheaders = {
+                    'ETag': etag,
+                    'Cache-Control': 'public, max-age=%d' % self.maxage
+                   }
+
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            self._count('not_modified')
+            return HTTPStatus.NOT_MODIFIED, rheaders, b''
+
+        with self._lock:
+            future = self._inflight.get(etag, None)
+            if future is not None:
+                self.stats['merged'] += 1
+            elif len(self._inflight) >= self.workers + self.queue:
+                self.stats['rejected'] += 1
+                status, eheaders, body = _error(HTTPStatus.TOO_MANY_REQUESTS, 'Too many requests.')
+                eheaders['Retry-After'] = '1'
+                return status, eheaders, body
+            else:
+                self._startpool()
+                future = self._executor.submit(_render, request, kwargs)
+                self._inflight[etag] = future
+                future.add_done_callback(lambda f: self._done(etag, f))
+
+        try:
+            image, cached = future.result()
+        except Exception as e:
+            self._count('errors')
+            return _error(HTTPStatus.INTERNAL_SERVER_ERROR, '%s: %s' % (type(e).__name__, e))
+
+        if image is None:
+            self._count('errors')
+            return _error(HTTPStatus.INTERNAL_SERVER_ERROR, 'No image was created.')
+
+        rheaders['Content-Type'] = FORMATS[fmt]
+        return HTTPStatus.OK, rheaders, image
+
+    def _done(self, etag, future):
+        with self._lock:
+            self._inflight.pop(etag, None)
+            if future.exception() is None and future.result()[0] is not None:
+                self.stats['cached' if future.result()[1] else 'rendered'] += 1
+
+    def wsgi(self, environ, start_response):
+        """WSGI application."""
+
+        headers = {key[5:].replace('_', '-').lower(): value
+                   for key, value in environ.items() if key.startswith('HTTP_')}
+        status, rheaders, body = self.response(environ.get('PATH_INFO', ''),
+                                               environ.get('QUERY_STRING', ''), headers)
+        rheaders['Content-Length'] = str(len(body))
+        start_response('%d %s' % (status, HTTPStatus(status).phrase), list(rheaders.items()))
+        return [body]
+
+    async def asgi(self, scope, receive, send):
+        """ASGI application."""
+
+        import asyncio
+
+        if scope['type'] != 'http':
+            return
+
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1')
+                   for key, value in scope.get('headers', [])}
+        query = scope.get('query_string', b'').decode('latin-1')
+
+        # response() blocks until the image is created.
+        loop = asyncio.get_running_loop()
+        status, rheaders, body = await loop.run_in_executor(
+            None, self.response, scope['path'], query, headers)
+
+        rheaders['Content-Length'] = str(len(body))
+        await send({'type': 'http.response.start', 'status': int(status),
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                for k, v in rheaders.items()]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _etag(request, kwargs):
+    """Return MD5 of image cache file name for request."""
+
+    import os
+    from hapiplot.hapiplot import hapiplotopts, _imagefile
+    from hapiplot.plot.util import setopts
+
+    opts = hapiplotopts()
+    opts = setopts(opts, {k: v for k, v in kwargs.items() if k in opts})
+
+    meta = {
+            'x_server': request['server'],
+            'x_dataset': request['dataset'],
+            'x_time.min': request['start'],
+            'x_time.max': request['stop'],
+            'parameters': [{}, {'name': request['parameter']}]
+    }
+    fname = os.path.relpath(_imagefile(meta, 1, opts, kwargs), opts['cachedir'])
+    return hashlib.md5(fname.encode()).hexdigest()
+
+
+def _render(request, kwargs):
+    """Return (image, True if from image cache). Called in a worker process."""
+
+    from hapiplot.hapiplot import hapiplot
+
+    data, meta = hapiplot(request['server'], request['dataset'], request['parameter'],
+                          request['start'], request['stop'], **kwargs)
+    hp = meta['parameters'][1].get('hapiplot', {})
+    return hp.get('image', None), data is None
+
+
+def _error(status, message):
+    body = json.dumps({'status': int(status), 'message': message}).encode()
+    return status, {'Content-Type': 'application/json'}, body
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server.plotserver
+        url = urlsplit(self.path)
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        status, rheaders, body = server.response(url.path, url.query, headers)
+
+        self.send_response(status)
+        for key, value in rheaders.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve hapiplot() images.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4, help='Number of render processes')
+    parser.add_argument('--queue', type=int, default=16, help='Number of images that may wait for a worker')
+    parser.add_argument('--maxage', type=int, default=0, help='Cache-Control max-age in seconds')
+    parser.add_argument('--cachedir', default=None, help='Image and data cache directory')
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.cachedir is not None:
+        kwargs['cachedir'] = args.cachedir
+
+    with PlotServer(workers=args.workers, queue=args.queue, maxage=args.maxage,
+                    host=args.host, port=args.port, **kwargs) as server:
+        print('Serving ' + server.url + '/plot')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
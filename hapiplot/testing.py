@@ -0,0 +1,448 @@
+"""Synthetic HAPI data and metadata for tests and benchmarks.
+
+generate() returns data and meta with the form returned by
+hapiclient.hapi() for a dataset with a Time parameter and one parameter of
+a given kind, so that hapiplot() can be run without a HAPI server:
+
+    from hapiplot import hapiplot
+    from hapiplot.testing import generate
+    data, meta = generate('spectra', 10000)
+    hapiplot(data, meta)
+
+The kinds are listed in KINDS. The values are deterministic for a given
+kind, n, and seed. Only NumPy is used, so 1e7 records are generated in a
+few seconds.
+
+HAPIServer is a local HAPI server that serves these datasets, and responses
+recorded from other servers, so that the five-argument form of hapiplot()
+and hapiclient.hapi() can be used without a network:
+
+    from hapiplot.testing import HAPIServer
+    with HAPIServer() as server:
+        hapiplot(server.url, 'synthetic/scalar', 'scalar',
+                 '2000-01-01T00:00:00Z', '2000-01-01T01:00:00Z',
+                 cache=False, usecache=False)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from hapiplot.times import hapitime2datetime64
+
+KINDS = ('scalar', 'integer', 'vector', 'spectra', 'bins_centers',
+         'bins_ranges', 'matrix', 'matrix_bins', 'string', 'isotime', 'fill',
+         'irregular')
+
+# Start time and cadence of records.
+START = np.datetime64('2000-01-01T00:00:00', 'ms')
+CADENCE = np.timedelta64(1000, 'ms')
+
+FILL = -1e31
+
+
+def generate(kind='scalar', n=1000, seed=0, server='http://localhost/hapi'):
+    """Return (data, meta) for a dataset with a parameter of a given kind.
+
+    kind is one of the following or a comma-separated list of them, e.g.,
+    'scalar,vector', for a dataset with one parameter of each kind
+
+        scalar: double
+        integer: integer with fills
+        vector: double with size [3]
+        spectra: double with size [32] and log-spaced bin centers (plotted
+            as a heatmap because size > 10)
+        bins_centers: double with size [8] and bin centers
+        bins_ranges: double with size [8] and bin ranges with a gap
+        matrix: double with size [3, 4] (one plot per component)
+        matrix_bins: double with size [3, 12] and bin centers for both
+            dimensions (one heatmap per component)
+        string: string with four values and a fill
+        isotime: isotime with fills
+        fill: double where about half of the values are fills in runs
+        irregular: double with times that are not uniformly spaced and
+            have gaps
+
+    n is the number of records. The dataset name is "synthetic/<kind>" and
+    the parameter names are the kinds. The times are irregular if one of
+    the kinds is 'irregular'.
+    """
+
+    kinds = kind.split(',')
+    for k in kinds:
+        if k not in KINDS:
+            raise ValueError('kind must be one of ' + str(KINDS))
+
+    rng = np.random.default_rng(seed)
+    x = np.arange(n)
+
+    if 'irregular' in kinds:
+        # Jitter of up to 10% of cadence and gaps of 60 records after
+        # about 1% of records.
+        ms = CADENCE/np.timedelta64(1, 'ms')
+        steps = np.round(ms*(1 + 0.1*rng.uniform(-1, 1, n))).astype('timedelta64[ms]')
+        steps[rng.uniform(size=n) < 0.01] += 60*CADENCE
+        Time = START + np.cumsum(steps) - steps[0:1]
+    else:
+        Time = START + CADENCE*x
+
+    params = []
+    columns = []
+    for k in kinds:
+        param, values = _parameter(k, x, n, Time, rng)
+        params.append(param)
+        columns.append(values)
+
+    dtype = [('Time', 'S24')]
+    for param, values in zip(params, columns):
+        dtype.append((param['name'], values.dtype, tuple(param.get('size', ()))))
+    data = np.empty(n, dtype=dtype)
+    data['Time'] = _isotime(Time)
+    for param, values in zip(params, columns):
+        data[param['name']] = values
+
+    tmin = _isotime(START)
+    tmax = _isotime(Time[-1] + CADENCE if n > 0 else START + CADENCE)
+
+    meta = {
+        'HAPI': '3.1',
+        'status': {'code': 1200, 'message': 'OK request successful'},
+        'startDate': tmin,
+        'stopDate': tmax,
+        'cadence': 'PT1S',
+        'parameters': [
+            {'name': 'Time', 'type': 'isotime', 'units': 'UTC', 'fill': None, 'length': 24}
+        ] + params,
+        'x_server': server,
+        'x_dataset': 'synthetic/' + kind,
+        'x_parameters': kind,
+        'x_time.min': tmin,
+        'x_time.max': tmax
+    }
+
+    return data, meta
+
+
+def _parameter(kind, x, n, Time, rng):
+    """Return (parameter metadata, values) for generate()."""
+
+    param = {'name': kind, 'type': 'double', 'units': 'nT', 'fill': str(FILL)}
+
+    if kind in ('scalar', 'irregular'):
+        values = np.sin(2*np.pi*x/max(n, 100)) + 0.1*rng.standard_normal(n)
+    elif kind == 'integer':
+        param.update({'type': 'integer', 'units': 'counts', 'fill': '-1'})
+        values = rng.poisson(100, n).astype(np.int32)
+        values[rng.uniform(size=n) < 0.01] = -1
+    elif kind == 'vector':
+        param['size'] = [3]
+        phase = 2*np.pi*x/max(n, 100)
+        values = np.column_stack([np.sin(phase), np.cos(phase), 0.1*rng.standard_normal(n)])
+    elif kind == 'spectra':
+        energies = np.logspace(1, 4, 32)
+        param.update({'units': 'counts/s', 'size': [32],
+                      'bins': [{'name': 'energy', 'units': 'eV', 'centers': energies.tolist()}]})
+        values = _spectra(x, energies, n, rng)
+    elif kind == 'bins_centers':
+        centers = np.arange(8)*10.0 + 5
+        param.update({'units': 'counts/s', 'size': [8],
+                      'bins': [{'name': 'angle', 'units': 'deg', 'centers': centers.tolist()}]})
+        values = _spectra(x, centers, n, rng)
+    elif kind == 'bins_ranges':
+        ranges = [[10.0*k, 10.0*k + 10] for k in range(8)]
+        # Gap between bins 3 and 4.
+        for r in ranges[4:]:
+            r[0] += 5
+            r[1] += 5
+        param.update({'units': 'counts/s', 'size': [8],
+                      'bins': [{'name': 'angle', 'units': 'deg', 'ranges': ranges}]})
+        values = _spectra(x, np.mean(ranges, axis=1), n, rng)
+    elif kind == 'matrix':
+        param['size'] = [3, 4]
+        values = np.sin(2*np.pi*x/max(n, 100))[:, None, None] + np.arange(12).reshape(3, 4)
+    elif kind == 'matrix_bins':
+        energies = np.logspace(1, 4, 12)
+        param.update({'units': 'counts/s', 'size': [3, 12],
+                      'bins': [{'name': 'angle', 'units': 'deg', 'centers': [0, 90, 180]},
+                               {'name': 'energy', 'units': 'eV', 'centers': energies.tolist()}]})
+        values = _spectra(x, energies, n, rng)[:, None, :]*np.array([1.0, 0.5, 0.25])[None, :, None]
+    elif kind == 'string':
+        categories = np.array([b'ok', b'warn', b'error', b'none'])
+        param.update({'type': 'string', 'units': None, 'fill': 'none', 'length': 5})
+        values = categories[rng.choice(4, size=n, p=[0.7, 0.15, 0.05, 0.1])]
+    elif kind == 'isotime':
+        fill = '9999-12-31T00:00:00.000Z'
+        param.update({'type': 'isotime', 'units': 'UTC', 'fill': fill, 'length': len(fill)})
+        values = _isotime(Time + CADENCE*rng.integers(0, 3600, n))
+        values[rng.uniform(size=n) < 0.05] = fill.encode()
+    elif kind == 'fill':
+        values = np.sin(2*np.pi*x/max(n, 100))
+        # Blocks of 100 records that are fills and isolated fills.
+        runs = np.repeat(rng.uniform(size=(n + 99)//100) < 0.5, 100)[0:n]
+        values[runs | (rng.uniform(size=n) < 0.05)] = FILL
+
+    return param, values
+
+
+def _isotime(t):
+    """Return datetime64 t as HAPI times (bytes if t is an array)."""
+    s = np.datetime_as_string(t, unit='ms')
+    if np.ndim(s) == 0:
+        return str(s) + 'Z'
+    return np.char.add(s, 'Z').astype('S24')
+
+
+def _spectra(x, centers, n, rng):
+    """Return (n, len(centers)) counts with a peak that drifts over time."""
+    peak = np.log10(centers[0]) + (np.log10(centers[-1]) - np.log10(centers[0]))*(0.5 + 0.4*np.sin(2*np.pi*x/max(n, 100)))
+    width = 0.2*(np.log10(centers[-1]) - np.log10(centers[0]))
+    z = 1000*np.exp(-((np.log10(centers)[None, :] - peak[:, None])/width)**2)
+    return z + rng.uniform(0, 1, z.shape)
+
+
+class HAPIServer:
+    """Local HAPI server for tests and benchmarks.
+
+    server = HAPIServer(n=86400, kinds=KINDS, formats=('csv', 'binary'),
+                        delay=0, bandwidth=None, recordings=None,
+                        upstream=None)
+
+    The datasets "synthetic/<kind>" for kind in kinds have n records with
+    a cadence of 1 s starting at 2000-01-01 (see generate()). Their info
+    and data responses are served by /info and /data for any of the
+    formats in formats (CSV is always served).
+
+    Other requests are answered with a response recorded in the directory
+    recordings. If no response for a request was recorded and upstream is
+    the URL of a HAPI server, the request is made to that server and the
+    response is recorded. For example, after
+
+        with HAPIServer(recordings='rec', upstream='https://...') as server:
+            hapi(server.url, dataset, parameters, start, stop)
+
+    the same hapi() call can be made without a network using
+    HAPIServer(recordings='rec').
+
+    delay is the time in seconds before each response is sent and
+    bandwidth is the maximum number of bytes per second sent.
+
+    The server runs in a thread from start() to stop() or in a with block.
+    Its URL, which is used as the server argument of hapi(), is server.url.
+    """
+
+    def __init__(self, n=86400, kinds=KINDS, formats=('csv', 'binary'),
+                 delay=0, bandwidth=None, recordings=None, upstream=None,
+                 host='127.0.0.1', port=0):
+
+        self.n = n
+        self.kinds = tuple(kinds)
+        self.formats = tuple(formats)
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.recordings = recordings
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.host = host
+        self.port = port
+        self.url = None
+        self.requests = []
+
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start server in a thread and return self."""
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.hapiserver = self
+        self.url = 'http://%s:%d/hapi' % self._httpd.server_address[0:2]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def dataset(self, kind):
+        """Return (data, meta) for dataset synthetic/<kind>."""
+        with self._lock:
+            if kind not in self._datasets:
+                self._datasets[kind] = generate(kind, self.n)
+            return self._datasets[kind]
+
+    def response(self, path, query):
+        """Return (HTTP status, content type, body) for a request."""
+
+        endpoint = path.rstrip('/').split('/')[-1]
+        args = {k: v[0] for k, v in parse_qs(query).items()}
+        dataset = args.get('dataset', args.get('id', ''))
+
+        if endpoint in ('catalog', 'capabilities'):
+            recorded = self._record(path, query)
+            return recorded or (200, 'application/json', _json(self._meta(endpoint)))
+
+        if dataset.startswith('synthetic/') and dataset[10:] in self.kinds:
+            if endpoint == 'info':
+                return 200, 'application/json', _json(self._info(dataset[10:], args))
+            if endpoint == 'data':
+                return self._data(dataset[10:], args)
+
+        recorded = self._record(path, query)
+        if recorded:
+            return recorded
+
+        status = {'code': 1406, 'message': 'HAPI error 1406: unknown dataset id'}
+        return 404, 'application/json', _json({'HAPI': '3.1', 'status': status})
+
+    def _meta(self, endpoint):
+        status = {'code': 1200, 'message': 'OK request successful'}
+        if endpoint == 'catalog':
+            catalog = [{'id': 'synthetic/' + kind} for kind in self.kinds]
+            return {'HAPI': '3.1', 'status': status, 'catalog': catalog}
+        formats = ['csv'] + [f for f in self.formats if f != 'csv']
+        return {'HAPI': '3.1', 'status': status, 'outputFormats': formats}
+
+    def _info(self, kind, args):
+        meta = self.dataset(kind)[1]
+        info = {k: v for k, v in meta.items() if not k.startswith('x_')}
+        info['parameters'] = _subset(meta['parameters'], args.get('parameters', ''))
+        return info
+
+    def _data(self, kind, args):
+
+        data, meta = self.dataset(kind)
+        start = args.get('start', args.get('time.min', meta['startDate']))
+        stop = args.get('stop', args.get('time.max', meta['stopDate']))
+
+        Time = hapitime2datetime64(data['Time'])
+        i0, i1 = np.searchsorted(Time, hapitime2datetime64(np.array([start, stop])))
+        names = [p['name'] for p in _subset(meta['parameters'], args.get('parameters', ''))]
+        records = data[names][i0:i1]
+
+        if args.get('format', 'csv') == 'binary' and 'binary' in self.formats:
+            return 200, 'application/octet-stream', _binary(records)
+        return 200, 'text/csv', _csv(records)
+
+    def _record(self, path, query):
+        """Return recorded response for request or None if not found.
+
+        If not found and upstream is given, the response from upstream is
+        recorded and returned.
+        """
+
+        if self.recordings is None:
+            return None
+
+        request = path.split('/hapi', 1)[-1] + ('?' + query if query else '')
+        fname = os.path.join(self.recordings, hashlib.md5(request.encode()).hexdigest())
+
+        if not os.path.exists(fname) and self.upstream is not None:
+            import urllib.request
+            import urllib.error
+            try:
+                with urllib.request.urlopen(self.upstream + request) as res:
+                    status, ctype, body = res.status, res.headers.get('Content-Type'), res.read()
+            except urllib.error.HTTPError as e:
+                status, ctype, body = e.code, e.headers.get('Content-Type'), e.read()
+            os.makedirs(self.recordings, exist_ok=True)
+            with open(fname, 'wb') as f:
+                f.write(body)
+            with open(fname + '.json', 'w') as f:
+                json.dump({'request': request, 'status': status, 'content-type': ctype}, f, indent=2)
+
+        if not os.path.exists(fname):
+            return None
+
+        with open(fname + '.json') as f:
+            header = json.load(f)
+        with open(fname, 'rb') as f:
+            return header['status'], header['content-type'], f.read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server.hapiserver
+        url = urlsplit(self.path)
+        status, ctype, body = server.response(url.path, url.query)
+        server.requests.append(self.path)
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if not server.bandwidth:
+            self.wfile.write(body)
+            return
+
+        # Send chunks of 0.01 s worth of bytes.
+        chunk = max(int(server.bandwidth/100), 1)
+        for i in range(0, len(body), chunk):
+            t = time.perf_counter()
+            self.wfile.write(body[i:i+chunk])
+            dt = len(body[i:i+chunk])/server.bandwidth - (time.perf_counter() - t)
+            if dt > 0:
+                time.sleep(dt)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _json(obj):
+    return json.dumps(obj, indent=2).encode()
+
+
+def _subset(parameters, names):
+    """Return Time and parameters in comma-separated names (all if empty)."""
+    if names == '':
+        return parameters
+    names = names.split(',')
+    return [p for k, p in enumerate(parameters) if k == 0 or p['name'] in names]
+
+
+def _binary(records):
+    """Return records as HAPI binary (little-endian, null-padded strings)."""
+    dtype = [(name, records.dtype[name].base.newbyteorder('<'), records.dtype[name].shape)
+             for name in records.dtype.names]
+    return records.astype(dtype).tobytes()
+
+
+def _csv(records):
+    """Return records as HAPI CSV."""
+
+    if len(records) == 0:
+        return b''
+
+    columns = []
+    for name in records.dtype.names:
+        values = records[name].reshape(len(records), -1)
+        if values.dtype.kind == 'S':
+            values = np.char.decode(values, 'utf-8')
+        elif values.dtype.kind == 'f':
+            values = np.char.mod('%.17g', values)
+        columns.append(values.astype('U'))
+
+    lines = [','.join(row) for row in np.concatenate(columns, axis=1)]
+    return ('\n'.join(lines) + '\n').encode()
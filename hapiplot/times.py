@@ -0,0 +1,163 @@
+"""HAPI times as numpy.datetime64.
+
+Times are parsed into numpy.datetime64[us] arrays (UTC, no time zone) and
+are kept in this form for computing bin edges and for plotting. Arithmetic
+on these arrays is vectorized and Matplotlib converts them to its date
+numbers without creating Python datetime objects. The resolution is that
+of datetime objects, and values up to year 9999 (often used for fills) can
+be represented.
+"""
+
+import datetime
+
+import numpy as np
+
+DTYPE = 'datetime64[us]'
+
+
+def hapitime2datetime64(Time):
+    """Convert an array of HAPI times to numpy.datetime64[us].
+
+    Time is an array of bytes or str. Times in year-month-day form are
+    parsed by NumPy. Other forms (e.g., year-day-of-year) are parsed by
+    hapiclient.hapitime.hapitime2datetime() and the result is converted.
+    A trailing Z is not required.
+    """
+
+    Time = np.asarray(Time)
+    if Time.size == 0:
+        return np.array([], dtype=DTYPE)
+
+    if Time.dtype.kind in 'SU':
+        z = b'Z' if Time.dtype.kind == 'S' else 'Z'
+        try:
+            return np.char.rstrip(Time, z).astype(DTYPE)
+        except ValueError:
+            pass
+
+    # hapiclient imports pandas, which is slow to import, so it is imported
+    # only if needed. This module is also used by timeseries() and heatmap().
+    from hapiclient.hapitime import hapitime2datetime
+    return datetime64(hapitime2datetime(Time, allow_missing_Z=True))
+
+
+def datetime64(t):
+    """Return datetimes t as numpy.datetime64[us] in UTC.
+
+    If t is a masked array, masked values are NaT. Arrays that already
+    have a datetime64 dtype are converted to microseconds.
+    """
+
+    data = np.ma.getdata(t)
+    if data.dtype.kind == 'M':
+        t64 = data.astype(DTYPE)
+    else:
+        utc = datetime.timezone.utc
+        values = [v if v.tzinfo is None else v.astimezone(utc).replace(tzinfo=None)
+                  for v in data.flat]
+        t64 = np.array(values, dtype=DTYPE).reshape(data.shape)
+
+    mask = np.ma.getmask(t)
+    if mask is not np.ma.nomask:
+        if t64 is data:
+            t64 = t64.copy()
+        t64[mask] = np.datetime64('NaT')
+
+    return t64
+
+
+def isdatetime(x):
+    """True if x is a datetime or numpy.datetime64 value."""
+    return isinstance(x, (datetime.datetime, np.datetime64))
+
+
+def isoformat(t):
+    """Return datetime or numpy.datetime64 t as an ISO 8601 string.
+
+    numpy.datetime64 values are in UTC and end in Z. A datetime is formatted
+    by its isoformat() method with an offset of +00:00 replaced by Z, so a
+    naive datetime has no Z.
+    """
+
+    if isinstance(t, np.datetime64):
+        return t.astype(DTYPE).item().isoformat() + 'Z'
+    return t.isoformat().replace("+00:00", "Z")
+
+
+def time_cadence(Time, rtol=1e-3):
+    """Return the cadence of Time if it is uniform and None otherwise.
+
+    Time is a numpy.datetime64 array. The cadence is uniform if the
+    separations of consecutive times differ by no more than rtol times their
+    mean, which is returned as a numpy.timedelta64. None is returned if
+    Time has fewer than two values.
+    """
+
+    if Time.size < 2:
+        return None
+
+    mean = (Time[-1] - Time[0]) / (Time.size - 1)
+    if mean <= np.timedelta64(0):
+        return None
+
+    dt = np.diff(Time)
+    if (dt.max() - dt.min()) / mean > rtol:
+        return None
+
+    return mean
+
+
+def time_edges(Time, timeStampLocation=None, cadence=None):
+    """Return the N + 1 edges of the time bins of the N times in Time.
+
+    edges, cadence = time_edges(Time, timeStampLocation=None, cadence=None)
+
+    Time is a numpy.datetime64 array and timeStampLocation is "begin", "end",
+    or "center" (the default, which is used if it is None). If cadence is
+    None, it is detected using time_cadence(). The returned cadence is
+    the bin width used or None if Time is not uniform.
+
+    If the cadence is known, all bins have a width of cadence. Otherwise the
+    bin widths are based on the separations of consecutive times. For
+    "center", the edges are half-way between consecutive times and the
+    first and last bins have the width of their neighbors. A single time
+    with no cadence given is given a bin of width 2 seconds.
+    """
+
+    if cadence is None:
+        cadence = time_cadence(Time)
+
+    location = (timeStampLocation or 'center').lower()
+
+    N = Time.size
+    edges = np.empty(N + 1, dtype=Time.dtype)
+
+    width = cadence
+    if width is None and N < 2:
+        width = np.timedelta64(2, 's')
+
+    if width is not None:
+        width = np.timedelta64(width)
+        if location == 'begin':
+            offset = np.timedelta64(0, 'us')
+        elif location == 'end':
+            offset = width
+        else:
+            offset = width/2
+        np.subtract(Time, offset, out=edges[0:N])
+        edges[N] = edges[N-1] + width
+        return edges, cadence
+
+    dt = np.diff(Time)
+    if location == 'begin':
+        edges[0:N] = Time
+        edges[N] = Time[-1] + dt[-1]
+    elif location == 'end':
+        edges[1:] = Time
+        edges[0] = Time[0] - dt[0]
+    else:
+        np.add(Time[0:-1], dt/2, out=edges[1:N])
+        edges[0] = Time[0] - dt[0]/2
+        edges[N] = Time[-1] + dt[-1]/2
+
+    return edges, cadence
@@ -0,0 +1,165 @@
+import os
+import socket
+import tempfile
+import warnings
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from hapiplot.autoplot.autoplot import session, AutoplotSession, _cached, _updatejar
+
+server = 'http://localhost/hapi'
+
+
+class _Handler(BaseHTTPRequestHandler):
+  # Stand-in for server.jy that keeps connections open.
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    self.server.connections += 1
+    BaseHTTPRequestHandler.setup(self)
+
+  def do_GET(self):
+    self.server.paths.append(self.path)
+    body = self.server.body
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+def _server(body=b'OK. See Autoplot GUI for result.\n'):
+
+  httpd = ThreadingHTTPServer(('localhost', 0), _Handler)
+  httpd.daemon_threads = True
+  httpd.paths = []
+  httpd.connections = 0
+  httpd.body = body
+  thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+  thread.start()
+  return httpd
+
+
+def test_session():
+
+  httpd = _server()
+
+  try:
+    opts = {'port': httpd.server_address[1], 'cachedir': tempfile.mkdtemp()}
+    s = session(**opts)
+    assert session(**opts) is s
+
+    for day in range(1, 4):
+      start = '1970-01-%02dZ' % day
+      assert s.plot(server, 'dataset1', 'scalar', start, '1970-01-05Z')
+    # One request per plot and no launch checks
+    assert len(httpd.paths) == 3 and httpd.connections == 1
+    assert httpd.paths[0].startswith('/?uri=vap%2Bhapi%3Ahttp')
+    assert not os.path.exists(os.path.join(opts['cachedir'], 'jar'))
+
+    uris = [s.uri(server, 'dataset1', p, '1970-01-01Z', '1970-01-02Z') for p in ['scalar', 'vector']]
+    assert s.ploturis(uris) == [True, True]
+    assert len(httpd.paths) == 5 and httpd.connections == 1
+  finally:
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_session_relaunch():
+
+  # Server that is running but does not respond with OK
+  httpd = _server(body=b'Error\n')
+
+  try:
+    s = AutoplotSession(port=httpd.server_address[1], cachedir=tempfile.mkdtemp())
+    launched = []
+    s.launch = lambda uri: launched.append(uri) or True
+    uris = [s.uri(server, 'dataset1', p, '1970-01-01Z', '1970-01-02Z') for p in ['scalar', 'vector']]
+    # Launched once with first URI.
+    assert s.ploturis(uris) == [True, False]
+    assert launched == uris[0:1]
+  finally:
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_session_launch():
+
+  # Port with no server
+  sock = socket.socket()
+  sock.bind(('localhost', 0))
+  port = sock.getsockname()[1]
+  sock.close()
+
+  s = AutoplotSession(port=port, cachedir=tempfile.mkdtemp())
+  launched = []
+  s.launch = lambda uri: launched.append(uri) or True
+  assert s.plot(server, 'dataset1', 'scalar', '1970-01-01Z', '1970-01-02Z')
+  assert launched == [s.uri(server, 'dataset1', 'scalar', '1970-01-01Z', '1970-01-02Z')]
+
+
+def test_cached():
+
+  cachedir = tempfile.mkdtemp()
+  calls = []
+  def func():
+    calls.append(1)
+    return '1.8.0'
+
+  assert _cached(cachedir, 'java', 100, func) == '1.8.0'
+  assert _cached(cachedir, 'java', 100, func) == '1.8.0'
+  assert len(calls) == 1
+  assert _cached(cachedir, 'java', 0, func) == '1.8.0'
+  assert len(calls) == 2
+
+  # None is not cached
+  assert _cached(cachedir, 'jar', 100, lambda: None) is None
+  assert _cached(cachedir, 'jar', 100, lambda: 'x') == 'x'
+
+  # Processes and threads that share cachedir do not write the same file.
+  threads = [threading.Thread(target=lambda k=k: [_cached(cachedir, str(k), 0, func) for i in range(20)])
+             for k in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(calls) == 2 + 8*20
+  assert os.listdir(os.path.join(cachedir, 'jar')) == ['autoplot.json']
+
+
+def test_updatejar_offline():
+
+  # Port with no server
+  sock = socket.socket()
+  sock.bind(('localhost', 0))
+  jarurl = 'http://localhost:%d/autoplot.jar' % sock.getsockname()[1]
+  sock.close()
+
+  s = AutoplotSession(cachedir=tempfile.mkdtemp())
+  s.jarurl = lambda: jarurl
+  try:
+    s.updatejar()
+    assert False, 'Expected OSError'
+  except OSError:
+    pass
+
+  # Existing jar is used and the failed check is not cached.
+  os.makedirs(os.path.dirname(s.jarpath()))
+  with open(s.jarpath(), 'w') as f:
+    f.write('jar')
+  with warnings.catch_warnings(record=True) as w:
+    warnings.simplefilter('always')
+    assert s.updatejar() == s.jarpath()
+  assert len(w) == 1 and 'Could not check' in str(w[0].message)
+  assert _cached(s.cachedir, jarurl, 100, lambda: 'checked') == 'checked'
+  assert _updatejar(jarurl, s.jarpath()) is None
+
+
+if __name__ == "__main__":
+  test_session()
+  test_session_relaunch()
+  test_session_launch()
+  test_cached()
+  test_updatejar_offline()
@@ -0,0 +1,72 @@
+import sys
+import datetime
+
+import numpy as np
+
+from hapiplot import hapiplot, hapiplot_batch
+
+server = 'http://localhost/hapi'
+days = ['1970-01-%02dT00:00:00Z' % d for d in range(1, 6)]
+intervals = list(zip(days[:-1], days[1:]))
+
+
+def _hapi(server, dataset, parameters, start, stop, **kwargs):
+  # Response in the form returned by hapi() with 10-minute cadence.
+  t0 = datetime.datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+  t1 = datetime.datetime.strptime(stop, '%Y-%m-%dT%H:%M:%SZ')
+  t = np.arange(t0, t1, datetime.timedelta(minutes=10)).astype(datetime.datetime)
+  n = t.size
+  dtype = [('Time', 'S20'), ('scalar', '<f8'), ('spectra', '<f8', (12,))]
+  data = np.zeros(n, dtype=dtype)
+  data['Time'] = [ti.strftime('%Y-%m-%dT%H:%M:%SZ') for ti in t]
+  # Values depend only on time so that responses for merged intervals match.
+  m = ((t - datetime.datetime(1970, 1, 1))/datetime.timedelta(minutes=10)).astype(float)
+  data['scalar'] = np.sin(m/10.)*(m//144 + 1)
+  data['spectra'] = np.outer(m % 50, np.arange(12))
+  # Third day all NaN so a new figure is needed for it.
+  data['scalar'][(t >= datetime.datetime(1970, 1, 3)) & (t < datetime.datetime(1970, 1, 4))] = np.nan
+  meta = {
+          'x_server': server,
+          'x_dataset': dataset,
+          'x_time.min': start,
+          'x_time.max': stop,
+          'parameters': [
+            {'name': 'Time', 'type': 'isotime', 'units': 'UTC', 'length': 20},
+            {'name': 'scalar', 'type': 'double', 'units': 'nT', 'fill': None},
+            {'name': 'spectra', 'type': 'double', 'units': 'm', 'fill': None, 'size': [12],
+             'bins': [{'name': 'energy', 'units': 'eV', 'centers': list(range(12))}]}
+          ]
+  }
+  return data, meta
+
+
+def test_batch():
+  # Images should be the same as those from separate hapiplot() calls.
+
+  popts = {'useimagecache': False}
+
+  hapi_orig = sys.modules['hapiclient.hapi'].hapi
+  sys.modules['hapiclient.hapi'].hapi = _hapi
+  try:
+    for mergeintervals in [1, 2]:
+      metas = hapiplot_batch(server, 'dataset1', 'scalar,spectra', intervals,
+                             mergeintervals=mergeintervals, **popts)
+      assert len(metas) == len(intervals)
+      for k, (start, stop) in enumerate(intervals):
+        data, meta = _hapi(server, 'dataset1', 'scalar,spectra', start, stop)
+        meta = hapiplot(data, meta, returnimage=True, **popts)
+        for i in [1, 2]:
+          assert metas[k]['parameters'][i]['hapiplot']['image'] == meta['parameters'][i]['hapiplot']['image'], \
+                'Image for %s differs for interval %d' % (meta['parameters'][i]['name'], k)
+
+      # Figure reused except for all NaN day and day after it
+      figs = [id(m['parameters'][1]['hapiplot']['figure']) for m in metas]
+      assert figs[0] == figs[1] and figs[1] != figs[2] and figs[2] != figs[3]
+      figs = [id(m['parameters'][2]['hapiplot']['figure']) for m in metas]
+      assert len(set(figs)) == 1
+  finally:
+    sys.modules['hapiclient.hapi'].hapi = hapi_orig
+
+
+if __name__ == "__main__":
+  test_batch()
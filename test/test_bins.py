@@ -0,0 +1,106 @@
+import datetime
+
+import numpy as np
+
+from hapiplot.plot import bins
+
+
+def test_edges():
+
+  # Uniform centers
+  assert np.array_equal(bins.edges(np.array([1., 2., 3.])), [0.5, 1.5, 2.5, 3.5])
+
+  # Non-uniform centers are used as lower edges
+  assert np.array_equal(bins.edges(np.array([1., 2., 4.])), [1., 2., 4., 6.])
+
+  # Single center
+  assert np.array_equal(bins.edges(np.array([2.])), [1.5, 2.5])
+  t0 = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+  e = bins.edges(np.array([t0]))
+  assert list(e) == [t0 - datetime.timedelta(seconds=1), t0 + datetime.timedelta(seconds=1)]
+
+  # Datetimes
+  t = np.array([t0 + datetime.timedelta(minutes=m) for m in [0, 10, 20]])
+  e = bins.edges(t)
+  assert e.dtype == object
+  assert list(e) == [t0 + datetime.timedelta(minutes=m) for m in [-5, 5, 15, 25]]
+
+
+def test_centers():
+
+  # Uniform; centers unchanged and no labels
+  c, cl = bins.centers(np.array([0.5, 1.5, 2.5]), np.array([1., 2.]))
+  assert np.array_equal(c, [1., 2.]) and cl.size == 0
+
+  # Non-uniform; ticks at middle of bins labeled with lower edges
+  c, cl = bins.centers(np.array([1., 2., 4., 6.]), np.array([1., 2., 4.]))
+  assert np.array_equal(c, [1.5, 3., 5.])
+  assert np.array_equal(cl, [1., 2., 4., 6.])
+
+  # Integer edges keep their type
+  c, cl = bins.centers(np.array([1, 2, 5]), np.array([1, 2]))
+  assert c.dtype == np.array([1]).dtype and np.array_equal(c, [1, 3])
+
+
+def test_boundaries():
+
+  x, xc, xedges, xcl, xlabels = bins.boundaries(np.array([1., 2., 3.]), 3)
+  assert np.array_equal(x, [0.5, 1.5, 2.5, 3.5]) and np.array_equal(xc, [1., 2., 3.])
+  assert xedges is False and xlabels is None
+
+  # Edges given
+  x, xc, xedges, xcl, xlabels = bins.boundaries(np.array([1., 2., 3.]), 2)
+  assert np.array_equal(x, [1., 2., 3.]) and xc.size == 0 and xedges is True
+
+  # Categories
+  labels = np.array(['a', 'b', 'c'])
+  x, xc, xedges, xcl, xlabels = bins.boundaries(labels, 3)
+  assert np.array_equal(x, [-0.5, 0.5, 1.5, 2.5]) and np.array_equal(xc, [0, 1, 2])
+  assert xlabels is labels
+
+
+def test_gaps():
+
+  z = np.arange(8.).reshape(4, 2)
+
+  # Contiguous bins
+  e = np.array([[0, 1], [1, 2], [2, 3], [3, 4]])
+  en, zn, igaps = bins.gaps(e, z, axis=0)
+  assert np.array_equal(en, [0, 1, 2, 3, 4]) and zn is z and igaps.size == 0
+
+  # Gaps after first and third bins
+  e = np.array([[0, 1], [2, 3], [3, 4], [5, 6]])
+  en, zn, igaps = bins.gaps(e, z, axis=0)
+  assert np.array_equal(en, [0, 1, 2, 3, 4, 5, 6])
+  assert np.array_equal(igaps, [1, 4]) and igaps.dtype == np.int32
+  assert zn.shape == (6, 2)
+  assert np.all(np.isnan(zn[igaps, :]))
+  assert np.array_equal(np.delete(zn, igaps, axis=0), z)
+
+  # Same along columns
+  en, znt, igaps = bins.gaps(e, z.T, axis=1)
+  assert np.array_equal(en, [0, 1, 2, 3, 4, 5, 6]) and np.array_equal(znt, zn.T, equal_nan=True)
+
+  # Integer z is converted to float so NaNs can be inserted
+  en, zn, igaps = bins.gaps(e, z.astype(int), axis=0)
+  assert zn.dtype == np.float64
+
+  # Single bin
+  en, zn, igaps = bins.gaps(np.array([[2, 5]]), z[0:1, :], axis=0)
+  assert np.array_equal(en, [2, 5]) and igaps.size == 0
+
+  # Large number of time ranges with gaps is fast (was quadratic)
+  n = 100000
+  t0 = np.arange(n)*60.
+  t1 = t0 + 60.
+  t1[::10] -= 30.  # Gap after every 10th record
+  z = np.ones((n, 5))
+  en, zn, igaps = bins.gaps(np.column_stack((t0, t1)), z, axis=0)
+  assert igaps.size == n//10 and zn.shape == (n + n//10, 5)
+
+
+if __name__ == "__main__":
+  test_edges()
+  test_centers()
+  test_boundaries()
+  test_gaps()
@@ -0,0 +1,61 @@
+import io
+import datetime
+
+import numpy as np
+
+from hapiplot.plot.categories import encode
+from hapiplot.plot.timeseries import timeseries
+
+
+def test_encode():
+
+  y = np.array([b'on', b'off', b'fill', b'on', b'off', b'on'])
+  codes, categories, nfill = encode(y)
+  assert list(categories) == ['fill', 'off', 'on'] and categories.dtype.kind == 'U'
+  assert codes.dtype == np.uint8 and list(codes) == [2, 1, 0, 2, 1, 2]
+  assert nfill == 0
+
+  # Fill values get code len(categories)
+  codes, categories, nfill = encode(y, 'fill')
+  assert list(categories) == ['off', 'on'] and nfill == 1
+  assert list(codes) == [1, 0, 2, 1, 0, 1]
+
+  # Fill value not in data
+  codes, categories, nfill = encode(y, 'none')
+  assert len(categories) == 3 and nfill == 0
+
+  # str values and shape kept
+  codes, categories, nfill = encode(y.astype('U').reshape(3, 2), 'on')
+  assert codes.shape == (3, 2) and list(categories) == ['fill', 'off'] and nfill == 3
+
+  # UTF-8
+  codes, categories, nfill = encode(np.array(['é'.encode('utf-8'), b'e']))
+  assert list(categories) == ['e', 'é']
+
+  # Code type large enough for number of categories
+  codes, categories, nfill = encode(np.arange(300).astype('S3'))
+  assert codes.dtype == np.uint16 and codes.max() == 299
+
+
+def test_timeseries():
+  # Strings, bytes, and codes with ycategories give the same image
+
+  def image(y, **kwargs):
+    fig = timeseries(t, y, returnimage=True, **kwargs)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+  t0 = datetime.datetime(1970, 1, 1)
+  t = np.array([t0 + datetime.timedelta(minutes=m) for m in range(20)])
+  y = np.array([b'a', b'bb', b'ccc'])[np.arange(20) % 3]
+
+  codes, categories, _ = encode(y)
+  img = image(y.astype('U'))
+  assert image(y) == img
+  assert image(codes, ycategories=categories) == img
+
+
+if __name__ == "__main__":
+  test_encode()
+  test_timeseries()
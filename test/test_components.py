@@ -0,0 +1,56 @@
+import numpy as np
+
+from hapiplot import hapiplot
+from hapiplot.testing import generate
+
+
+def _component(data, meta, i, j):
+  # Data and meta for component j of parameter i as a parameter of size [N2]
+  name = meta['parameters'][i]['name']
+  name_new = name + '[' + str(j) + ',:]'
+  datar = np.zeros(data.shape[0], dtype=[('Time', data['Time'].dtype), (name_new, '<f8', data[name].shape[2])])
+  datar['Time'] = data['Time']
+  datar[name_new] = data[name][:, j, :]
+  metar = meta.copy()
+  p = meta['parameters'][i].copy()
+  p['name'] = name_new
+  p['name_orig'] = name
+  p['size'] = [p['size'][1]]
+  if 'bins' in p:
+    p['bins'] = [p['bins'][1]]
+  metar['parameters'] = [meta['parameters'][0], p]
+  return datar, metar
+
+
+def test_components():
+  # One image per component, the same as the image for the component
+  # plotted as a parameter, and independent of workers.
+
+  popts = {'useimagecache': False, 'returnimage': True}
+
+  titles = {1: ['', '', ''],
+            2: ['\nangle = 0 [deg]', '\nangle = 90 [deg]', '\nangle = 180 [deg]']}
+
+  data, meta = generate('matrix,matrix_bins', 50)
+  meta = hapiplot(data, meta, **popts)
+  for workertype in ['thread', 'process']:
+    data, metaw = generate('matrix,matrix_bins', 50)
+    metaw = hapiplot(data, metaw, workers=3, workertype=workertype, **popts)
+    for i in [1, 2]:
+      imgs = [hp['image'] for hp in metaw['parameters'][i]['hapiplot']['components']]
+      assert imgs == [hp['image'] for hp in meta['parameters'][i]['hapiplot']['components']]
+
+  for i in [1, 2]:
+    hps = meta['parameters'][i]['hapiplot']['components']
+    assert len(hps) == 3
+    assert meta['parameters'][i]['hapiplot']['image'] == hps[0]['image']
+    for j in range(3):
+      datar, metar = _component(data, meta, i, j)
+      title = meta['x_server'] + '\n' + meta['x_dataset'] + ' | ' + metar['parameters'][1]['name'] + titles[i][j]
+      metar = hapiplot(datar, metar, title=title, **popts)
+      assert hps[j]['image'] == metar['parameters'][1]['hapiplot']['image'], \
+            'Image for component %d of %s differs' % (j, meta['parameters'][i]['name'])
+
+
+if __name__ == "__main__":
+  test_components()
@@ -0,0 +1,63 @@
+import numpy as np
+
+from hapiplot.plot.timeseries import decimate, timeseries
+
+
+def test_decimate():
+
+  rng = np.random.default_rng(0)
+  N = 100000
+  n = 100
+  x = np.arange(N, dtype=np.float64)
+  y = rng.normal(size=N)
+
+  I = decimate(x, y, n)
+  assert np.all(np.diff(I) > 0)
+  assert I[0] == 0 and I[-1] == N - 1
+  assert I.size <= 4*n
+
+  # Min and max in each column are kept
+  for k in range(0, N, N//n):
+    j = np.arange(k, k + N//n)
+    Ij = I[(I >= j[0]) & (I <= j[-1])]
+    assert y[j].min() == y[Ij].min()
+    assert y[j].max() == y[Ij].max()
+
+  # NaNs are kept so that gaps are drawn
+  y[5000:5010] = np.nan
+  I = decimate(x, y, n)
+  assert np.any(np.isnan(y[I]))
+
+  # All-NaN columns are kept
+  y[0:2000] = np.nan
+  I = decimate(x, y, n)
+  assert np.isnan(y[I][0])
+
+  # Union of indices for 2-D y
+  y2 = np.column_stack((rng.normal(size=N), rng.normal(size=N)))
+  I2 = decimate(x, y2, n)
+  for c in range(2):
+    assert np.all(np.isin(decimate(x, y2[:, c], n), I2))
+
+  # No decimation if fewer than three points or x range is zero
+  assert np.array_equal(decimate(x[0:2], y[0:2], n), [0, 1])
+  assert np.array_equal(decimate(np.zeros(5), np.ones(5), n), np.arange(5))
+
+
+def test_decimate_times():
+  # isotime values (datetime64) are decimated in the same way as numbers.
+
+  N = 200000
+  t = np.datetime64('2000-01-01', 'ms') + np.arange(N)*np.timedelta64(1, 's')
+  y = t + np.random.default_rng(0).integers(0, 3600, N)*np.timedelta64(1, 's')
+  y[1000:1010] = np.datetime64('NaT')
+
+  info = {}
+  timeseries(t, y, returnimage=True, info=info)
+  assert info['decimation']['method'] == 'm4'
+  assert 0 < info['decimation']['npoints_plotted'] < N
+
+
+if __name__ == "__main__":
+  test_decimate()
+  test_decimate_times()
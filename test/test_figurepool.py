@@ -0,0 +1,79 @@
+import numpy as np
+
+from hapiplot import hapiplot
+from hapiplot.plot.figurepool import FigurePool
+from hapiplot.testing import generate
+
+
+def _response(k):
+  # Response with values that depend on k. For k = 1, scalar has NaNs.
+  data, meta = generate('scalar,vector,spectra', 50, seed=k)
+  if k == 1:
+    data['scalar'][10:20] = np.nan
+  return data, meta
+
+
+def test_figurepool():
+  # Images should be the same as those created without a pool.
+
+  popts = {'useimagecache': False, 'returnimage': True}
+  pool = FigurePool(maxsize=2)
+
+  for k in range(3):
+    for transparent in [False, True]:
+      rc = {'savefig.transparent': transparent}
+      data, meta = _response(k)
+      meta = hapiplot(data, meta, rcParams=rc, **popts)
+      data, metap = _response(k)
+      metap = hapiplot(data, metap, rcParams=rc, figurepool=pool, **popts)
+      for i in [1, 2, 3]:
+        hp = metap['parameters'][i]['hapiplot']
+        assert hp['image'] == meta['parameters'][i]['hapiplot']['image'], \
+              'Image for %s differs for k=%d' % (meta['parameters'][i]['name'], k)
+        assert 'figure' not in hp and 'colorbar' not in hp
+
+  stats = pool.stats()
+  # One timeseries key and one heatmap key. Figures are released before the
+  # next parameter is plotted, so only one is needed per key.
+  assert stats['acquired'] == 18 and stats['misses'] == 2
+  assert stats['hits'] == 16 and stats['hitrate'] == 16/18
+  assert stats['released'] == 18 and stats['size'] == 2 and stats['keys'] == 2
+
+  # Figures not from pool are rejected
+  from matplotlib.figure import Figure
+  try:
+    pool.release(Figure())
+    assert False, 'ValueError not raised'
+  except ValueError:
+    pass
+
+  pool.clear()
+  assert pool.stats()['size'] == 0
+
+
+def test_figurepool_colorbar():
+  # Colorbar axes kept by pool should be removed for an all-NaN heatmap and
+  # images should be the same as those created without a pool.
+
+  popts = {'useimagecache': False, 'returnimage': True}
+  pool = FigurePool()
+
+  def response(allnan):
+    data, meta = generate('spectra', 50, seed=1)
+    if allnan:
+      data['spectra'][:] = np.nan
+    return data, meta
+
+  for allnan in [False, True, False]:
+    meta = hapiplot(*response(allnan), **popts)
+    metap = hapiplot(*response(allnan), figurepool=pool, **popts)
+    assert metap['parameters'][1]['hapiplot']['image'] \
+            == meta['parameters'][1]['hapiplot']['image'], \
+            'Image differs for allnan=%s' % allnan
+
+  assert pool.stats()['misses'] == 1
+
+
+if __name__ == "__main__":
+  test_figurepool()
+  test_figurepool_colorbar()
@@ -0,0 +1,75 @@
+import numpy as np
+
+from hapiplot.fill import fillmask, fill2float, fill2mask, fill2nat, int2float
+
+
+def test_fillmask():
+
+  y = np.array([1.0, -1e31, 2.0])
+  assert list(fillmask(y, '-1e31')) == [False, True, False]
+  assert fillmask(y, '-2e31') is np.ma.nomask
+  assert fillmask(y, 'nan') is np.ma.nomask
+  assert fillmask(y, None) is np.ma.nomask
+
+  # float32 fill in double data
+  y = np.array([1.0, np.float32(-1e31), 2.0])
+  assert list(fillmask(y, '-1e31')) == [False, True, False]
+
+  # Strings are compared as returned by the HAPI client
+  y = np.array([b'2000-01-01Z', b'9999-01-01Z'])
+  assert list(fillmask(y, '9999-01-01Z')) == [False, True]
+  assert list(fillmask(y.astype('U'), '9999-01-01Z')) == [False, True]
+
+
+def test_int2float():
+
+  y = np.array([1, -1, 2**24], dtype=np.int32)
+  assert int2float(y).dtype == np.float32
+  y = np.array([1, -1, 2**24 + 1], dtype=np.int64)
+  assert int2float(y).dtype == np.float64
+  # Masked values do not determine dtype
+  yf = int2float(y, y == 2**24 + 1)
+  assert yf.dtype == np.float32 and np.isnan(yf[2]) and yf[1] == -1
+
+  assert int2float(np.array([1], dtype=np.int16)).dtype == np.float32
+
+  y = np.array([[1, 99], [99, 2]], dtype=np.int32)
+  yf = fill2float(y, '99')
+  assert yf.dtype == np.float32 and list(np.isnan(yf.ravel())) == [False, True, True, False]
+
+  y = np.array([1.0, 99.0])
+  assert fill2float(y, '99') is y and np.isnan(y[1])
+
+
+def test_fill2mask():
+
+  y = np.array([b'a', b'fill', b'b'])
+  ym = fill2mask(y, 'fill')
+  assert list(ym.mask) == [False, True, False]
+  assert np.shares_memory(ym, y)
+  assert fill2mask(y, 'none').mask is np.ma.nomask
+
+
+def test_fill2nat():
+
+  # Fills in forms other than that of the fill value are found
+  y = np.array([b'2000-01-01T00:00:00.000Z', b'9999-12-31T00:00:00.000Z'])
+  for fill in ['9999-12-31T00:00:00.000Z', '9999-12-31T00:00Z', '9999-12-31', '9999-365T00:00']:
+    t = fill2nat(y, fill)
+    assert t.dtype == np.dtype('datetime64[us]')
+    assert list(np.isnat(t)) == [False, True] and t[0] == np.datetime64('2000-01-01')
+  y = np.array([b'2000-001T00:00Z', b'9999-365T00:00Z'])
+  assert list(np.isnat(fill2nat(y, '9999-12-31T00:00:00.000Z'))) == [False, True]
+
+  # Fills that are not valid times are compared as strings
+  y = np.array([b'2000-01-01Z', b'fill'])
+  assert list(np.isnat(fill2nat(y, 'fill'))) == [False, True]
+  assert np.all(np.isnat(fill2nat(y[1:], 'fill')))
+  assert not np.any(np.isnat(fill2nat(y[:1], None)))
+
+
+if __name__ == "__main__":
+  test_fillmask()
+  test_int2float()
+  test_fill2mask()
+  test_fill2nat()
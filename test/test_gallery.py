@@ -0,0 +1,95 @@
+import os
+import json
+import datetime
+import tempfile
+
+import numpy as np
+
+from hapiplot import hapiplot, pregenerate
+from hapiplot.gallery.gallery import _duration, _intervals
+from hapiplot.testing import HAPIServer
+
+
+def test_intervals():
+
+  assert _duration('P1D') == datetime.timedelta(days=1)
+  assert _duration('PT1H30M') == datetime.timedelta(hours=1, minutes=30)
+  assert _duration('PT0.5S') == datetime.timedelta(seconds=0.5)
+  assert _duration(np.timedelta64(10, 'm')) == datetime.timedelta(minutes=10)
+  for cadence in ['P1M', 'P', '1D']:
+    try:
+      _duration(cadence)
+      assert False, cadence
+    except ValueError:
+      pass
+
+  intervals = _intervals('2000-01-01Z', '2000-01-01T02:30Z', 'PT1H')
+  assert intervals == [('2000-01-01T00:00:00Z', '2000-01-01T01:00:00Z'),
+                       ('2000-01-01T01:00:00Z', '2000-01-01T02:00:00Z'),
+                       ('2000-01-01T02:00:00Z', '2000-01-01T02:30:00Z')]
+
+
+def test_pregenerate():
+
+  cachedir = tempfile.mkdtemp()
+  opts = {'cachedir': cachedir, 'cache': False, 'usecache': False}
+  start = '2000-01-01T00:00:00Z'
+  stop = '2000-01-01T01:00:00Z'
+
+  with HAPIServer(n=3600, kinds=['scalar', 'spectra', 'matrix']) as server:
+
+    manifest = os.path.join(cachedir, 'index.json')
+    for workers in [1, 2]:
+      # All images are created again, so data for each interval are requested.
+      nrequests = len(server.requests)
+      index = pregenerate(server.url, 'synthetic/scalar', 'scalar', start, stop,
+                          'PT10M', workers=workers, overwrite=True,
+                          manifest=manifest, **opts)
+      assert len([r for r in server.requests[nrequests:] if '/data?' in r]) == 6
+      assert len(index['intervals']) == 6 and index['cadence'] == 600
+      for interval in index['intervals']:
+        file = os.path.join(cachedir, interval['images']['scalar'])
+        assert os.path.exists(file)
+
+    # Only missing images are created
+    os.remove(file)
+    nrequests = len(server.requests)
+    pregenerate(server.url, 'synthetic/scalar', 'scalar', start, stop,
+                'PT10M', workers=2, manifest=manifest, **opts)
+    assert os.path.exists(file)
+    assert len([r for r in server.requests[nrequests:] if '/data?' in r]) == 1
+    with open(manifest) as f:
+      assert json.load(f)['intervals'][-1]['images']['scalar'] == os.path.relpath(file, cachedir)
+
+    nrequests = len(server.requests)
+    pregenerate(server.url, 'synthetic/scalar', 'scalar', start, stop,
+                'PT10M', manifest=manifest, **opts)
+    assert len([r for r in server.requests[nrequests:] if '/data?' in r]) == 0
+
+    # A parameter with size [3, 4] has an image for each of 3 components.
+    index = pregenerate(server.url, 'synthetic/matrix', 'matrix', start, stop,
+                        'PT30M', manifest=manifest, **opts)
+    images = index['intervals'][0]['images']
+    assert sorted(images) == ['matrix[0,:]', 'matrix[1,:]', 'matrix[2,:]']
+    for file in images.values():
+      assert os.path.exists(os.path.join(cachedir, file))
+    nrequests = len(server.requests)
+    pregenerate(server.url, 'synthetic/matrix', 'matrix', start, stop,
+                'PT30M', manifest=manifest, **opts)
+    assert len([r for r in server.requests[nrequests:] if '/data?' in r]) == 0
+
+    # Images have the names hapiplot() uses, so hapiplot() does not request data.
+    index = pregenerate(server.url, 'synthetic/scalar', 'scalar', start, stop,
+                        'PT30M', manifest=manifest, returnformat='svg', **opts)
+    interval = index['intervals'][1]
+    assert interval['images']['scalar'].endswith('.svg')
+    nrequests = len(server.requests)
+    data, meta = hapiplot(server.url, 'synthetic/scalar', 'scalar', interval['start'],
+                          interval['stop'], returnimage=True, returnformat='svg', **opts)
+    assert len(server.requests) == nrequests
+    assert meta['parameters'][1]['hapiplot']['imagefile'] == os.path.join(cachedir, interval['images']['scalar'])
+
+
+if __name__ == "__main__":
+  test_intervals()
+  test_pregenerate()
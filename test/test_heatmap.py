@@ -0,0 +1,193 @@
+import datetime
+
+import numpy as np
+
+from matplotlib import colors
+from matplotlib.figure import Figure
+from matplotlib.image import AxesImage
+from matplotlib.collections import QuadMesh
+from matplotlib.cm import ScalarMappable
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from hapiplot.plot import heatmap as hm
+from hapiplot.plot.heatmap import heatmap, cellcolors, drawmesh, MeshImage
+
+
+def _heatmap(x, y, z, **kwargs):
+  fig, cb = heatmap(x, y, z, returnimage=True, **kwargs)
+  ax = fig.axes[0]
+  meshes = list(ax.images) + [c for c in ax.collections if isinstance(c, QuadMesh)]
+  labels = [t.get_text() for l in fig.legends for t in l.get_texts()]
+  return ax, meshes, labels
+
+
+def _facecolors(mesh):
+  if isinstance(mesh, QuadMesh):
+    mesh.update_scalarmappable()
+    return mesh.get_facecolors()
+  return np.asarray(mesh.get_array()).reshape(-1, 4)/255
+
+
+def test_cellcolors():
+
+  z = np.array([[1., np.nan], [0., 2.]])
+  tiles = [(np.isnan, colors.to_rgba('red'))]
+  index, lut = cellcolors(z, tiles)
+  assert index.shape == z.shape and lut.shape == (2, 4)
+  assert np.array_equal(lut[index[0, 1]], colors.to_rgba('red'))
+  assert np.all(lut[index[[0, 1, 1], [0, 0, 1]], 3] == 0)  # Data cells transparent if no mappable
+
+  # Colors of cells not in a tile are those of mappable, including under,
+  # over, and bad colors; later tiles are colored over earlier ones.
+  z = np.linspace(-1, 3, 400).reshape(20, 20)
+  z[0, :5] = np.nan
+  for norm in [colors.Normalize(vmin=0, vmax=2), colors.LogNorm(vmin=0.1, vmax=2)]:
+    cmap = colors.ListedColormap(['b', 'g', 'r']).with_extremes(under='k', over='w', bad='c')
+    mappable = ScalarMappable(norm=norm, cmap=cmap)
+    index, lut = cellcolors(z, [], mappable)
+    assert np.array_equal(lut[index], mappable.to_rgba(z))
+  index, lut = cellcolors(z, [(np.isnan, (1, 0, 0, 1)), (np.s_[:, 0], (0, 1, 0, 1))], mappable)
+  assert np.array_equal(lut[index[0, 0]], (0, 1, 0, 1)) and np.array_equal(lut[index[0, 1]], (1, 0, 0, 1))
+  assert np.array_equal(lut[index[1:, 1:]], mappable.to_rgba(z[1:, 1:]))
+
+
+def test_single_layer():
+
+  x = np.arange(10.)
+  y = np.arange(5.)
+  z = np.arange(50.).reshape(5, 10)
+  z[0, 0] = np.nan  # Was not detected as a NaN
+  z[2, 3:5] = np.nan
+
+  # NaNs
+  ax, meshes, labels = _heatmap(x, y, z)
+  assert len(meshes) == 1 and labels == ['NaN']
+  fc = _facecolors(meshes[0])
+  assert np.allclose(fc[0], [0.95, 0.95, 0.95, 1], atol=1/255)
+
+  # NaNs and gaps
+  xe = np.column_stack((x, x + 1))
+  xe[5:, :] += 0.5
+  ax, meshes, labels = _heatmap(xe, y, z)
+  assert len(meshes) == 1 and labels == ['No data', 'NaN']
+  assert _facecolors(meshes[0]).shape == (5*11, 4)
+
+  # NaN hatch and gaps
+  ax, meshes, labels = _heatmap(xe, y, z, **{'nan.hatch': '/'})
+  assert labels == ['No data', 'NaN'] and len(ax.collections) == 2
+
+  # Gaps and rebinning; NaNs in gap rows are not NaN cells
+  ye = np.array([[0., 1.], [1., 2.], [3., 4.]])
+  zr = np.arange(3*5000.).reshape(3, 5000)
+  for rebin in ['nanmean', 'max', False]:
+    ax, meshes, labels = _heatmap(np.arange(5000.), ye, zr, rebin=rebin)
+    assert labels == ['No data']
+  zr[0, 0] = np.nan
+  ax, meshes, labels = _heatmap(np.arange(5000.), ye, zr, rebin='max')
+  assert labels == ['No data', 'NaN']
+
+  # Alpha of NaN tiles
+  ax, meshes, labels = _heatmap(x, y, z, **{'nan.alpha': 0.5, 'nan.color': 'red'})
+  assert np.allclose(_facecolors(meshes[0])[0], colors.to_rgba('red', 0.5), atol=1/255)
+
+  # Zeros with logz; input not modified
+  z = np.arange(50.).reshape(5, 10)/7
+  zc = z.copy()
+  ax, meshes, labels = _heatmap(x, y, z, logz=True)
+  assert len(meshes) == 1 and np.array_equal(z, zc)
+  assert np.array_equal(_facecolors(meshes[0])[0], [1, 1, 1, 1])
+
+  # No special tiles; colors of image are those of colorbar
+  fig, cb = heatmap(x, y, z, returnimage=True)
+  ax, meshes, labels = _heatmap(x, y, z)
+  assert len(meshes) == 1 and labels == [] and isinstance(meshes[0], AxesImage)
+  assert np.allclose(_facecolors(meshes[0]), cb.mappable.to_rgba(z.ravel()), atol=0.5/255)
+
+  # Edges are drawn using a QuadMesh
+  ax, meshes, labels = _heatmap(x, y, z, edgecolor='k')
+  assert isinstance(meshes[0], QuadMesh)
+
+
+def test_drawmesh():
+
+  z = np.arange(12.).reshape(3, 4)
+  x = np.array([0., 1., 2., 3., 4.])
+  xn = np.array([0., 1., 2., 5., 6.])
+  y = np.array([10., 20., 30., 40.])
+
+  for xe, cls in [(x, AxesImage), (xn, MeshImage), (x[::-1], QuadMesh)]:
+    ax = Figure().add_subplot(111)
+    mesh = drawmesh(ax, xe, y, z)
+    assert type(mesh) is cls
+    ax0 = Figure().add_subplot(111)
+    ax0.pcolormesh(xe, y, z)
+    assert ax.get_xlim() == ax0.get_xlim() and ax.get_ylim() == ax0.get_ylim()
+
+  ax = Figure().add_subplot(111)
+  assert isinstance(drawmesh(ax, x, y, z, image=False), QuadMesh)
+
+  # Edges that drift from uniform by more than a small fraction of a cell are
+  # not drawn as an AxesImage (pcolorfast() allows 1% in width).
+  n = 1000
+  xd = np.cumsum(np.linspace(0.995, 1.005, n + 1))
+  ax = Figure().add_subplot(111)
+  assert isinstance(drawmesh(ax, xd, y, np.ones((3, n))), MeshImage)
+
+  # Datetimes
+  t0 = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+  xt = np.array([t0 + datetime.timedelta(minutes=m) for m in range(5)])
+  ax = Figure().add_subplot(111)
+  assert isinstance(drawmesh(ax, xt, y, z), AxesImage)
+
+
+def test_meshimage():
+
+  # A MeshImage has the same pixels as a QuadMesh without antialiasing.
+  def pixels(xe, ye, c, image, **kwargs):
+    fig = Figure(figsize=(3.1, 2.3), dpi=97)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    mesh = drawmesh(ax, xe, ye, c, image=image, **kwargs)
+    assert type(mesh) is (MeshImage if image else QuadMesh)
+    ax.set_axis_off()
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())
+
+  rng = np.random.default_rng(0)
+  # Colors that are whole bytes so that rounding of colors does not differ.
+  cmap = colors.ListedColormap(rng.integers(0, 256, (50, 3))/255)
+  for trial in range(10):
+    ny, nx = rng.integers(2, 40, 2)
+    xe = np.cumsum(rng.uniform(0.1, 3, nx + 1))
+    ye = np.cumsum(rng.uniform(0.1, 3, ny + 1))
+    c = rng.integers(0, 50, (ny, nx))
+    kwargs = {'cmap': cmap, 'norm': colors.NoNorm()}
+    assert np.array_equal(pixels(xe, ye, c, True, **kwargs),
+                          pixels(xe, ye, c, False, antialiased=False, **kwargs))
+
+
+def test_meshimage_fallback():
+
+  # pcolormesh() is used if MeshImage is not supported
+  assert hm.MESHIMAGE
+  z = np.arange(12.).reshape(3, 4)
+  x = np.array([0., 1., 2., 5., 6.])
+  y = np.array([10., 20., 30., 40.])
+  try:
+    hm.MESHIMAGE = False
+    ax = Figure().add_subplot(111)
+    assert isinstance(drawmesh(ax, x, y, z), QuadMesh)
+    assert isinstance(drawmesh(ax, x[[0, -1]], y, z[:, :1]), AxesImage)
+    ax, meshes, labels = _heatmap(x, y, z)
+    assert len(meshes) == 1 and isinstance(meshes[0], QuadMesh)
+    assert np.allclose(_facecolors(meshes[0]), _facecolors(drawmesh(ax, x, y, z, cmap='viridis')), atol=1/255)
+  finally:
+    hm.MESHIMAGE = True
+
+
+if __name__ == "__main__":
+  test_cellcolors()
+  test_single_layer()
+  test_drawmesh()
+  test_meshimage()
+  test_meshimage_fallback()
@@ -0,0 +1,143 @@
+import os
+import threading
+import tempfile
+
+import numpy as np
+
+from hapiplot import hapiplot
+from hapiplot.imagecache import ImageCache, imagecache
+
+
+def test_imagecache():
+
+  d = tempfile.mkdtemp()
+  ic = ImageCache(d, maxbytes=250)
+
+  paths = [os.path.join(d, 'server', 'img%d.png' % k) for k in range(3)]
+  for path in paths:
+    ic.put(path, b'x'*100)
+
+  # Least recently used image evicted
+  assert not os.path.exists(paths[0])
+  assert ic.get(paths[0]) is None
+  assert ic.stats()['files'] == 2
+  assert ic.stats()['bytes'] == 200
+
+  # Access updates LRU order
+  assert ic.get(paths[1]) == b'x'*100
+  ic.put(os.path.join(d, 'server', 'img3.png'), b'x'*100)
+  assert os.path.exists(paths[1])
+  assert not os.path.exists(paths[2])
+
+  # Order is by access, not by access time, which may be equal
+  ic.get(paths[1])
+  ic.get(os.path.join(d, 'server', 'img3.png'))
+  assert [e['path'] for e in ic.entries()] == [os.path.join(d, 'server', 'img3.png'), paths[1]]
+
+  # Connection of each thread is used
+  result = []
+  thread = threading.Thread(target=lambda: result.append(ic.get(paths[1])))
+  thread.start()
+  thread.join()
+  assert result == [b'x'*100]
+  assert ic.entries()[0]['path'] == paths[1]
+
+  # Accesses are written to the index when flushed
+  ic.flushinterval = 3600
+  hits = {e['path']: e['hits'] for e in ic.entries()}
+  for k in range(3):
+    ic.get(paths[1])
+  assert {e['path']: e['hits'] for e in ImageCache(d).entries()} == hits
+  ic.flush()
+  entry = ImageCache(d).entries()[0]
+  assert entry['path'] == paths[1] and entry['hits'] == hits[paths[1]] + 3
+  del ic.flushinterval
+
+  # Replacing an image does not double count it
+  ic.put(paths[1], b'y'*50)
+  assert ic.stats()['bytes'] == 150
+
+  # LFU keeps most frequently used image
+  ic.policy = 'lfu'
+  for k in range(3):
+    ic.get(paths[1])
+  ic.put(os.path.join(d, 'server', 'img4.png'), b'x'*100)
+  assert os.path.exists(paths[1])
+
+  # Files not in index are indexed when read
+  path = os.path.join(d, 'server', 'other.png')
+  with open(path, 'wb') as f:
+    f.write(b'z'*10)
+  assert ic.get(path) == b'z'*10
+  assert path in [e['path'] for e in ic.entries()]
+
+  ic.rebuild()
+  assert ic.stats()['bytes'] == sum(e['size'] for e in ic.entries())
+
+  n = ic.stats()['files']
+  assert ic.prune(maxage=0) == n
+  assert ic.stats() == {'files': 0, 'bytes': 0, 'maxbytes': 250, 'policy': 'lfu'}
+
+  # imagecache() returns one object per directory and keeps settings
+  assert imagecache(d, maxbytes=10) is imagecache(d)
+  assert imagecache(d).maxbytes == 10
+
+  # Settings are saved in the index
+  assert ImageCache(d).maxbytes == 10
+  assert ImageCache(d).policy == 'lfu'
+  ImageCache(d, maxbytes=None)
+  assert imagecache(d).maxbytes is None
+
+
+def test_cachedimages():
+  # Five-argument form returns cached images without calling hapi()
+
+  d = tempfile.mkdtemp()
+  server = 'http://localhost:1/hapi' # Request would fail if made
+  start = '1970-01-01T00:00:00Z'
+  stop = '1970-01-01T00:01:00Z'
+
+  n = 10
+  data = np.zeros(n, dtype=[('Time', 'S20'), ('scalar', '<f8')])
+  data['Time'] = ['1970-01-01T00:00:%02dZ' % i for i in range(n)]
+  data['scalar'] = np.arange(n)
+  meta = {
+          'x_server': server,
+          'x_dataset': 'dataset1',
+          'x_time.min': start,
+          'x_time.max': stop,
+          'parameters': [
+            {'name': 'Time', 'type': 'isotime', 'units': 'UTC', 'length': 20},
+            {'name': 'scalar', 'type': 'double', 'units': 'nT', 'fill': None}
+          ]
+  }
+
+  # Quota set on the image cache is not changed by hapiplot()
+  imagecache(d, maxbytes=2**20, policy='lfu')
+
+  popts = {'returnimage': True, 'saveimage': True, 'cachedir': d,
+           'rcParams': {'lines.linewidth': 2}}
+  meta = hapiplot(data, meta, **popts)
+  assert imagecache(d).maxbytes == 2**20
+  assert imagecache(d).policy == 'lfu'
+
+  data2, meta2 = hapiplot(server, 'dataset1', 'scalar', start, stop, **popts)
+  assert data2 is None
+  assert imagecache(d).maxbytes == 2**20
+  assert meta2['parameters'][1]['hapiplot']['image'] == meta['parameters'][1]['hapiplot']['image']
+  assert meta2['parameters'][1]['hapiplot']['imagefile'] == meta['parameters'][1]['hapiplot']['imagefile']
+
+  # Different rcParams means different file name, so hapi() is called
+  popts['rcParams'] = {'lines.linewidth': 3}
+  try:
+    hapiplot(server, 'dataset1', 'scalar', start, stop, **popts)
+    assert False, 'Expected hapi() call to fail'
+  except AssertionError:
+    raise
+  except Exception:
+    pass
+
+
+if __name__ == "__main__":
+  test_imagecache()
+  test_cachedimages()
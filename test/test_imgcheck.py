@@ -0,0 +1,93 @@
+import os
+import io
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from hapiplot.plot.imgcheck import imgcheck, imgcheck_tree, compare
+
+
+def png(pixels, **kwargs):
+  buf = io.BytesIO()
+  Image.fromarray(pixels).save(buf, format='png', **kwargs)
+  return buf.getvalue()
+
+
+def test_compare():
+
+  a = np.zeros((20, 10, 4), dtype=np.uint8)
+  a[..., 3] = 255
+  b = a.copy()
+  b[0, 0, 1] = 3
+
+  r = compare(png(a), png(a))
+  assert r['same'] and r['identical'] and r['diff'] is None
+
+  # Different bytes, same pixels
+  r = compare(png(a), png(a, compress_level=0))
+  assert r['same'] and r['identical'] and r['diff'] is None
+
+  r = compare(png(a), png(b))
+  assert not r['same'] and not r['identical']
+  assert r['ratio'] == 1/200 and r['max'] == 3
+  assert r['diff'].shape == (20, 10, 3) and r['diff'][0, 0, 1] == 3
+
+  assert compare(png(a), png(b), tol=3)['same']
+  assert compare(png(a), png(b), max_ratio=0.01)['same']
+
+  r = compare(png(a), png(a[0:10]))
+  assert not r['same'] and r['ratio'] == 1.0
+
+
+def test_imgcheck():
+
+  a = np.zeros((20, 10, 3), dtype=np.uint8)
+  b = a.copy()
+  b[5, 5] = 255
+
+  outdir = tempfile.mkdtemp()
+  ref_file = os.path.join(outdir, 'a.ref.png')
+  assert imgcheck(ref_file, png(a)) is False  # Reference written
+  assert imgcheck(ref_file, png(a)) is True
+  # Artifacts are written only on failure
+  assert sorted(os.listdir(outdir)) == ['a.ref.png']
+
+  assert imgcheck(ref_file, png(b)) is False
+  assert sorted(os.listdir(outdir)) == ['a.dif.png', 'a.now.png', 'a.ref.png']
+
+
+def test_imgcheck_tree():
+
+  a = np.zeros((20, 10, 3), dtype=np.uint8)
+  b = a.copy()
+  b[5, 5] = 255
+
+  ref_dir = tempfile.mkdtemp()
+  now_dir = tempfile.mkdtemp()
+  os.makedirs(os.path.join(ref_dir, 'sub'))
+  os.makedirs(os.path.join(now_dir, 'sub'))
+  for name, now in [('a.png', a), ('b.png', b), (os.path.join('sub', 'c.png'), a)]:
+    with open(os.path.join(ref_dir, name), 'wb') as f:
+      f.write(png(a))
+    with open(os.path.join(now_dir, name), 'wb') as f:
+      f.write(png(now))
+  with open(os.path.join(ref_dir, 'd.png'), 'wb') as f:
+    f.write(png(a))
+
+  for workers in [1, 2]:
+    report = imgcheck_tree(ref_dir, now_dir, workers=workers)
+    assert [os.path.basename(r['ref']) for r in report['pass']] == ['a.png', 'c.png']
+    assert [os.path.basename(r['ref']) for r in report['fail']] == ['b.png']
+    assert [os.path.basename(r['ref']) for r in report['missing']] == ['d.png']
+    assert report['fail'][0]['diff'] == os.path.join(now_dir, 'b.dif.png')
+    assert os.path.exists(report['fail'][0]['diff'])
+
+  report = imgcheck_tree(ref_dir, now_dir, max_ratio=0.01)
+  assert len(report['pass']) == 3 and len(report['fail']) == 0
+
+
+if __name__ == "__main__":
+  test_compare()
+  test_imgcheck()
+  test_imgcheck_tree()
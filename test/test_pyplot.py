@@ -0,0 +1,67 @@
+import sys
+import subprocess
+
+code = """
+import sys
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from hapiplot import hapiplot
+
+def data_meta(kind):
+  # For the string parameter, datetick() reduces the tick label font size,
+  # which uses matplotlib.pyplot.
+  n = 30
+  if kind == 'string':
+    param = {'name': 'status', 'type': 'string', 'units': None, 'length': 3}
+    data = np.zeros(n, dtype=[('Time', 'S20'), ('status', 'S3')])
+    data['status'] = np.array([b'abc', b'def', b'xyz'])[np.arange(n) % 3]
+  else:
+    param = {'name': 'scalar', 'type': 'double', 'units': 'nT', 'fill': None}
+    data = np.zeros(n, dtype=[('Time', 'S20'), ('scalar', '<f8')])
+    data['scalar'] = np.sin(np.arange(n)/10.)
+  data['Time'] = ['1970-01-01T00:00:%02dZ' % i for i in range(n)]
+  meta = {
+          'x_server': 'http://localhost/hapi',
+          'x_dataset': 'dataset1',
+          'x_time.min': '1970-01-01T00:00:00Z',
+          'x_time.max': '1970-01-01T00:01:00Z',
+          'parameters': [
+            {'name': 'Time', 'type': 'isotime', 'units': 'UTC', 'length': 20},
+            param
+          ]
+  }
+  return data, meta
+
+popts = {'returnimage': True, 'useimagecache': False}
+
+# Importing hapiplot() does not import pyplot or pandas.
+assert 'matplotlib.pyplot' not in sys.modules and 'pandas' not in sys.modules
+
+# pyplot is imported before datetick() is first called.
+data, meta = data_meta('string')
+meta = hapiplot(data, meta, **popts)
+image = meta['parameters'][1]['hapiplot']['image']
+assert image is not None
+assert 'matplotlib.pyplot' in sys.modules
+
+# pyplot and the backend still work after returnimage=True plots.
+assert matplotlib.get_backend().lower() == 'agg'
+from matplotlib import pyplot as plt
+assert plt is sys.modules['matplotlib.pyplot']
+plt.close(plt.figure())
+
+# Same image as when pyplot was imported before the plot.
+data, meta = data_meta('string')
+meta = hapiplot(data, meta, **popts)
+assert meta['parameters'][1]['hapiplot']['image'] == image
+"""
+
+
+def test_returnimage_pyplot():
+  # Plots with returnimage=True work when pyplot was not imported before
+  subprocess.check_call([sys.executable, '-c', code])
+
+
+if __name__ == "__main__":
+  test_returnimage_pyplot()
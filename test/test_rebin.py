@@ -0,0 +1,59 @@
+import datetime
+import numpy as np
+
+from hapiplot.plot.heatmap import rebin
+
+
+def test_rebin():
+
+  rng = np.random.default_rng(0)
+  M = 10000
+  n = 100
+  edges = np.arange(M + 1, dtype=np.float64)
+  z = rng.normal(size=(4, M))
+
+  e, zr, g = rebin(edges, z, n, 1)
+  assert zr.shape[0] == 4
+  assert zr.shape[1] <= n
+  assert e.size == zr.shape[1] + 1
+  assert e[0] == edges[0] and e[-1] == edges[-1]
+  assert np.allclose(zr[:, 0], z[:, 0:M//n].mean(axis=1))
+
+  # Rebinning along rows
+  e, zr, g = rebin(edges, z.T, n, 0, method='max')
+  assert zr.shape == (n, 4)
+  assert np.array_equal(zr[0, :], z[:, 0:M//n].max(axis=1))
+
+  # nan* methods ignore NaNs; others propagate them
+  z[0, 0] = np.nan
+  e, zr, g = rebin(edges, z, n, 1, method='nanmean')
+  assert not np.isnan(zr[0, 0])
+  e, zr, g = rebin(edges, z, n, 1, method='mean')
+  assert np.isnan(zr[0, 0])
+
+  # A combined cell is a gap only if all of its cells are gaps
+  gaps = np.arange(0, 2*M//n, dtype=np.int32)
+  gaps = np.append(gaps, 5*M//n)
+  e, zr, g = rebin(edges, z, n, 1, gaps=gaps)
+  assert np.array_equal(g, [0, 1])
+
+  # Unchanged if there are already few enough cells
+  e, zr, g = rebin(edges[0:n+1], z[:, 0:n], n, 1)
+  assert zr is not None and zr.shape == (4, n)
+
+  # Datetime edges
+  t0 = datetime.datetime(2000, 1, 1)
+  edges = np.array([t0 + datetime.timedelta(seconds=i) for i in range(M + 1)])
+  e, zr, g = rebin(edges, z, n, 1)
+  assert zr.shape[1] <= n
+  assert e[0] == edges[0] and e[-1] == edges[-1]
+
+  try:
+    rebin(edges, z, n, 1, method='median')
+    assert False, 'Expected ValueError'
+  except ValueError:
+    pass
+
+
+if __name__ == "__main__":
+  test_rebin()
@@ -0,0 +1,69 @@
+import numpy as np
+
+from hapiplot import hapiplot
+from hapiplot.testing import generate
+
+opts = {'returnimage': True, 'useimagecache': False}
+
+
+def test_rgba():
+
+  for kind in ['scalar', 'spectra']:
+    data, meta = generate(kind, 100)
+    meta = hapiplot(data, meta, returnformat='rgba', **opts)
+    hp = meta['parameters'][1]['hapiplot']
+    assert isinstance(hp['image'], memoryview)
+    assert hp['image'].shape == hp['imageshape'] and hp['imageshape'][2] == 4
+    # Figure size in pixels
+    w, h = hp['figure'].canvas.get_width_height()
+    assert hp['imageshape'] == (h, w, 4)
+    img = np.asarray(hp['image'])
+    assert img.dtype == np.uint8 and np.unique(img).size > 2
+
+    data, meta = generate(kind, 100)
+    meta = hapiplot(data, meta, returnformat='array', **opts)
+    hp = meta['parameters'][1]['hapiplot']
+    assert isinstance(hp['image'], np.ndarray) and hp['image'].shape == hp['imageshape']
+    # Not a copy
+    assert np.shares_memory(hp['image'], np.asarray(hp['figure'].canvas.buffer_rgba()))
+    assert np.array_equal(hp['image'], img)
+
+
+def test_rgba_copies():
+
+  data, meta = generate('scalar', 100)
+  meta = hapiplot(data, meta, returnformat='array', figurepool=True, **opts)
+  hp = meta['parameters'][1]['hapiplot']
+  assert 'figure' not in hp and isinstance(hp['image'], np.ndarray)
+  image = hp['image'].copy()
+
+  # Figure from pool is drawn again; first image unchanged.
+  data, meta = generate('scalar', 100, seed=1)
+  hapiplot(data, meta, returnformat='array', figurepool=True, **opts)
+  assert np.array_equal(hp['image'], image)
+
+  # One job per component
+  data, meta = generate('matrix', 100)
+  meta = hapiplot(data, meta, returnformat='rgba', workers=2, **opts)
+  components = meta['parameters'][1]['hapiplot']['components']
+  assert len(components) > 1
+  assert all(isinstance(hp['image'], memoryview) for hp in components)
+
+
+def test_returnformat():
+
+  data, meta = generate('scalar', 100)
+  meta = hapiplot(data, meta, returnformat='svg', **opts)
+  assert b'<svg' in meta['parameters'][1]['hapiplot']['image'][0:1000]
+
+  try:
+    hapiplot(data, meta, returnformat='gif', **opts)
+    assert False
+  except ValueError:
+    pass
+
+
+if __name__ == "__main__":
+  test_rgba()
+  test_rgba_copies()
+  test_returnformat()
@@ -0,0 +1,115 @@
+import json
+import asyncio
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+
+from hapiplot.server import PlotServer
+from hapiplot.testing import HAPIServer
+
+start = '2000-01-01T00:00:00Z'
+stop = '2000-01-01T00:10:00Z'
+opts = {'cache': False, 'usecache': False}
+
+
+def get(url, headers={}):
+  request = urllib.request.Request(url, headers=headers)
+  try:
+    with urllib.request.urlopen(request) as res:
+      return res.status, res.headers, res.read()
+  except urllib.error.HTTPError as e:
+    return e.code, e.headers, e.read()
+
+
+def query(hapi, parameter='scalar', start=start, stop=stop, format='png'):
+  return '/plot?server=%s&id=synthetic/%s&parameters=%s&time.min=%s&time.max=%s&format=%s' \
+         % (hapi.url, parameter, parameter, start, stop, format)
+
+
+def test_server():
+
+  with HAPIServer(n=3600) as hapi:
+    with PlotServer(workers=2, cachedir=tempfile.mkdtemp(), **opts) as server:
+
+      status, headers, body = get(server.url + query(hapi))
+      assert status == 200 and headers['Content-Type'] == 'image/png'
+      assert body[0:4] == b'\x89PNG'
+      etag = headers['ETag']
+      assert etag.startswith('"') and etag.endswith('"')
+
+      status, headers, body304 = get(server.url + query(hapi), {'If-None-Match': etag})
+      assert status == 304 and body304 == b'' and headers['ETag'] == etag
+
+      # Second request is answered from image cache
+      status, headers, body2 = get(server.url + query(hapi))
+      assert status == 200 and headers['ETag'] == etag and body2 == body
+      assert len([r for r in hapi.requests if '/data?' in r]) == 1
+
+      status, headers, body = get(server.url + query(hapi, format='svg'))
+      assert status == 200 and headers['Content-Type'] == 'image/svg+xml'
+      assert headers['ETag'] != etag
+
+      assert get(server.url + query(hapi, format='gif'))[0] == 400
+      assert get(server.url + '/plot?server=' + hapi.url)[0] == 400
+      assert get(server.url + '/')[0] == 404
+      status, headers, body = get(server.url + query(hapi, parameter='unknown'))
+      assert status == 500 and 'message' in json.loads(body)
+
+      assert server.stats['rendered'] == 2 and server.stats['cached'] == 1
+      assert server.stats['not_modified'] == 1 and server.stats['errors'] == 1
+
+
+def test_server_concurrency():
+
+  with HAPIServer(n=3600, delay=1) as hapi:
+    with PlotServer(workers=1, queue=0, cachedir=tempfile.mkdtemp(), **opts) as server:
+
+      results = []
+      def request(q):
+        results.append(get(server.url + q)[0])
+
+      # Identical requests are merged; a different one is rejected
+      threads = [threading.Thread(target=request, args=(query(hapi),)) for i in range(3)]
+      threads.append(threading.Thread(target=request,
+                                      args=(query(hapi, stop='2000-01-01T00:20:00Z'),)))
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+      assert sorted(results) == [200, 200, 200, 429]
+      assert server.stats['merged'] == 2 and server.stats['rejected'] == 1
+      assert len([r for r in hapi.requests if '/data?' in r]) == 1
+
+
+def test_server_wsgi_asgi():
+
+  with HAPIServer(n=3600) as hapi:
+    server = PlotServer(workers=1, cachedir=tempfile.mkdtemp(), **opts)
+    try:
+      path, q = query(hapi).split('?')
+
+      responses = []
+      environ = {'PATH_INFO': path, 'QUERY_STRING': q}
+      body = server.wsgi(environ, lambda status, headers: responses.append((status, dict(headers))))
+      assert responses[0][0] == '200 OK' and b''.join(body)[0:4] == b'\x89PNG'
+      etag = responses[0][1]['ETag']
+
+      messages = []
+      async def receive():
+        return {'type': 'http.request'}
+      async def send(message):
+        messages.append(message)
+      scope = {'type': 'http', 'path': path, 'query_string': q.encode(),
+               'headers': [(b'if-none-match', etag.encode())]}
+      asyncio.run(server.asgi(scope, receive, send))
+      assert messages[0]['status'] == 304 and messages[1]['body'] == b''
+    finally:
+      server.stop()
+
+
+if __name__ == "__main__":
+  test_server()
+  test_server_concurrency()
+  test_server_wsgi_asgi()
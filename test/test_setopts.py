@@ -0,0 +1,44 @@
+import pickle
+
+from hapiplot.plot.util import setopts, rcdigest, FrozenDict
+
+
+def _opts():
+  return {'backend': 'default', 'style': 'fast', 'rcParams': {'savefig.dpi': 144}}
+
+
+def test_setopts():
+
+  rc = {'lines.linewidth': 2}
+  opts1 = setopts(_opts(), {'rcParams': rc})
+  opts2 = setopts(_opts(), {'rcParams': rc})
+
+  # Resolved rcParams are memoized and can't be modified
+  assert opts1['rcParams'] is opts2['rcParams']
+  assert opts1['rcParams']['lines.linewidth'] == 2
+  assert opts1['rcParams']['savefig.dpi'] == 144
+  try:
+    opts1['rcParams']['lines.linewidth'] = 3
+    assert False, 'Expected TypeError'
+  except TypeError:
+    pass
+
+  opts3 = setopts(_opts(), {'rcParams': {'lines.linewidth': 3}})
+  assert opts3['rcParams']['lines.linewidth'] == 3
+
+  # backend is set by the backend option and not by rcParams
+  assert 'backend' not in opts1['rcParams']
+  rcp = FrozenDict(opts1['rcParams'])
+  assert pickle.loads(pickle.dumps(rcp)) == rcp
+
+  # Digest used in image file names
+  assert rcdigest({}) == '99914b932bd37a50b983c5e7c90ae93b'
+  assert rcdigest({'a': 1, 'b': 2}) == rcdigest({'b': 2, 'a': 1})
+  assert rcdigest({'a': 1}) != rcdigest({'a': 2})
+  rc = {'a': object()}
+  assert rcdigest(rc) == rcdigest({'a': None})
+  assert 'a' in rc and rc['a'] is not None
+
+
+if __name__ == "__main__":
+  test_setopts()
@@ -0,0 +1,84 @@
+import tempfile
+
+from hapiplot import hapiplot
+from hapiplot.plot.util import Stages
+from hapiplot.testing import generate, HAPIServer
+
+
+def test_stages():
+
+  stats = {}
+  stages = Stages(stats)
+  stages.lap('a')
+  stages.reset()
+  stages.lap('b')
+  stages.lap('a')
+  assert list(stats['timing'].keys()) == ['a', 'b']
+  assert all(t >= 0 for t in stats['timing'].values())
+
+  stages = Stages(None)
+  stages.lap('a')
+  stages.reset()
+
+
+def test_timing():
+
+  cachedir = tempfile.mkdtemp()
+  opts = {'returnimage': True, 'cachedir': cachedir, 'saveimage': True}
+
+  for kind, stage in [('scalar', 'decimate'), ('spectra', 'rebin')]:
+
+    data, meta = generate(kind, 1000)
+    meta = hapiplot(data, meta, **opts)
+    assert 'stats' not in meta['parameters'][1]['hapiplot']
+
+    data, meta = generate(kind, 1000)
+    meta = hapiplot(data, meta, timing=True, useimagecache=False, **opts)
+    hp = meta['parameters'][1]['hapiplot']
+    stats = hp['stats']
+    for key in ['time', 'fill', 'labels', 'plot', stage, 'draw',
+                'datetick', 'encode', 'save', 'total']:
+      assert stats['timing'][key] >= 0, key
+    assert stats['records'] == 1000
+    assert stats['nbytes'] == data[kind].nbytes
+    assert stats['points_plotted'] > 0
+    assert stats['image_bytes'] == len(hp['image'])
+    assert stats['imagecache'] is None
+
+    data, meta = generate(kind, 1000)
+    meta = hapiplot(data, meta, timing=True, **opts)
+    stats = meta['parameters'][1]['hapiplot']['stats']
+    assert stats['imagecache'] == 'hit'
+    assert 'plot' not in stats['timing']
+    assert stats['image_bytes'] == len(meta['parameters'][1]['hapiplot']['image'])
+
+
+def test_timing_cached():
+  # Keys of stats are the same when images are returned from the image
+  # cache without calling hapi() and when images are created.
+
+  cachedir = tempfile.mkdtemp()
+  opts = {'returnimage': True, 'saveimage': True, 'cachedir': cachedir, 'timing': True,
+          'cache': False, 'usecache': False}
+  start = '2000-01-01T00:00:00Z'
+  stop = '2000-01-01T01:00:00Z'
+
+  with HAPIServer(n=3600, kinds=['scalar']) as server:
+    args = (server.url, 'synthetic/scalar', 'scalar', start, stop)
+    _, meta = hapiplot(*args, **opts)
+    miss = meta['parameters'][1]['hapiplot']['stats']
+    nrequests = len(server.requests)
+    _, meta = hapiplot(*args, **opts)
+    hit = meta['parameters'][1]['hapiplot']['stats']
+    assert len(server.requests) == nrequests
+
+  assert miss['imagecache'] == 'miss' and hit['imagecache'] == 'hit'
+  assert set(hit.keys()) == set(miss.keys())
+  assert hit['records'] is None and hit['nbytes'] is None
+  assert hit['image_bytes'] == miss['image_bytes']
+
+
+if __name__ == "__main__":
+  test_stages()
+  test_timing()
+  test_timing_cached()
@@ -0,0 +1,127 @@
+import os
+import time
+import tempfile
+
+import numpy as np
+
+from hapiclient import hapi
+
+from hapiplot import hapiplot
+from hapiplot.testing import generate, KINDS, HAPIServer
+
+start = '2000-01-01T00:10:00Z'
+stop = '2000-01-01T00:20:00Z'
+opts = {'cache': False, 'usecache': False, 'logging': False}
+
+
+def test_generate():
+
+  for kind in KINDS:
+    data, meta = generate(kind, 100)
+    assert data.dtype.names == ('Time', kind) and data.shape == (100,)
+    assert [p['name'] for p in meta['parameters']] == ['Time', kind]
+    assert meta['x_dataset'] == 'synthetic/' + kind
+    size = tuple(meta['parameters'][1].get('size', ()))
+    assert data[kind].shape == (100,) + size
+
+    # Deterministic
+    assert generate(kind, 100)[0].tobytes() == data.tobytes()
+
+    assert generate(kind, 0)[0].shape == (0,)
+
+  data, meta = generate('fill', 1000)
+  nfill = np.count_nonzero(data['fill'] == float(meta['parameters'][1]['fill']))
+  assert 200 < nfill < 800
+
+  data, meta = generate('irregular', 1000)
+  dt = np.diff(data['Time'].astype('U23').astype('datetime64[ms]'))
+  assert np.unique(dt).size > 1 and dt.min() > np.timedelta64(0)
+
+  # One parameter per kind
+  data, meta = generate('scalar,vector', 100)
+  assert [p['name'] for p in meta['parameters']] == ['Time', 'scalar', 'vector']
+  assert data['scalar'].tobytes() == generate('scalar', 100)[0]['scalar'].tobytes()
+
+  try:
+    generate('x')
+    assert False
+  except ValueError:
+    pass
+
+
+def test_hapiplot():
+  # All kinds can be plotted
+
+  for kind in KINDS:
+    data, meta = generate(kind, 50)
+    meta = hapiplot(data, meta, returnimage=True, useimagecache=False)
+    assert meta['parameters'][1]['hapiplot']['image'][1:4] == b'PNG'
+
+
+def test_hapiserver():
+
+  with HAPIServer(n=3600) as server:
+    for format in ['binary', 'csv']:
+      for kind in KINDS:
+        data, meta = hapi(server.url, 'synthetic/' + kind, kind, start, stop, format=format, **opts)
+        ref, _ = generate(kind, 3600)
+        Time = ref['Time'].astype('U23').astype('datetime64[ms]')
+        ref = ref[(Time >= np.datetime64(start[0:-1])) & (Time < np.datetime64(stop[0:-1]))]
+        assert data.shape == ref.shape and meta['parameters'][1]['name'] == kind
+        if ref[kind].dtype.kind == 'f':
+          # hapiclient's CSV parser may differ in last digit.
+          assert np.allclose(data[kind], ref[kind], rtol=1e-14, atol=1e-14)
+        else:
+          assert np.all(data[kind].astype(ref[kind].dtype) == ref[kind])
+
+    # Five-argument form of hapiplot()
+    data, meta = hapiplot(server.url, 'synthetic/scalar', 'scalar', start, stop,
+                          returnimage=True, useimagecache=False, **opts)
+    assert data.shape == (600,)
+    assert meta['parameters'][1]['hapiplot']['image'][1:4] == b'PNG'
+
+    # Unknown dataset
+    try:
+      hapi(server.url, 'x', 'x', start, stop, **opts)
+      assert False
+    except Exception:
+      pass
+
+  # CSV only
+  with HAPIServer(n=3600, formats=['csv']) as server:
+    data, meta = hapi(server.url, 'synthetic/vector', 'vector', start, stop, **opts)
+    assert data.shape == (600,) and 'format=binary' not in server.requests[-1]
+
+
+def test_hapiserver_record():
+
+  recordings = tempfile.mkdtemp()
+  args = ('synthetic/spectra', 'spectra', start, stop)
+
+  with HAPIServer(n=3600) as upstream:
+    with HAPIServer(kinds=[], recordings=recordings, upstream=upstream.url) as server:
+      data, meta = hapi(server.url, *args, **opts)
+    assert len(upstream.requests) == len(server.requests)
+
+  # Replay without upstream
+  with HAPIServer(kinds=[], recordings=recordings) as server:
+    data2, meta2 = hapi(server.url, *args, **opts)
+  assert data2.tobytes() == data.tobytes()
+  assert len(os.listdir(recordings)) == 2*len(server.requests)
+
+
+def test_hapiserver_throttle():
+
+  with HAPIServer(n=3600, delay=0.1, bandwidth=1e6) as server:
+    t = time.time()
+    data, meta = hapi(server.url, 'synthetic/spectra', 'spectra', start, stop, **opts)
+    # Four requests; data response is 600*(24 + 32*8) bytes
+    assert time.time() - t > 0.4 + 0.15
+
+
+if __name__ == "__main__":
+  test_generate()
+  test_hapiplot()
+  test_hapiserver()
+  test_hapiserver_record()
+  test_hapiserver_throttle()
@@ -0,0 +1,108 @@
+import datetime
+
+import numpy as np
+
+from hapiplot.times import hapitime2datetime64, datetime64, isoformat
+from hapiplot.times import time_cadence, time_edges
+
+
+def test_hapitime2datetime64():
+
+  expected = np.array(['1970-01-01T00:00:01.5', '1970-02-01'], dtype='datetime64[us]')
+
+  Time = np.array([b'1970-01-01T00:00:01.500Z', b'1970-02-01T00:00:00.000Z'])
+  t = hapitime2datetime64(Time)
+  assert t.dtype == np.dtype('datetime64[us]') and np.all(t == expected)
+
+  # str, no trailing Z, and truncated times
+  assert np.all(hapitime2datetime64(Time.astype('U')) == expected)
+  assert np.all(hapitime2datetime64(np.array(['1970-01-01T00:00:01.5', '1970-02-01T00'])) == expected)
+
+  # Day-of-year times are parsed by hapiclient
+  Time = np.array([b'1970-001T00:00:01.500Z', b'1970-032T00:00:00.000Z'])
+  assert np.all(hapitime2datetime64(Time) == expected)
+
+  # Fills often use year 9999
+  assert hapitime2datetime64(np.array(['9999-12-31T00:00:00Z']))[0] == np.datetime64('9999-12-31')
+
+  assert hapitime2datetime64(np.array([], dtype='S20')).size == 0
+
+
+def test_datetime64():
+
+  utc = datetime.timezone.utc
+  t = [datetime.datetime(1970, 1, 1, tzinfo=utc), datetime.datetime(1970, 1, 2, tzinfo=utc)]
+  y = np.ma.masked_array(t, mask=[False, True])
+  y64 = datetime64(y)
+  assert y64.dtype == np.dtype('datetime64[us]')
+  assert y64[0] == np.datetime64('1970-01-01') and np.isnat(y64[1])
+
+  # Naive datetimes and datetime64
+  assert datetime64(np.array([datetime.datetime(1970, 1, 1)]))[0] == np.datetime64('1970-01-01')
+  t = np.array(['1970-01-01', '1970-01-02'], dtype='datetime64[ns]')
+  y64 = datetime64(np.ma.masked_array(t, mask=[True, False]))
+  assert np.isnat(y64[0]) and y64[1] == t[1] and not np.isnat(t[0])
+
+
+def test_isoformat():
+
+  assert isoformat(np.datetime64('1970-01-01T00:00:00.5')) == '1970-01-01T00:00:00.500000Z'
+  t = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+  assert isoformat(t) == '1970-01-01T00:00:00Z'
+  # Naive datetimes are formatted without Z, as heatmap() did before
+  assert isoformat(t.replace(tzinfo=None)) == '1970-01-01T00:00:00'
+
+
+def test_time_cadence():
+
+  t0 = np.datetime64('1970-01-01T00:00:00', 'us')
+  s = np.timedelta64(1000, 'ms')
+  Time = t0 + s*np.arange(5)
+  assert time_cadence(Time) == s
+
+  # Jitter within tolerance
+  jittered = Time + np.array([0, 500, 0, -500, 0], dtype='timedelta64[us]')
+  assert time_cadence(jittered) == s
+  assert time_cadence(jittered, rtol=1e-4) is None
+
+  assert time_cadence(t0 + s*np.array([0, 1, 3])) is None
+  assert time_cadence(Time[0:1]) is None
+  assert time_cadence(np.array([t0, t0])) is None
+
+
+def test_time_edges():
+
+  t0 = np.datetime64('1970-01-01T00:00:00', 'us')
+  s = np.timedelta64(1000, 'ms')
+  Time = t0 + s*np.arange(3)
+
+  edges, cadence = time_edges(Time)
+  assert cadence == s
+  assert np.all(edges == t0 + s*np.array([-0.5, 0.5, 1.5, 2.5]))
+  assert np.all(time_edges(Time, 'center')[0] == edges)
+  assert np.all(time_edges(Time, 'begin')[0] == t0 + s*np.arange(4))
+  assert np.all(time_edges(Time, 'END')[0] == t0 + s*np.arange(-1, 3))
+
+  # Given cadence
+  edges, cadence = time_edges(Time, 'begin', cadence=2*s)
+  assert cadence == 2*s and np.all(edges == t0 + s*np.array([0, 1, 2, 4]))
+
+  # Non-uniform
+  Time = t0 + s*np.array([0, 1, 3, 7])
+  edges, cadence = time_edges(Time)
+  assert cadence is None
+  assert np.all(edges == t0 + s*np.array([-0.5, 0.5, 2, 5, 9]))
+  assert np.all(time_edges(Time, 'begin')[0] == t0 + s*np.array([0, 1, 3, 7, 11]))
+  assert np.all(time_edges(Time, 'end')[0] == t0 + s*np.array([-1, 0, 1, 3, 7]))
+
+  # Single time
+  edges, cadence = time_edges(Time[0:1])
+  assert cadence is None and np.all(edges == t0 + s*np.array([-1, 1]))
+
+
+if __name__ == "__main__":
+  test_hapitime2datetime64()
+  test_datetime64()
+  test_isoformat()
+  test_time_cadence()
+  test_time_edges()
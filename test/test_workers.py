@@ -0,0 +1,32 @@
+from hapiplot import hapiplot
+from hapiplot.testing import generate
+
+
+def test_workers():
+  # Images should not depend on the number or type of workers.
+
+  popts = {'useimagecache': False, 'returnimage': True}
+
+  data, meta = generate('scalar,vector', 50)
+  meta = hapiplot(data, meta, **popts)
+  imgs = [meta['parameters'][i]['hapiplot']['image'] for i in [1, 2]]
+
+  for workertype in ['thread', 'process']:
+    data, meta = generate('scalar,vector', 50)
+    meta = hapiplot(data, meta, workers=2, workertype=workertype, **popts)
+    for k, i in enumerate([1, 2]):
+      assert meta['parameters'][i]['hapiplot']['image'] == imgs[k], \
+            'Image for %s differs when workertype=%s' % (meta['parameters'][i]['name'], workertype)
+      # Figures are not sent back from worker processes.
+      hp = meta['parameters'][i]['hapiplot']
+      assert ('figure' in hp) == (workertype == 'thread')
+      assert 'colorbar' not in hp
+
+  # Default is a process pool
+  data, meta = generate('scalar,vector', 50)
+  meta = hapiplot(data, meta, workers=2, **popts)
+  assert 'figure' not in meta['parameters'][1]['hapiplot']
+
+
+if __name__ == "__main__":
+  test_workers()